@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional
+
+
+def get_corpus_version_path() -> str:
+    """Location of the corpus version marker shared by the ingestion script and the chat app."""
+    return os.getenv("CORPUS_VERSION_FILE") or f"{os.getenv('DATABASE_LOCATION') or 'chroma_db'}.version.json"
+
+
+def bump_corpus_version(path: Optional[str] = None) -> str:
+    """
+    Write a fresh corpus version marker and return the new version.
+
+    Called by the ingestion script whenever the collection is rebuilt or updated so that
+    every running chat process drops the answers it cached against the old corpus.
+    """
+    path = path or get_corpus_version_path()
+    version = uuid.uuid4().hex
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "updated_at": datetime.utcnow().isoformat() + "Z"}, f)
+    # Atomic on POSIX and Windows: readers never see a half-written marker
+    os.replace(tmp_path, path)
+    return version
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation so trivial variants share a key."""
+    text = re.sub(r"\s+", " ", question or "").strip().lower()
+    return text.rstrip("?!. ")
+
+
+def history_digest(messages: Iterable) -> str:
+    """Digest of chat messages (LangChain messages or role/content dicts), in order."""
+    digest = hashlib.sha256()
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role", ""), message.get("content", "")
+        else:
+            role, content = getattr(message, "type", ""), getattr(message, "content", "")
+        digest.update(json.dumps([role, content], ensure_ascii=False, default=str).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of agent answers.
+
+    Entries are keyed by the normalized question, a digest of the conversation so far, the
+    retrieval scope (chat group), the chat model and the corpus version, so a key is known before
+    anything is retrieved. The corpus version is re-read from disk (cheaply, by mtime) on every
+    lookup; when it changes all entries are dropped.
+    """
+
+    def __init__(self, max_entries: int = 512, version_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.version_path = version_path or get_corpus_version_path()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: str = ""
+        self._version_mtime: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def corpus_version(self) -> str:
+        try:
+            mtime = os.path.getmtime(self.version_path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime != self._version_mtime:
+                version = ""
+                if mtime is not None:
+                    try:
+                        with open(self.version_path, "r", encoding="utf-8") as f:
+                            version = json.load(f).get("version", "")
+                    except (OSError, ValueError):
+                        version = ""
+                if version != self._version:
+                    self._entries.clear()
+                self._version = version
+                self._version_mtime = mtime
+            return self._version
+
+    def make_key(self, question: str, model: str, history: Iterable = (), scope: Optional[str] = None) -> str:
+        """history holds the conversation's messages: a follow-up question only means the same thing after the same turns."""
+        payload = json.dumps(
+            [normalize_question(question), history_digest(history), scope or "", model or "", self.corpus_version()],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return answer
+
+    def put(self, key: str, answer: str) -> None:
+        with self._lock:
+            self._entries[key] = answer
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_answer_cache: Optional[AnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """
+    Process-wide cache shared by all sessions (ANSWER_CACHE_MAX_ENTRIES). Streamlit re-executes the page
+    script on every rerun, so a cache created there would start empty each time.
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = AnswerCache(max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "512")))
+        return _answer_cache
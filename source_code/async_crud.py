@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+from config.pg_async_conn_manager import async_fetch_data, async_fetch_rows, async_execute_query
+from config.id_generator import next_id
+from config.models import (
+    ChatGroupDtl,
+    ChatGroupDtlCreate,
+    ChatGroupDtlUpdate,
+    ChatHistory,
+    ChatHistoryCreate,
+    ChatHistoryUpdate,
+)
+from config.records import ChatGroupPage, ChatGroupRow, ChatHistoryPage, ChatHistoryRow
+from crud import (
+    SCHEMA,
+    GROUP_COLUMNS,
+    HISTORY_COLUMNS,
+    INSERT_CHAT_GROUP_SQL,
+    INSERT_CHAT_HISTORY_SQL,
+    HistoryCursor,
+    chat_group_update_query,
+    chat_groups_page_query,
+    chat_groups_page_result,
+    chat_history_page_query,
+    chat_history_page_result,
+    chat_history_update_query,
+    invalidate_group_cache,
+)
+
+# asyncio counterparts of the functions in crud.py, sharing its SQL, pydantic models and read records
+
+
+# -------------------- Chat Group DTL --------------------
+
+async def list_chat_groups(active_only: bool = False) -> List[ChatGroupRow]:
+    where_clause = "WHERE is_active = true" if active_only else ""
+    rows = await async_fetch_rows(
+        f"SELECT {GROUP_COLUMNS} FROM {SCHEMA}.chat_group_dtl {where_clause} ORDER BY id;"
+    )
+    return list(map(ChatGroupRow._make, rows))
+
+
+async def list_chat_groups_page(limit: int = 50, after: Optional[int] = None, before: Optional[int] = None,
+                                active_only: bool = False) -> ChatGroupPage:
+    sql, params = chat_groups_page_query(limit, after, before, active_only)
+    return chat_groups_page_result(await async_fetch_rows(sql, params), limit, after, before)
+
+
+async def get_chat_group(group_id: int) -> Optional[ChatGroupDtl]:
+    rows = await async_fetch_data(
+        f"SELECT {GROUP_COLUMNS} FROM {SCHEMA}.chat_group_dtl WHERE id = %s;",
+        (group_id,),
+    )
+    if not rows:
+        return None
+    return ChatGroupDtl(**rows[0])
+
+
+async def create_chat_group(payload: ChatGroupDtlCreate) -> int:
+    rows = await async_execute_query(
+        INSERT_CHAT_GROUP_SQL,
+        (
+            payload.id,
+            payload.user_id,
+            payload.group_name,
+            payload.group_desc,
+            payload.is_active,
+        ),
+    )
+    # keep the sync crud's group read cache coherent with async writes
+    invalidate_group_cache()
+    return rows
+
+
+async def update_chat_group(group_id: int, payload: ChatGroupDtlUpdate) -> int:
+    query = chat_group_update_query(group_id, payload)
+    if query is None:
+        return 0
+    rows = await async_execute_query(*query)
+    invalidate_group_cache()
+    return rows
+
+
+async def delete_chat_group(group_id: int) -> int:
+    rows = await async_execute_query(f"DELETE FROM {SCHEMA}.chat_group_dtl WHERE id = %s;", (group_id,))
+    invalidate_group_cache()
+    return rows
+
+
+# -------------------- Chat History --------------------
+
+async def list_chat_history(limit: int = 200) -> List[ChatHistoryRow]:
+    rows = await async_fetch_rows(
+        f"SELECT {HISTORY_COLUMNS} FROM {SCHEMA}.chat_history ORDER BY created_ts DESC LIMIT %s;",
+        (limit,),
+    )
+    return list(map(ChatHistoryRow._make, rows))
+
+
+async def list_chat_history_page(limit: int = 50, after: Optional[HistoryCursor] = None,
+                                 before: Optional[HistoryCursor] = None) -> ChatHistoryPage:
+    sql, params = chat_history_page_query(limit, after, before)
+    return chat_history_page_result(await async_fetch_rows(sql, params), limit, after, before)
+
+
+async def get_chat_history(record_id: int) -> Optional[ChatHistory]:
+    rows = await async_fetch_data(
+        f"SELECT {HISTORY_COLUMNS} FROM {SCHEMA}.chat_history WHERE id = %s;",
+        (record_id,),
+    )
+    if not rows:
+        return None
+    return ChatHistory(**rows[0])
+
+
+async def create_chat_history(payload: ChatHistoryCreate) -> int:
+    return await async_execute_query(
+        INSERT_CHAT_HISTORY_SQL,
+        (
+            payload.id if payload.id is not None else next_id(),
+            payload.user_id,
+            payload.user_inquiry,
+            payload.assistant_response,
+            payload.reference_id,
+            payload.chat_group_id,
+        ),
+    )
+
+
+async def update_chat_history(record_id: int, payload: ChatHistoryUpdate) -> int:
+    query = chat_history_update_query(record_id, payload)
+    if query is None:
+        return 0
+    return await async_execute_query(*query)
+
+
+async def delete_chat_history(record_id: int) -> int:
+    return await async_execute_query(f"DELETE FROM {SCHEMA}.chat_history WHERE id = %s;", (record_id,))
+
+
+# -------------------- Combined page loads --------------------
+
+async def load_history_page_with_groups(limit: int = 50, after: Optional[HistoryCursor] = None,
+                                        before: Optional[HistoryCursor] = None
+                                        ) -> Tuple[ChatHistoryPage, Dict[int, ChatGroupRow]]:
+    """The Chat History page needs a history page and the group names: fetch both concurrently."""
+    page, groups = await asyncio.gather(
+        list_chat_history_page(limit=limit, after=after, before=before),
+        list_chat_groups(),
+    )
+    return page, {g.id: g for g in groups}
@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config.id_generator import id_from_key
+from config.models import ChatHistoryCreate
+from crud import bulk_create_chat_history
+
+
+def default_history_path() -> str:
+    # Same resolution as the chat app's get_history_path()
+    return os.getenv("CHAT_HISTORY_FILE") or os.path.join("../../datasets", "chat_history.jsonl")
+
+
+def parse_ts(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def iter_lines(path: str, offset: int) -> Iterator[Tuple[int, int, dict]]:
+    """Stream (start_offset, end_offset, record) from a JSONL file, starting at a byte offset."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            start = f.tell()
+            raw = f.readline()
+            if not raw:
+                break
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if isinstance(obj, dict):
+                yield start, f.tell(), obj
+
+
+# bytes of the input hashed into its identity; the file is appended to, so size and mtime cannot identify it
+IDENTITY_BYTES = 1 << 20
+
+
+def input_identity(path: str, length: int) -> dict:
+    """Absolute path plus a hash of the input's first bytes (up to length), which appending does not change."""
+    with open(path, "rb") as f:
+        prefix = f.read(min(length, IDENTITY_BYTES))
+    return {"path": os.path.abspath(path), "prefix_length": len(prefix),
+            "prefix_sha256": hashlib.sha256(prefix).hexdigest()}
+
+
+def load_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def backfill(input_path: str, checkpoint_path: str, batch_size: int = 5000, page_size: int = 1000,
+             user_id: int = 1, pair_window: int = 10000, restart: bool = False) -> dict:
+    """
+    Load user/assistant exchanges from a chat_history.jsonl file into personal_chat.chat_history.
+
+    User and assistant records are paired by request_id. After every committed batch the
+    checkpoint stores the byte offset from which a re-run must resume: the oldest still-unpaired
+    user record, or the end of the last batch. It also stores how far the file had been read and which user
+    records were still unpaired, so the overlap re-read on resume only picks those up again and nothing is
+    counted twice. Row ids are derived from the timestamp and request_id and inserted with ON CONFLICT DO NOTHING.
+
+    Raises ValueError when the checkpoint was written for a different (or rewritten) input file.
+    """
+    state = {} if restart else load_checkpoint(checkpoint_path)
+    offset = int(state.get("offset", 0))
+    scanned_to = int(state.get("scanned_to", offset))
+    resume_pending = set(state.get("pending", []))
+    totals = {"inserted": int(state.get("inserted", 0)), "pairs": int(state.get("pairs", 0)),
+              "orphans": int(state.get("orphans", 0)), "skipped": int(state.get("skipped", 0))}
+    if offset:
+        saved = state.get("input_identity")
+        if (not saved or os.path.getsize(input_path) < scanned_to
+                or saved != input_identity(input_path, saved["prefix_length"])):
+            raise ValueError(f"Checkpoint {checkpoint_path} was not written for {input_path} as it is now "
+                             f"(different, truncated or rewritten file); pass --restart to load it from the top")
+        print(f"Resuming {input_path} from byte offset {offset}")
+
+    pending: Dict[str, Tuple[int, int, dict]] = {}  # request_id -> (line_no, start_offset, user record)
+    batch: List[ChatHistoryCreate] = []
+    started = time.perf_counter()
+    end_offset = offset
+    line_no = 0
+
+    def flush() -> None:
+        # bulk_create_chat_history raises when the batch was not committed, so the checkpoint
+        # below only ever moves past rows that are in the table
+        if batch:
+            totals["inserted"] += bulk_create_chat_history(batch, skip_existing=True, page_size=page_size)
+            totals["pairs"] += len(batch)
+            batch.clear()
+        resume_at = min([start for _n, start, _r in pending.values()] + [end_offset])
+        scanned = max(end_offset, scanned_to)
+        save_checkpoint(checkpoint_path, {"input": input_path, "input_identity": input_identity(input_path, scanned),
+                                          "offset": resume_at, "scanned_to": scanned,
+                                          "pending": list(pending),
+                                          "updated_at": datetime.now(timezone.utc).isoformat(), **totals})
+        rate = totals["pairs"] / max(time.perf_counter() - started, 1e-9)
+        print(f"{totals['pairs']} pairs processed, {totals['inserted']} inserted ({rate:,.0f} pairs/s)")
+
+    for start, end_offset, rec in iter_lines(input_path, offset):
+        line_no += 1
+        request_id = rec.get("request_id")
+        role = rec.get("role")
+        if start < scanned_to and not (role == "user" and request_id in resume_pending):
+            # read (and counted, paired or inserted) before the checkpoint
+            continue
+        if not request_id or role not in ("user", "assistant", "ai", "bot"):
+            totals["skipped"] += 1
+            continue
+        if role == "user":
+            pending[request_id] = (line_no, start, rec)
+        else:
+            user_entry = pending.pop(request_id, None)
+            if user_entry is None:
+                totals["orphans"] += 1
+                continue
+            created_ts = parse_ts(rec.get("ts")) or parse_ts(user_entry[2].get("ts")) or datetime.now(timezone.utc)
+            batch.append(ChatHistoryCreate(
+                # same layout as live ids, and stable per request_id so a re-run never duplicates a row
+                id=id_from_key(created_ts, request_id),
+                user_id=user_id,
+                user_inquiry=user_entry[2].get("content") or "",
+                assistant_response=rec.get("content") or "",
+                created_ts=created_ts,
+            ))
+        if len(batch) >= batch_size:
+            # user records that never got an answer would pin the resume offset forever
+            stale = [rid for rid, (n, _s, _r) in pending.items() if line_no - n > pair_window]
+            for rid in stale:
+                del pending[rid]
+            totals["orphans"] += len(stale)
+            flush()
+
+    # unpaired user records at the tail (e.g. the app is still answering) stay before the resume offset
+    flush()
+    return {**totals, "unpaired": len(pending)}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backfill personal_chat.chat_history from a chat_history.jsonl file (resumable)."
+    )
+    parser.add_argument("--input", default=default_history_path(), help="JSONL history file to load")
+    parser.add_argument("--checkpoint", default=None,
+                        help="Checkpoint file (default: <input>.backfill.json)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Pairs per committed transaction")
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows per multi-row INSERT statement")
+    parser.add_argument("--user-id", type=int, default=1, help="user_id stored on the loaded rows")
+    parser.add_argument("--pair-window", type=int, default=10000,
+                        help="Lines to wait for an assistant reply before a user record counts as an orphan")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the top")
+    args = parser.parse_args()
+
+    checkpoint = args.checkpoint or f"{args.input}.backfill.json"
+    try:
+        totals = backfill(args.input, checkpoint, batch_size=args.batch_size, page_size=args.page_size,
+                          user_id=args.user_id, pair_window=args.pair_window, restart=args.restart)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Done: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import bisect
+import hashlib
+import os
+import re
+import time
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+PAGE_BREAK = "\f"  # read_pdf_from_local joins PDF pages with form feeds when keeping the text structure
+
+_BLOCK_SEPARATOR = re.compile(r"\n[ \t]*\n+|\f")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+_WHITESPACE = re.compile(r"\s+")
+_MARKDOWN_HEADING = re.compile(r"#{1,6}\s+\S")
+_NUMBERED_HEADING = re.compile(r"(?:\d+\.)+\d*\s+[A-Z]")  # "1. Terms", "2.3 Fees", "2.3.1 Scope"
+_NAMED_HEADING = re.compile(r"(?:article|section|chapter|part|schedule|exhibit|appendix)\s+[\dIVXLC]+\b", re.IGNORECASE)
+_HEADING_MAX_CHARS = 100
+
+
+class Chunk(NamedTuple):
+    text: str
+    start: int            # character offsets into the document text, end exclusive
+    end: int
+    page_start: int       # 1-based pages spanned by the chunk
+    page_end: int
+    section: Optional[str]  # nearest heading before the chunk's first character
+
+
+def chunk_id(source: str, index: int, text: str) -> str:
+    """Content-derived chunk id: re-ingesting an unchanged chunk upserts it in place instead of duplicating it."""
+    return hashlib.sha256(f"{source}\0{index}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+def is_heading(block: str) -> bool:
+    """A short single-line block that looks like a markdown, numbered, named (Section 4) or ALL CAPS heading."""
+    if len(block) > _HEADING_MAX_CHARS or "\n" in block or block.endswith((".", ",", ";")):
+        return False
+    if block.startswith("#"):
+        return _MARKDOWN_HEADING.match(block) is not None
+    if _NUMBERED_HEADING.match(block) or _NAMED_HEADING.match(block):
+        return True
+    return len(block) >= 3 and block.isupper()
+
+
+class StructuredChunker:
+    """
+    Splits text into chunks of at most chunk_size characters along its structure.
+
+    The text is cut into blocks at paragraph breaks (blank lines) and page breaks (form feeds) with a
+    regex scan; blocks are packed greedily into chunks, a heading always starts a new chunk, and a page
+    break ends the current chunk once it is at least half full. Blocks longer than chunk_size are split
+    at sentence ends, then at whitespace. Each chunk after the first repeats up to chunk_overlap
+    characters of its predecessor, starting at a word boundary. Chunks are spans of the input text, so
+    their character offsets, pages and section heading go into the metadata.
+    """
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def _blocks(self, text: str) -> List[Tuple[int, int, bool, bool]]:
+        """(start, end, is_heading, follows_page_break) for every non-blank block, long blocks pre-split."""
+        blocks = []
+        position = 0
+        page_break = False
+        for separator in _BLOCK_SEPARATOR.finditer(text):
+            self._add_block(text, position, separator.start(), page_break, blocks)
+            page_break = PAGE_BREAK in separator.group()
+            position = separator.end()
+        self._add_block(text, position, len(text), page_break, blocks)
+        return blocks
+
+    def _add_block(self, text: str, start: int, end: int, page_break: bool, blocks: list) -> None:
+        # trim surrounding whitespace without copying the block
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start == end:
+            return
+        if end - start <= self.chunk_size:
+            blocks.append((start, end, end - start <= _HEADING_MAX_CHARS and is_heading(text[start:end]), page_break))
+            return
+        # oversized paragraph: sentence pieces, then whitespace pieces for sentences that are still too long
+        piece_start = start
+        for boundary in _SENTENCE_END.finditer(text, start, end):
+            if boundary.start() - piece_start > self.chunk_size:
+                self._add_words(text, piece_start, boundary.start(), page_break, blocks)
+                page_break = False
+            else:
+                blocks.append((piece_start, boundary.start(), False, page_break))
+                page_break = False
+            piece_start = boundary.end()
+        if piece_start < end:
+            self._add_words(text, piece_start, end, page_break, blocks)
+
+    def _add_words(self, text: str, start: int, end: int, page_break: bool, blocks: list) -> None:
+        while end - start > self.chunk_size:
+            cut = text.rfind(" ", start + 1, start + self.chunk_size)
+            if cut <= start:
+                cut = start + self.chunk_size
+            blocks.append((start, cut, False, page_break))
+            page_break = False
+            start = cut
+            while start < end and text[start].isspace():
+                start += 1
+        if start < end:
+            blocks.append((start, end, False, page_break))
+
+    def _overlap_start(self, text: str, chunk_start: int, chunk_end: int) -> int:
+        """Where the overlap carried into the next chunk begins: the first word start within chunk_overlap of the end."""
+        if self.chunk_overlap <= 0:
+            return chunk_end
+        start = max(chunk_start, chunk_end - self.chunk_overlap)
+        if start > chunk_start and not text[start - 1].isspace():
+            match = _WHITESPACE.search(text, start, chunk_end)
+            if match is None:
+                return chunk_end
+            start = match.end()
+        return start
+
+    def split_text_with_offsets(self, text: str) -> List[Chunk]:
+        page_starts = [0] + [m.end() for m in re.finditer(PAGE_BREAK, text)]
+        headings: List[Tuple[int, str]] = []
+        spans: List[Tuple[int, int]] = []
+        chunk_start = chunk_end = own_start = -1  # own_start: where the chunk's content after the overlap begins
+        has_body = False  # a run of headings ("ARTICLE 1" / "1.1 Definitions") stays with the text below it
+
+        for start, end, heading, page_break in self._blocks(text):
+            if heading:
+                headings.append((start, text[start:end].lstrip("# ").strip()))
+            if chunk_start < 0:
+                chunk_start = own_start = start
+                chunk_end = end
+                has_body = not heading
+                continue
+            fits = end - chunk_start <= self.chunk_size
+            full_enough = chunk_end - own_start >= self.chunk_size // 2
+            if fits and not (heading and has_body) and not (page_break and full_enough):
+                chunk_end = end
+                has_body = has_body or not heading
+                continue
+            spans.append((chunk_start, chunk_end))
+            has_body = not heading
+            if heading or page_break:
+                # a new section or page starts clean, without overlap
+                chunk_start = start
+            else:
+                overlap_start = self._overlap_start(text, chunk_start, chunk_end)
+                chunk_start = overlap_start if end - overlap_start <= self.chunk_size else start
+            own_start = start
+            chunk_end = end
+        if chunk_start >= 0:
+            spans.append((chunk_start, chunk_end))
+
+        heading_starts = [h[0] for h in headings]
+        chunks = []
+        for start, end in spans:
+            h = bisect.bisect_right(heading_starts, start) - 1
+            chunks.append(Chunk(
+                text=text[start:end],
+                start=start,
+                end=end,
+                page_start=bisect.bisect_right(page_starts, start),
+                page_end=bisect.bisect_right(page_starts, end - 1),
+                section=headings[h][1] if h >= 0 else None,
+            ))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [c.text for c in self.split_text_with_offsets(text)]
+
+    def create_documents(self, texts: Sequence[str], metadatas: Optional[Sequence[dict]] = None) -> List[Document]:
+        """Drop-in for TextSplitter.create_documents: one Document per chunk, offsets added to the metadata."""
+        documents = []
+        for i, text in enumerate(texts):
+            base = metadatas[i] if metadatas else {}
+            for chunk in self.split_text_with_offsets(text):
+                metadata = {**base, "start_index": chunk.start, "end_index": chunk.end,
+                            "page_start": chunk.page_start, "page_end": chunk.page_end}
+                if chunk.section:
+                    metadata["section"] = chunk.section
+                documents.append(Document(page_content=chunk.text, metadata=metadata))
+        return documents
+
+
+# read_pdf_from_local keeps lines, paragraphs and page breaks by default, which only this chunker uses
+DEFAULT_CHUNKER = "structured"
+
+
+def get_chunker_name() -> str:
+    """CHUNKER, defaulting to DEFAULT_CHUNKER."""
+    return (os.getenv("CHUNKER") or DEFAULT_CHUNKER).strip().lower()
+
+
+def get_text_splitter(chunker: Optional[str] = None, chunk_size: Optional[int] = None,
+                      chunk_overlap: Optional[int] = None):
+    """The splitter selected by CHUNKER ("structured" or "recursive"), sized by CHUNK_SIZE / CHUNK_OVERLAP."""
+    chunker = (chunker or get_chunker_name()).strip().lower()
+    chunk_size = chunk_size or int(os.getenv("CHUNK_SIZE", "1000"))
+    chunk_overlap = chunk_overlap if chunk_overlap is not None else int(os.getenv("CHUNK_OVERLAP", "200"))
+    if chunker == "structured":
+        return StructuredChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    if chunker != "recursive":
+        raise ValueError(f"CHUNKER must be 'structured' or 'recursive', got {chunker!r}")
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=False,
+    )
+
+
+# Benchmark (run from source_code/ with: python chunking.py [corpus file]):
+# throughput and chunk shapes of the structured chunker vs RecursiveCharacterTextSplitter(1000, 200)
+if __name__ == "__main__":
+    import random
+    import sys
+
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    if len(sys.argv) > 1:
+        from local_docs_chunking_embedding_ingestion import load_dataset
+        documents = [item.get("raw_text") or item.get("content") or item.get("text") or "" for item in load_dataset(sys.argv[1])]
+    else:
+        rng = random.Random(7)
+        words = ("the company shall deliver shares to the investor upon closing of the financing round subject to "
+                 "customary conditions including board approval and the consent of the majority holders").split()
+
+        def paragraph() -> str:
+            sentences = [" ".join(rng.choices(words, k=rng.randint(8, 30))).capitalize() + "." for _ in range(rng.randint(1, 8))]
+            return " ".join(sentences)
+
+        def document(pages: int) -> str:
+            out = []
+            for page in range(pages):
+                blocks = []
+                for section in range(rng.randint(1, 3)):
+                    blocks.append(f"{page + 1}.{section + 1} {rng.choice(words).upper()} TERMS")
+                    blocks.extend(paragraph() for _ in range(rng.randint(2, 6)))
+                out.append("\n\n".join(blocks))
+            return PAGE_BREAK.join(out)
+
+        documents = [document(rng.randint(5, 40)) for _ in range(200)]
+
+    total_chars = sum(len(d) for d in documents)
+    flattened = [_WHITESPACE.sub(" ", d).strip() for d in documents]
+    candidates = [
+        ("recursive (flattened text, current)", RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200), flattened),
+        ("recursive (structured text)", RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200), documents),
+        ("structured", StructuredChunker(chunk_size=1000, chunk_overlap=200), documents),
+    ]
+    print(f"{len(documents)} documents, {total_chars / 1e6:.1f}M characters")
+    for label, splitter, texts in candidates:
+        started = time.perf_counter()
+        docs = splitter.create_documents(texts)
+        elapsed = time.perf_counter() - started
+        sizes = [len(d.page_content) for d in docs]
+        print(f"{label:<38}{total_chars / elapsed / 1e6:8.2f} M chars/s  {len(docs):7d} chunks  "
+              f"avg {sum(sizes) / len(sizes):6.0f}  max {max(sizes):5d}")
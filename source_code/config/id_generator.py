@@ -0,0 +1,257 @@
+import hashlib
+import os
+import select
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+# Snowflake layout of a 63-bit positive bigint:
+#   41 bits  milliseconds since EPOCH_MS (~69 years)
+#   10 bits  node id (0..1023): 0..959 leased to live processes, 960..1023 reserved for id_from_key
+#   12 bits  sequence within the millisecond (4096 ids/ms per node)
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+MAX_CLOCK_ROLLBACK_MS = 5000
+
+# the top 64 node ids never go to a process, so deterministic ids cannot collide with live ones
+KEYED_NODE_BITS = 6
+KEYED_NODE_BASE = MAX_NODE_ID + 1 - (1 << KEYED_NODE_BITS)
+MAX_LIVE_NODE_ID = KEYED_NODE_BASE - 1
+
+# node ids are leased with a session-level advisory lock (key LEASE_LOCK_CLASS, node id) held on a
+# dedicated connection: the lease lasts as long as the process's session and ends with it
+LEASE_LOCK_CLASS = 0x49444E44  # "IDND"
+LEASE_CHECK_SECONDS = float(os.getenv("ID_LEASE_CHECK_SECONDS", "30"))
+
+# connections inherited across fork: closing them in the child would end the parent's session (and lease)
+_inherited_leases = []
+
+
+class NodeLease:
+    """
+    Exclusive claim on one node id, backed by a Postgres advisory lock on its own connection.
+
+    A watcher thread fails the lease closed: the idle connection's socket turns readable as soon as the
+    server ends the session (termination, restart, dropped link), and pg_locks is re-checked every
+    LEASE_CHECK_SECONDS besides. Either way `held` goes False before another process can see the lock free
+    for long, and the generator stops issuing ids under this node id.
+    """
+
+    def __init__(self, preferred: Optional[int] = None):
+        try:
+            from config.pg_db_conn_manager import open_dedicated_connection
+        except ModuleNotFoundError:
+            from source_code.config.pg_db_conn_manager import open_dedicated_connection
+
+        self.pid = os.getpid()
+        self._conn = open_dedicated_connection()
+        self._conn.autocommit = True
+        try:
+            self.node_id = self._claim(preferred)
+        except BaseException:
+            self._conn.close()
+            raise
+        self.held = True
+        self._stopped = False
+        self._wake_r, self._wake_w = os.pipe()
+        threading.Thread(target=self._watch, name=f"id-node-lease-{self.node_id}", daemon=True).start()
+
+    def _try_lock(self, node_id: int) -> bool:
+        with self._conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s, %s);", (LEASE_LOCK_CLASS, node_id))
+            return bool(cur.fetchone()[0])
+
+    def _claim(self, preferred: Optional[int]) -> int:
+        if preferred is not None:
+            if not self._try_lock(preferred):
+                raise RuntimeError(f"ID_NODE_ID={preferred} is already leased by another process; "
+                                   f"give every process its own value or leave ID_NODE_ID unset")
+            return preferred
+        # start at a host/pid-dependent slot so concurrent starts rarely probe the same ids
+        digest = hashlib.blake2b(f"{socket.gethostname()}:{os.getpid()}".encode("utf-8"), digest_size=4).digest()
+        first = int.from_bytes(digest, "big") % (MAX_LIVE_NODE_ID + 1)
+        for offset in range(MAX_LIVE_NODE_ID + 1):
+            node_id = (first + offset) % (MAX_LIVE_NODE_ID + 1)
+            if self._try_lock(node_id):
+                return node_id
+        raise RuntimeError(f"All {MAX_LIVE_NODE_ID + 1} id node leases are taken")
+
+    def _lock_is_held(self) -> bool:
+        try:
+            with self._conn.cursor() as cur:
+                cur.execute(
+                    "SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid() "
+                    "AND classid = %s AND objid = %s AND objsubid = 2 AND granted;",
+                    (LEASE_LOCK_CLASS, self.node_id),
+                )
+                return cur.fetchone() is not None
+        except Exception as e:
+            print(f"[WARN] id node lease check failed: {e}")
+            return False
+
+    def _watch(self) -> None:
+        conn_fd = self._conn.fileno()
+        while True:
+            try:
+                readable, _, _ = select.select([conn_fd, self._wake_r], [], [], LEASE_CHECK_SECONDS)
+            except (OSError, ValueError):
+                readable = [conn_fd]
+            if self._stopped:
+                break
+            # nothing is ever sent on the idle session, so anything readable is the server ending it
+            if conn_fd in readable or not self._lock_is_held():
+                self.held = False
+                print(f"[WARN] id node lease {self.node_id} was lost; no ids are issued under it any more")
+                break
+
+    def release(self) -> None:
+        self.held = False
+        if os.getpid() != self.pid:
+            # the watcher thread did not survive the fork, and the descriptors are the parent's
+            _inherited_leases.append(self._conn)
+            return
+        if not self._stopped:
+            self._stopped = True
+            os.write(self._wake_w, b"x")
+            os.close(self._wake_w)
+            os.close(self._wake_r)
+        if not self._conn.closed:
+            self._conn.close()
+
+
+def configured_node_id() -> Optional[int]:
+    """ID_NODE_ID if set: the node id this process must lease (startup fails if another process holds it)."""
+    configured = os.getenv("ID_NODE_ID")
+    if not configured:
+        return None
+    node_id = int(configured)
+    if not 0 <= node_id <= MAX_LIVE_NODE_ID:
+        raise ValueError(f"ID_NODE_ID must be between 0 and {MAX_LIVE_NODE_ID}, got {node_id}")
+    return node_id
+
+
+class SnowflakeGenerator:
+    """
+    Thread-safe generator of time-ordered, unique 64-bit ids.
+
+    Without a fixed node_id, the node id is leased from Postgres on first use (see NodeLease), so no
+    two live processes share one. Once the lease is lost (e.g. the connection dropped), the next id waits
+    for a new one.
+    """
+
+    def __init__(self, node_id: Optional[int] = None, epoch_ms: int = EPOCH_MS):
+        self._fixed_node_id = node_id
+        self.epoch_ms = epoch_ms
+        self._lock = threading.Lock()
+        self._lease: Optional[NodeLease] = None
+        self.node_id: Optional[int] = node_id
+        self._pid = os.getpid()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _ensure_node(self) -> None:
+        if os.getpid() != self._pid:
+            # forked child: must not continue the parent's sequence under the parent's node id
+            self._pid = os.getpid()
+            self._last_ms = -1
+            self._sequence = 0
+            if self._lease is not None:
+                self._lease.release()
+                self._lease = None
+                self.node_id = None
+        if self._fixed_node_id is not None:
+            return
+        if self._lease is not None and not self._lease.held:
+            # fail closed: never issue another id under a node id whose lock may already be someone else's
+            self._lease.release()
+            self._lease = None
+            self.node_id = None
+        if self._lease is None:
+            self._lease = NodeLease(configured_node_id())
+            self.node_id = self._lease.node_id
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._ensure_node()
+            now = int(time.time() * 1000)
+            if now < self._last_ms:
+                # clock moved backwards (NTP adjustment): wait it out rather than risk duplicates
+                if self._last_ms - now > MAX_CLOCK_ROLLBACK_MS:
+                    raise RuntimeError(f"Clock moved backwards by {self._last_ms - now} ms; refusing to generate ids")
+                while now < self._last_ms:
+                    time.sleep((self._last_ms - now) / 1000)
+                    now = int(time.time() * 1000)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & MAX_SEQUENCE
+                if self._sequence == 0:
+                    # 4096 ids issued this millisecond: spin to the next one
+                    while now <= self._last_ms:
+                        now = int(time.time() * 1000)
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - self.epoch_ms) << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+
+_default_generator = SnowflakeGenerator()
+
+
+def next_id() -> int:
+    """Next id from the process-wide generator (leases a node id from Postgres on first use)."""
+    return _default_generator.next_id()
+
+
+def id_from_key(ts: datetime, key: str) -> int:
+    """
+    Deterministic id in the same layout for records loaded after the fact (e.g. backfills):
+    the timestamp bits come from ts and the rest from a hash of key within the reserved node ids
+    (KEYED_NODE_BASE and up), so re-loading the same record yields the same id, ids still sort by
+    time, and they never collide with ids from a leased node.
+    """
+    ms = int(ts.timestamp() * 1000) if ts.tzinfo else int(ts.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    low_bits = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=4).digest(), "big")
+    low_bits &= (1 << (KEYED_NODE_BITS + SEQUENCE_BITS)) - 1
+    return (max(ms - EPOCH_MS, 0) << (NODE_BITS + SEQUENCE_BITS)) | (KEYED_NODE_BASE << SEQUENCE_BITS) | low_bits
+
+
+def parse_id(value: int) -> Tuple[datetime, int, int]:
+    """(timestamp, node_id, sequence) encoded in an id."""
+    ms = (value >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS
+    node_id = (value >> SEQUENCE_BITS) & MAX_NODE_ID
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc), node_id, value & MAX_SEQUENCE
+
+
+# Benchmark
+if __name__ == "__main__":
+    count = 500_000
+    generator = SnowflakeGenerator(node_id=1)
+
+    started = time.perf_counter()
+    ids = [generator.next_id() for _ in range(count)]
+    elapsed = time.perf_counter() - started
+    assert len(set(ids)) == count and ids == sorted(ids)
+    print(f"1 thread : {count / elapsed:,.0f} ids/s")
+
+    threads_n = 4
+    results = [[] for _ in range(threads_n)]
+
+    def worker(out):
+        for _ in range(count // threads_n):
+            out.append(generator.next_id())
+
+    threads = [threading.Thread(target=worker, args=(results[i],)) for i in range(threads_n)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    merged = [i for r in results for i in r]
+    assert len(set(merged)) == len(merged)
+    print(f"{threads_n} threads: {len(merged) / elapsed:,.0f} ids/s (all unique)")
+    print(f"sample id {ids[-1]} -> {parse_id(ids[-1])}")
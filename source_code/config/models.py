@@ -45,12 +45,13 @@ class ChatHistory(BaseModel):
 
 
 class ChatHistoryCreate(BaseModel):
-    id: int
+    id: Optional[int] = None  # generated by config.id_generator when not given
     user_id: int = 1
     user_inquiry: str
     assistant_response: str
     reference_id: Optional[int] = None
     chat_group_id: Optional[int] = None
+    created_ts: Optional[datetime] = None  # bulk loads only; DB default when None
 
 
 class ChatHistoryUpdate(BaseModel):
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, TypeVar, Union
+
+try:
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:  # optional dependency: only needed by async callers
+    make_conninfo = None  # type: ignore
+    AsyncConnectionPool = None  # type: ignore
+
+from config.pg_db_conn_manager import (
+    DB_HOST,
+    DB_NAME,
+    DB_USER,
+    DB_PASSWORD,
+    DB_PORT,
+    DB_POOL_TIMEOUT,
+)
+
+T = TypeVar("T")
+
+# Sized on its own: every event loop gets a pool of this size on top of the sync pool's DB_POOL_MAX
+DB_ASYNC_POOL_MIN = int(os.getenv('DB_ASYNC_POOL_MIN', '0'))
+DB_ASYNC_POOL_MAX = int(os.getenv('DB_ASYNC_POOL_MAX', '4'))
+
+# One pool per event loop: async connections cannot be shared across loops
+_pools: Dict[asyncio.AbstractEventLoop, Tuple["AsyncConnectionPool", "asyncio.Task"]] = {}
+_pools_lock = threading.Lock()
+
+
+def async_db_available() -> bool:
+    return make_conninfo is not None and AsyncConnectionPool is not None
+
+
+def _require_psycopg() -> None:
+    if not async_db_available():
+        raise RuntimeError(
+            "psycopg and psycopg-pool are not installed. Please install dependencies (see requirements.txt)."
+        )
+
+
+async def get_async_pool() -> "AsyncConnectionPool":
+    """The async connection pool of the running event loop, opened on first use."""
+    _require_psycopg()
+    loop = asyncio.get_running_loop()
+    with _pools_lock:
+        entry = _pools.get(loop)
+        if entry is None:
+            pool = AsyncConnectionPool(
+                conninfo=make_conninfo(
+                    host=DB_HOST, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD, port=DB_PORT
+                ),
+                min_size=DB_ASYNC_POOL_MIN,
+                max_size=max(1, DB_ASYNC_POOL_MAX),
+                timeout=DB_POOL_TIMEOUT,
+                check=AsyncConnectionPool.check_connection,
+                open=False,
+            )
+            # concurrent first callers all wait for the same open() instead of racing it
+            entry = (pool, loop.create_task(pool.open()))
+            _pools[loop] = entry
+    pool, opening = entry
+    try:
+        await opening
+    except BaseException:
+        # a failed open() must not be cached: drop the entry so the next caller builds a fresh pool
+        with _pools_lock:
+            if _pools.get(loop) is entry:
+                del _pools[loop]
+        raise
+    return pool
+
+
+async def close_async_pool() -> None:
+    loop = asyncio.get_running_loop()
+    with _pools_lock:
+        entry = _pools.pop(loop, None)
+    if entry is not None:
+        await entry[0].close()
+
+
+async def async_fetch_data(query: str, params: tuple = None,
+                           as_dicts: bool = True) -> Union[List[Dict[str, Any]], List[List[Any]]]:
+    """Async counterpart of fetch_data: same arguments, same result shape, same error handling."""
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                rows = await cur.fetchall()
+                if as_dicts:
+                    columns = [col.name for col in cur.description]
+                    return [dict(zip(columns, row)) for row in rows]
+                return [list(row) for row in rows]
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        return []
+
+
+async def async_fetch_rows(query: str, params: tuple = None) -> List[tuple]:
+    """Async counterpart of fetch_rows: raw row tuples for positional mapping."""
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                return await cur.fetchall()
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        return []
+
+
+async def async_execute_query(query: str, params: tuple = None) -> int:
+    """Async counterpart of execute_query; the pool commits on a clean exit from the connection block."""
+    try:
+        pool = await get_async_pool()
+        async with pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(query, params)
+                return cur.rowcount
+    except Exception as e:
+        print(f"Error executing query: {e}")
+        return 0
+
+
+async def async_fetch_many(*queries: Tuple[str, Optional[tuple]]) -> List[List[Dict[str, Any]]]:
+    """Run several (query, params) fetches concurrently, each on its own pooled connection."""
+    return list(await asyncio.gather(*(async_fetch_data(query, params) for query, params in queries)))
+
+
+# -------------------- Sync bridge --------------------
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="pg-async-loop", daemon=True).start()
+        return _loop
+
+
+def run_async(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Run a coroutine from synchronous code (e.g. a Streamlit page) and wait for its result.
+    Everything runs on one long-lived background loop, so its pool is reused across calls.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result(timeout)
@@ -1,8 +1,20 @@
 import os
+import threading
+import time
+import uuid
+from collections import deque
 from contextlib import contextmanager
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, Union, Callable, Optional, Sequence, Iterator
 
 import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+try:
+    from stats import summarize
+except ModuleNotFoundError:
+    from source_code.stats import summarize
 
 # ❗ IMPORTANT: Replace these with your actual database credentials
 DB_HOST = os.getenv('DB_HOST', 'localhost')
@@ -11,29 +23,216 @@ DB_USER = os.getenv('DB_USER', 'postgres')
 DB_PASSWORD = os.getenv('DB_PASS', 'Sunny@CA')
 DB_PORT = os.getenv('DB_PORT', '5432')
 
+# Connection pool settings
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', '1'))
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # seconds to wait for a free connection
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv('DB_POOL_HEALTHCHECK_IDLE', '30'))  # ping connections idle longer
+DB_RETRY_ATTEMPTS = int(os.getenv('DB_RETRY_ATTEMPTS', '1'))  # read retries on a stale/broken connection
+
+
+class PoolTimeoutError(PoolError):
+    """No pooled connection became free within DB_POOL_TIMEOUT seconds."""
+
+
+class ConnectionPoolManager:
+    """
+    Thread-safe, lazily created pool of psycopg2 connections.
+
+    ThreadedConnectionPool raises as soon as it is exhausted; a semaphore in front of it makes
+    callers wait (up to timeout) for a free connection instead, and records how long they waited.
+    Connections idle for longer than healthcheck_idle seconds are pinged before being handed out.
+    """
+
+    def __init__(self, minconn: int, maxconn: int, timeout: float, healthcheck_idle: float, **connect_kwargs):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self._connect_kwargs = connect_kwargs
+        self._pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used: Dict[int, float] = {}  # id(conn) -> when it went back to the pool, for idle connections
+        self._stats_lock = threading.Lock()
+        self._in_use = 0
+        self._waits = deque(maxlen=1000)
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+
+    def _get_pool(self) -> ThreadedConnectionPool:
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, **self._connect_kwargs)
+        return self._pool
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        idle = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def acquire(self):
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self._timeouts += 1
+            raise PoolTimeoutError(f"No database connection available within {self.timeout:.0f}s")
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            discarded = 0
+            # replacements are checked too: after a server restart every idle connection is dead
+            while not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                pool.putconn(conn, close=True)
+                with self._stats_lock:
+                    self._discarded += 1
+                discarded += 1
+                if discarded > self.maxconn:
+                    raise psycopg2.OperationalError("No healthy database connection could be obtained")
+                conn = pool.getconn()
+            self._last_used.pop(id(conn), None)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._waits.append(time.perf_counter() - started)
+        return conn
+
+    def release(self, conn, discard: bool = False) -> None:
+        try:
+            if not conn.closed and not discard:
+                # Never hand out a connection with an open (or failed) transaction
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        discard = True
+            discard = discard or bool(conn.closed)
+            if discard:
+                with self._stats_lock:
+                    self._discarded += 1
+                self._last_used.pop(id(conn), None)
+            else:
+                with self._stats_lock:
+                    # ThreadedConnectionPool keeps at most minconn idle connections and closes the rest
+                    if len(self._last_used) < self.minconn:
+                        self._last_used[id(conn)] = time.monotonic()
+            self._get_pool().putconn(conn, close=discard)
+        finally:
+            with self._stats_lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close_all(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._last_used.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            waits = list(self._waits)
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self._in_use,
+                # connections back in the pool after a checkout (ones opened up front and never used are not counted)
+                "idle": len(self._last_used),
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "checkout_wait_seconds": summarize(waits),
+            }
+
+
+connection_pool = ConnectionPoolManager(
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_POOL_TIMEOUT,
+    DB_POOL_HEALTHCHECK_IDLE,
+    host=DB_HOST,
+    dbname=DB_NAME,
+    user=DB_USER,
+    password=DB_PASSWORD,
+    port=DB_PORT,
+)
+
+
+def open_dedicated_connection():
+    """
+    A connection outside the pool, for session state that must outlive a checkout (e.g. the
+    advisory lock behind an id node lease). The caller owns it and must close it.
+    """
+    return psycopg2.connect(**connection_pool._connect_kwargs)
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool size, checkout counters and checkout wait-time percentiles."""
+    return connection_pool.stats()
+
 
 @contextmanager
 def get_db_connection():
     """
-    Provides a database connection within a context manager.
-    The connection is automatically closed upon exiting the 'with' block.
+    Provides a pooled database connection within a context manager.
+    The connection is returned to the pool (with any open transaction rolled back) upon
+    exiting the 'with' block; connections that broke while in use are discarded.
     """
     conn = None
+    discard = False
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            port=DB_PORT
-        )
+        conn = connection_pool.acquire()
         yield conn
-    except psycopg2.OperationalError as e:
-        print(f"Database connection failed: {e}")
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        discard = True
+        if conn is None:
+            print(f"Database connection failed: {e}")
         raise
     finally:
-        if conn:
-            conn.close()
+        if conn is not None:
+            connection_pool.release(conn, discard=discard)
+
+
+class _StaleConnection(Exception):
+    pass
+
+
+def _run_with_retry(work: Callable[[Any], Any], idempotent: bool = True):
+    """
+    Run work(conn) on a pooled connection. If the connection turns out to be stale (the server
+    closed it, e.g. after a restart), discard it and retry up to DB_RETRY_ATTEMPTS times on a fresh one.
+
+    Only idempotent work (reads) is retried. A write that failed on a closed connection may still have
+    been committed (e.g. the link dropped during COMMIT), so running it again could apply it twice; for
+    writes, stale connections are only weeded out before anything is sent, by the pool's health check.
+    """
+    attempt = 0
+    while True:
+        try:
+            with get_db_connection() as conn:
+                try:
+                    return work(conn)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    if idempotent and conn.closed and attempt < DB_RETRY_ATTEMPTS:
+                        raise _StaleConnection()
+                    raise
+        except _StaleConnection:
+            attempt += 1
 
 
 def dict_fetch_all(cursor) -> List[Dict[str, Any]]:
@@ -42,7 +241,8 @@ def dict_fetch_all(cursor) -> List[Dict[str, Any]]:
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 
-def fetch_data(query: str, params: tuple = None, as_dicts: bool = True) -> Union[List[Dict[str, Any]], List[List[Any]]]:
+def fetch_data(query: str, params: tuple = None, as_dicts: bool = True,
+               raise_errors: bool = False) -> Union[List[Dict[str, Any]], List[List[Any]]]:
     """
     Fetches data from the database.
 
@@ -51,22 +251,93 @@ def fetch_data(query: str, params: tuple = None, as_dicts: bool = True) -> Union
         params: Optional parameters for the query.
         as_dicts: If True, returns a list of dictionaries. If False,
                   returns a list of lists. Defaults to True.
+        raise_errors: If True, errors are printed and re-raised instead of returning an
+                      empty result (for callers that cache what they read).
 
     Returns:
         A list of dictionaries or a list of lists.
     """
+    def work(conn):
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            if as_dicts:
+                return dict_fetch_all(cur)
+            else:
+                # Fetch and return the raw data (list of tuples), then convert to list of lists
+                return [list(row) for row in cur.fetchall()]
+
+    try:
+        return _run_with_retry(work)
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        if raise_errors:
+            raise
+        return []
+
+
+def fetch_rows(query: str, params: tuple = None, raise_errors: bool = False) -> List[tuple]:
+    """
+    Fetches raw row tuples, skipping the per-row dict/list building of fetch_data.
+    Meant for bulk reads that map rows positionally (see config/records.py).
+    """
+    def work(conn):
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    try:
+        return _run_with_retry(work)
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        if raise_errors:
+            raise
+        return []
+
+
+def stream_data(query: str, params: tuple = None, as_dicts: bool = True, itersize: int = 2000,
+                batch_size: int = None) -> Iterator[Any]:
+    """
+    Streams the result of a query through a named (server-side) cursor instead of loading it all.
+
+    Args:
+        query: The SQL query string.
+        params: Optional parameters for the query.
+        as_dicts: If True, rows are dictionaries; otherwise tuples.
+        itersize: Rows transferred from the server per network round trip.
+        batch_size: If set, yields lists of up to batch_size rows instead of single rows.
+
+    The pooled connection is held until the generator is exhausted or closed, so consume it
+    promptly. Unlike fetch_data, errors are printed and re-raised: a silently truncated stream
+    would look like a complete one.
+    """
     try:
         with get_db_connection() as conn:
-            with conn.cursor() as cur:
+            with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cur:
+                cur.itersize = itersize
                 cur.execute(query, params)
-                if as_dicts:
-                    return dict_fetch_all(cur)
+                columns = None
+                if batch_size:
+                    while True:
+                        rows = cur.fetchmany(batch_size)
+                        if not rows:
+                            break
+                        if not as_dicts:
+                            yield rows
+                            continue
+                        if columns is None:
+                            columns = [col[0] for col in cur.description]
+                        yield [dict(zip(columns, row)) for row in rows]
                 else:
-                    # Fetch and return the raw data (list of tuples), then convert to list of lists
-                    return [list(row) for row in cur.fetchall()]
+                    for row in cur:
+                        if not as_dicts:
+                            yield row
+                            continue
+                        if columns is None:
+                            columns = [col[0] for col in cur.description]
+                        yield dict(zip(columns, row))
     except Exception as e:
-        print(f"Error fetching data: {e}")
-        return []
+        print(f"Error streaming data: {e}")
+        raise
 
 
 def execute_query(query: str, params: tuple = None) -> int:
@@ -74,17 +345,46 @@ def execute_query(query: str, params: tuple = None) -> int:
     Executes a DML query (INSERT, UPDATE, DELETE) and commits the transaction.
     Returns the number of rows affected.
     """
+    def work(conn):
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            conn.commit()
+            return cur.rowcount
+
     try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query, params)
-                conn.commit()
-                return cur.rowcount
+        return _run_with_retry(work, idempotent=False)
     except Exception as e:
         print(f"Error executing query: {e}")
         return 0
 
 
+def execute_values_query(query: str, rows: Sequence[tuple], template: str = None, page_size: int = 1000) -> int:
+    """
+    Executes a multi-row INSERT (query with a single VALUES %s placeholder) for all rows in one
+    transaction, sending page_size rows per statement. Returns the number of rows affected.
+
+    Unlike execute_query, errors are printed and re-raised: bulk loads checkpoint their progress
+    after each call, and a failed batch reported as 0 rows would be skipped for good.
+    """
+    if not rows:
+        return 0
+
+    def work(conn):
+        affected = 0
+        with conn.cursor() as cur:
+            for start in range(0, len(rows), page_size):
+                execute_values(cur, query, rows[start:start + page_size], template=template, page_size=page_size)
+                affected += max(cur.rowcount, 0)
+        conn.commit()
+        return affected
+
+    try:
+        return _run_with_retry(work, idempotent=False)
+    except Exception as e:
+        print(f"Error executing bulk query: {e}")
+        raise
+
+
 # Example Usage
 if __name__ == "__main__":
     # Example 1: Fetching data as a list of dictionaries (default behavior)
@@ -94,3 +394,4 @@ if __name__ == "__main__":
     print(users_dict)
 
     print("-" * 50)
+    print(get_pool_stats())
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone
+from typing import List, NamedTuple, Optional, Tuple
+
+
+# Tuple-backed read models for bulk reads. Field order matches crud.GROUP_COLUMNS / crud.HISTORY_COLUMNS,
+# so a DB row tuple maps to a record with RecordType._make(row) and no per-row dict or validation.
+# The pydantic models in config/models.py remain the validated shapes for writes.
+
+
+class ChatGroupRow(NamedTuple):
+    id: int
+    user_id: int
+    group_name: Optional[str]
+    group_desc: Optional[str]
+    is_active: bool
+    created_ts: Optional[datetime]
+
+
+class ChatHistoryRow(NamedTuple):
+    id: int
+    user_id: int
+    user_inquiry: str
+    assistant_response: str
+    reference_id: Optional[int]
+    chat_group_id: Optional[int]
+    created_ts: datetime
+
+
+class ChatHistorySearchHit(NamedTuple):
+    id: int
+    user_id: int
+    user_inquiry: str
+    assistant_response: str
+    reference_id: Optional[int]
+    chat_group_id: Optional[int]
+    created_ts: datetime
+    rank: float
+
+
+# Keyset (seek) pagination results; cursors are the sort key of the first/last row on the page
+
+
+class ChatGroupPage(NamedTuple):
+    items: List[ChatGroupRow]
+    next_cursor: Optional[int] = None  # last id on the page, if more rows follow
+    prev_cursor: Optional[int] = None  # first id on the page, if rows precede it
+
+
+class ChatHistoryPage(NamedTuple):
+    items: List[ChatHistoryRow]
+    next_cursor: Optional[Tuple[datetime, int]] = None  # (created_ts, id) of the last row, if older rows follow
+    prev_cursor: Optional[Tuple[datetime, int]] = None  # (created_ts, id) of the first row, if newer rows exist
+
+
+class ChatHistorySearchPage(NamedTuple):
+    items: List[ChatHistorySearchHit]
+    next_cursor: Optional[Tuple[float, int]] = None  # (rank, id) of the last hit, if more hits follow
+
+
+# Micro-benchmark (run from source_code/ with: python -m config.records):
+# the old dict + pydantic read path vs the tuple-backed one, on synthetic rows
+if __name__ == "__main__":
+    from config.models import ChatHistory
+
+    count = 200_000
+    columns = list(ChatHistoryRow._fields)
+    now = datetime.now(timezone.utc)
+    raw_rows = [
+        (i, 1, f"question {i} " * 5, f"answer {i} " * 20, None, i % 7 or None, now)
+        for i in range(count)
+    ]
+
+    started = time.perf_counter()
+    validated = [ChatHistory(**row) for row in [dict(zip(columns, r)) for r in raw_rows]]
+    pydantic_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    records = list(map(ChatHistoryRow._make, raw_rows))
+    tuple_seconds = time.perf_counter() - started
+
+    assert validated[-1].id == records[-1].id
+    print(f"dict + pydantic : {count / pydantic_seconds:12,.0f} rows/s")
+    print(f"ChatHistoryRow  : {count / tuple_seconds:12,.0f} rows/s ({pydantic_seconds / tuple_seconds:.1f}x)")
@@ -40,3 +40,114 @@ TABLESPACE pg_default;
 ALTER TABLE IF EXISTS personal_chat.chat_history
     OWNER to postgres;
 ;
+
+-- Keyset pagination indexes
+
+-- Chat History page: ORDER BY created_ts DESC, id DESC seeking on (created_ts, id)
+-- not a covering index: the page also reads user_inquiry and assistant_response, too large to INCLUDE,
+-- so each page is an index range scan plus one heap fetch per row (at most limit + 1)
+CREATE INDEX IF NOT EXISTS chat_history_created_ts_id_idx
+    ON personal_chat.chat_history USING btree
+    (created_ts DESC, id DESC)
+    TABLESPACE pg_default;
+
+-- Chat Groups page ("Show only active"): seeks on id; covers every selected column (crud.GROUP_COLUMNS),
+-- so the page is an index-only scan; the primary key serves the unfiltered listing
+CREATE INDEX IF NOT EXISTS chat_group_dtl_active_id_idx
+    ON personal_chat.chat_group_dtl USING btree
+    (id)
+    INCLUDE (user_id, group_name, group_desc, is_active, created_ts)
+    TABLESPACE pg_default
+    WHERE is_active = true;
+
+-- Full-text search over chat history (crud.search_chat_history)
+-- search_tsv is a plain column kept current by a trigger: a GENERATED ... STORED column would rewrite the
+-- whole table under an ACCESS EXCLUSIVE lock. Existing rows are filled in committed batches and the index
+-- is built CONCURRENTLY, so run this file with psql in its default autocommit mode (not with -1/--single-transaction).
+
+ALTER TABLE IF EXISTS personal_chat.chat_history
+    ADD COLUMN IF NOT EXISTS search_tsv tsvector;
+
+CREATE OR REPLACE FUNCTION personal_chat.chat_history_search_doc(user_inquiry text, assistant_response text)
+    RETURNS tsvector
+    LANGUAGE sql IMMUTABLE
+AS $$
+    SELECT setweight(to_tsvector('english', coalesce(user_inquiry, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(assistant_response, '')), 'B')
+$$;
+
+CREATE OR REPLACE FUNCTION personal_chat.chat_history_search_tsv_trg()
+    RETURNS trigger
+    LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.search_tsv := personal_chat.chat_history_search_doc(NEW.user_inquiry, NEW.assistant_response);
+    RETURN NEW;
+END
+$$;
+
+DROP TRIGGER IF EXISTS chat_history_search_tsv ON personal_chat.chat_history;
+
+CREATE TRIGGER chat_history_search_tsv
+    BEFORE INSERT OR UPDATE OF user_inquiry, assistant_response ON personal_chat.chat_history
+    FOR EACH ROW EXECUTE FUNCTION personal_chat.chat_history_search_tsv_trg();
+
+-- backfill rows written before the trigger existed, 5000 per transaction
+DO $$
+DECLARE
+    last_id bigint := -9223372036854775808;
+    batch_last_id bigint;
+BEGIN
+    LOOP
+        WITH batch AS (
+            SELECT id FROM personal_chat.chat_history
+            WHERE id > last_id AND search_tsv IS NULL
+            ORDER BY id
+            LIMIT 5000
+        ), filled AS (
+            UPDATE personal_chat.chat_history h
+            SET search_tsv = personal_chat.chat_history_search_doc(h.user_inquiry, h.assistant_response)
+            FROM batch
+            WHERE h.id = batch.id
+            RETURNING h.id
+        )
+        SELECT max(id) INTO batch_last_id FROM filled;
+        EXIT WHEN batch_last_id IS NULL;
+        last_id := batch_last_id;
+        COMMIT;
+    END LOOP;
+END
+$$;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS chat_history_search_tsv_idx
+    ON personal_chat.chat_history USING gin
+    (search_tsv)
+    TABLESPACE pg_default;
+
+-- pgvector backend for RAG chunks (VECTOR_BACKEND=pgvector, see pgvector_store.py)
+-- the vector dimension must match the embedding model (mxbai-embed-large: 1024, EMBEDDING_DIM)
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS personal_chat.rag_embeddings
+(
+    collection text NOT NULL,
+    id text NOT NULL,
+    content text NOT NULL,
+    metadata jsonb NOT NULL DEFAULT '{}'::jsonb,
+    embedding vector(1024) NOT NULL,
+    CONSTRAINT rag_embeddings_pkey PRIMARY KEY (collection, id)
+)
+TABLESPACE pg_default;
+
+-- every collection (shard, index version) gets its own partial HNSW index, created by PgVectorStore
+-- when it is first written to:
+--   CREATE INDEX CONCURRENTLY rag_embeddings_hnsw_<hash> ON personal_chat.rag_embeddings
+--       USING hnsw (embedding vector_cosine_ops) WHERE collection = '<collection>';
+-- a single table-wide index would return other collections' rows to the filter and lose recall
+
+-- chunks of one source document, replaced on re-ingestion and in watch mode
+CREATE INDEX IF NOT EXISTS rag_embeddings_source_idx
+    ON personal_chat.rag_embeddings USING btree
+    (collection, (metadata->>'source'))
+    TABLESPACE pg_default;
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
-from typing import List, Optional, Dict, Any
+import os
+from datetime import datetime
+from typing import List, Optional, Dict, Any, Iterable, Iterator, Tuple
 
-from config.pg_db_conn_manager import fetch_data, execute_query
+from config.pg_db_conn_manager import fetch_data, fetch_rows, execute_query, execute_values_query, stream_data
+from config.id_generator import next_id
+from config.read_cache import ReadThroughCache
 from config.models import (
     ChatGroupDtl,
     ChatGroupDtlCreate,
@@ -11,37 +15,138 @@ from config.models import (
     ChatHistoryCreate,
     ChatHistoryUpdate,
 )
+from config.records import (
+    ChatGroupPage,
+    ChatGroupRow,
+    ChatHistoryPage,
+    ChatHistoryRow,
+    ChatHistorySearchHit,
+    ChatHistorySearchPage,
+)
 
 SCHEMA = "personal_chat"
 
+# Bulk reads return tuple-backed records (config/records.py) mapped positionally from these
+# column lists; pydantic validation is kept for writes and single-row lookups.
+GROUP_COLUMNS = "id, user_id, group_name, group_desc, is_active, created_ts"
+HISTORY_COLUMNS = "id, user_id, user_inquiry, assistant_response, reference_id, chat_group_id, created_ts"
+
 
 # -------------------- Chat Group DTL --------------------
 
-def list_chat_groups(active_only: bool = False) -> List[ChatGroupDtl]:
+# Chat groups change rarely but are read on every rerun of the groups page: cache reads, clear on writes
+_group_cache = ReadThroughCache("chat_groups", ttl_seconds=float(os.getenv("GROUP_CACHE_TTL", "60")))
+
+
+def invalidate_group_cache() -> None:
+    _group_cache.clear()
+
+
+def get_group_cache_stats() -> Dict[str, Any]:
+    return _group_cache.stats()
+
+
+def _cached_group_read(key: tuple, loader, fallback: Any) -> Any:
+    """Read through the group cache. Loaders raise on DB errors, so a failed read returns fallback
+    without being cached and the next read tries the database again."""
+    try:
+        return _group_cache.get_or_load(key, loader)
+    except Exception:
+        return fallback
+
+
+def _load_chat_groups(active_only: bool) -> List[ChatGroupRow]:
     where_clause = "WHERE is_active = true" if active_only else ""
-    rows = fetch_data(
-        f"SELECT id, user_id, group_name, group_desc, is_active, created_ts FROM {SCHEMA}.chat_group_dtl {where_clause} ORDER BY id;"
+    rows = fetch_rows(
+        f"SELECT {GROUP_COLUMNS} FROM {SCHEMA}.chat_group_dtl {where_clause} ORDER BY id;",
+        raise_errors=True,
     )
-    return [ChatGroupDtl(**row) for row in rows]
+    return list(map(ChatGroupRow._make, rows))
 
 
-def get_chat_group(group_id: int) -> Optional[ChatGroupDtl]:
+def list_chat_groups(active_only: bool = False) -> List[ChatGroupRow]:
+    # a new list each call: the cached one is shared by every session (the rows are immutable tuples)
+    return list(_cached_group_read(("list", active_only), lambda: _load_chat_groups(active_only), []))
+
+
+def chat_groups_page_query(limit: int, after: Optional[int], before: Optional[int],
+                           active_only: bool) -> Tuple[str, tuple]:
+    """SQL and params for a keyset page of chat groups (shared by the sync and async crud)."""
+    conditions = ["is_active = true"] if active_only else []
+    params: List[Any] = []
+    if before is not None:
+        conditions.append("id < %s")
+        params.append(before)
+        order = "DESC"
+    else:
+        if after is not None:
+            conditions.append("id > %s")
+            params.append(after)
+        order = "ASC"
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit + 1)
+    sql = f"SELECT {GROUP_COLUMNS} FROM {SCHEMA}.chat_group_dtl {where_clause} ORDER BY id {order} LIMIT %s;"
+    return sql, tuple(params)
+
+
+def chat_groups_page_result(rows: List[tuple], limit: int, after: Optional[int],
+                            before: Optional[int]) -> ChatGroupPage:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    items = list(map(ChatGroupRow._make, rows))
+    if not items:
+        return ChatGroupPage(items=[])
+    more_after = has_more if before is None else True
+    more_before = has_more if before is not None else after is not None
+    return ChatGroupPage(
+        items=items,
+        next_cursor=items[-1].id if more_after else None,
+        prev_cursor=items[0].id if more_before else None,
+    )
+
+
+def list_chat_groups_page(limit: int = 50, after: Optional[int] = None, before: Optional[int] = None,
+                          active_only: bool = False) -> ChatGroupPage:
+    """Keyset page of chat groups ordered by id.
+    Pass a page's next_cursor as `after` to move forward, or its prev_cursor as `before` to move back.
+    """
+    sql, params = chat_groups_page_query(limit, after, before, active_only)
+    page = _cached_group_read(
+        ("page", limit, after, before, active_only),
+        lambda: chat_groups_page_result(fetch_rows(sql, params, raise_errors=True), limit, after, before),
+        ChatGroupPage(items=[]),
+    )
+    return page._replace(items=list(page.items))
+
+
+def _load_chat_group(group_id: int) -> Optional[ChatGroupDtl]:
     rows = fetch_data(
-        f"SELECT id, user_id, group_name, group_desc, is_active, created_ts FROM {SCHEMA}.chat_group_dtl WHERE id = %s;",
+        f"SELECT {GROUP_COLUMNS} FROM {SCHEMA}.chat_group_dtl WHERE id = %s;",
         (group_id,),
+        raise_errors=True,
     )
     if not rows:
         return None
     return ChatGroupDtl(**rows[0])
 
 
+def get_chat_group(group_id: int) -> Optional[ChatGroupDtl]:
+    group = _cached_group_read(("get", group_id), lambda: _load_chat_group(group_id), None)
+    # pydantic models are mutable: hand out a copy, never the cached instance
+    return group.model_copy() if group is not None else None
+
+
+INSERT_CHAT_GROUP_SQL = (
+    f"INSERT INTO {SCHEMA}.chat_group_dtl (id, user_id, group_name, group_desc, is_active) "
+    f"VALUES (%s, %s, %s, %s, %s);"
+)
+
+
 def create_chat_group(payload: ChatGroupDtlCreate) -> int:
-    sql = (
-        f"INSERT INTO {SCHEMA}.chat_group_dtl (id, user_id, group_name, group_desc, is_active) "
-        f"VALUES (%s, %s, %s, %s, %s);"
-    )
-    return execute_query(
-        sql,
+    rows = execute_query(
+        INSERT_CHAT_GROUP_SQL,
         (
             payload.id,
             payload.user_id,
@@ -50,44 +155,150 @@ def create_chat_group(payload: ChatGroupDtlCreate) -> int:
             payload.is_active,
         ),
     )
+    invalidate_group_cache()
+    return rows
 
 
 essential_group_fields = {"user_id", "group_name", "group_desc", "is_active"}
 
 
-def update_chat_group(group_id: int, payload: ChatGroupDtlUpdate) -> int:
+def chat_group_update_query(group_id: int, payload: ChatGroupDtlUpdate) -> Optional[Tuple[str, tuple]]:
+    """SQL and params of update_chat_group (shared with async_crud); None when there is nothing to set."""
     data: Dict[str, Any] = payload.model_dump(exclude_none=True)
     if not data:
-        return 0
+        return None
     # Only allow known fields
     data = {k: v for k, v in data.items() if k in essential_group_fields}
     if not data:
-        return 0
+        return None
     sets = ", ".join([f"{k} = %s" for k in data])
     params = list(data.values()) + [group_id]
-    sql = f"UPDATE {SCHEMA}.chat_group_dtl SET {sets} WHERE id = %s;"
-    return execute_query(sql, tuple(params))
+    return f"UPDATE {SCHEMA}.chat_group_dtl SET {sets} WHERE id = %s;", tuple(params)
+
+
+def update_chat_group(group_id: int, payload: ChatGroupDtlUpdate) -> int:
+    query = chat_group_update_query(group_id, payload)
+    if query is None:
+        return 0
+    rows = execute_query(*query)
+    invalidate_group_cache()
+    return rows
 
 
 def delete_chat_group(group_id: int) -> int:
-    return execute_query(f"DELETE FROM {SCHEMA}.chat_group_dtl WHERE id = %s;", (group_id,))
+    rows = execute_query(f"DELETE FROM {SCHEMA}.chat_group_dtl WHERE id = %s;", (group_id,))
+    invalidate_group_cache()
+    return rows
 
 
 # -------------------- Chat History --------------------
 
-def list_chat_history(limit: int = 200) -> List[ChatHistory]:
-    rows = fetch_data(
-        f"SELECT id, user_id, user_inquiry, assistant_response, reference_id, chat_group_id, created_ts "
-        f"FROM {SCHEMA}.chat_history ORDER BY created_ts DESC LIMIT %s;",
+def list_chat_history(limit: int = 200) -> List[ChatHistoryRow]:
+    rows = fetch_rows(
+        f"SELECT {HISTORY_COLUMNS} FROM {SCHEMA}.chat_history ORDER BY created_ts DESC LIMIT %s;",
         (limit,),
     )
-    return [ChatHistory(**row) for row in rows]
+    return list(map(ChatHistoryRow._make, rows))
+
+
+HistoryCursor = Tuple[datetime, int]
+
+
+def chat_history_page_query(limit: int, after: Optional[HistoryCursor],
+                            before: Optional[HistoryCursor]) -> Tuple[str, tuple]:
+    """SQL and params for a keyset page of chat history (shared by the sync and async crud)."""
+    if before is not None:
+        where_clause = "WHERE (created_ts, id) > (%s, %s)"
+        params: List[Any] = [before[0], before[1]]
+        order = "ASC"
+    elif after is not None:
+        where_clause = "WHERE (created_ts, id) < (%s, %s)"
+        params = [after[0], after[1]]
+        order = "DESC"
+    else:
+        where_clause = ""
+        params = []
+        order = "DESC"
+    params.append(limit + 1)
+    sql = (
+        f"SELECT {HISTORY_COLUMNS} FROM {SCHEMA}.chat_history {where_clause} "
+        f"ORDER BY created_ts {order}, id {order} LIMIT %s;"
+    )
+    return sql, tuple(params)
+
+
+def chat_history_page_result(rows: List[tuple], limit: int, after: Optional[HistoryCursor],
+                             before: Optional[HistoryCursor]) -> ChatHistoryPage:
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    items = list(map(ChatHistoryRow._make, rows))
+    if not items:
+        return ChatHistoryPage(items=[])
+    more_after = has_more if before is None else True
+    more_before = has_more if before is not None else after is not None
+    return ChatHistoryPage(
+        items=items,
+        next_cursor=(items[-1].created_ts, items[-1].id) if more_after else None,
+        prev_cursor=(items[0].created_ts, items[0].id) if more_before else None,
+    )
+
+
+def list_chat_history_page(limit: int = 50, after: Optional[HistoryCursor] = None,
+                           before: Optional[HistoryCursor] = None) -> ChatHistoryPage:
+    """Keyset page of chat history, newest first, seeking on (created_ts, id).
+    Pass a page's next_cursor as `after` for older records, or its prev_cursor as `before` for newer ones.
+    Every page costs the same index range scan, however deep it is.
+    """
+    sql, params = chat_history_page_query(limit, after, before)
+    return chat_history_page_result(fetch_rows(sql, params), limit, after, before)
+
+
+SEARCH_LANGUAGE = "english"  # must match chat_history_search_doc in table_definitions.sql
+
+
+def search_chat_history(query: str, limit: int = 50,
+                        after: Optional[Tuple[float, int]] = None) -> ChatHistorySearchPage:
+    """Full-text search over user_inquiry and assistant_response, best match first.
+    Uses the GIN-indexed search_tsv column; `query` accepts web-search syntax ("quoted phrase", -exclude, or).
+    Pages are keyset-based on (rank, id): pass the previous page's next_cursor as `after`.
+    """
+    if not query or not query.strip():
+        return ChatHistorySearchPage(items=[])
+    params: List[Any] = [query]
+    seek = ""
+    if after is not None:
+        seek = "AND (ts_rank_cd(h.search_tsv, q.tsq), h.id) < (%s::real, %s)"
+        params.extend([after[0], after[1]])
+    params.append(limit + 1)
+    columns = ", ".join(f"h.{c.strip()}" for c in HISTORY_COLUMNS.split(","))
+    rows = fetch_rows(
+        f"SELECT {columns}, ts_rank_cd(h.search_tsv, q.tsq) AS rank "
+        f"FROM {SCHEMA}.chat_history h, websearch_to_tsquery('{SEARCH_LANGUAGE}', %s) AS q(tsq) "
+        f"WHERE h.search_tsv @@ q.tsq {seek} "
+        f"ORDER BY rank DESC, h.id DESC LIMIT %s;",
+        tuple(params),
+    )
+    items = list(map(ChatHistorySearchHit._make, rows[:limit]))
+    next_cursor = (items[-1].rank, items[-1].id) if len(rows) > limit else None
+    return ChatHistorySearchPage(items=items, next_cursor=next_cursor)
+
+
+def iter_chat_history(batch_size: int = 1000, itersize: int = 5000) -> Iterator[List[ChatHistoryRow]]:
+    """Stream the whole chat history (oldest first) in batches, for exports and jobs over large tables."""
+    for rows in stream_data(
+        f"SELECT {HISTORY_COLUMNS} FROM {SCHEMA}.chat_history ORDER BY created_ts, id;",
+        as_dicts=False,
+        itersize=itersize,
+        batch_size=batch_size,
+    ):
+        yield list(map(ChatHistoryRow._make, rows))
 
 
 def get_chat_history(record_id: int) -> Optional[ChatHistory]:
     rows = fetch_data(
-        f"SELECT id, user_id, user_inquiry, assistant_response, reference_id, chat_group_id, created_ts "
-        f"FROM {SCHEMA}.chat_history WHERE id = %s;",
+        f"SELECT {HISTORY_COLUMNS} FROM {SCHEMA}.chat_history WHERE id = %s;",
         (record_id,),
     )
     if not rows:
@@ -95,15 +306,17 @@ def get_chat_history(record_id: int) -> Optional[ChatHistory]:
     return ChatHistory(**rows[0])
 
 
+INSERT_CHAT_HISTORY_SQL = (
+    f"INSERT INTO {SCHEMA}.chat_history (id, user_id, user_inquiry, assistant_response, reference_id, chat_group_id) "
+    f"VALUES (%s, %s, %s, %s, %s, %s);"
+)
+
+
 def create_chat_history(payload: ChatHistoryCreate) -> int:
-    sql = (
-        f"INSERT INTO {SCHEMA}.chat_history (id, user_id, user_inquiry, assistant_response, reference_id, chat_group_id) "
-        f"VALUES (%s, %s, %s, %s, %s, %s);"
-    )
     return execute_query(
-        sql,
+        INSERT_CHAT_HISTORY_SQL,
         (
-            payload.id,
+            payload.id if payload.id is not None else next_id(),
             payload.user_id,
             payload.user_inquiry,
             payload.assistant_response,
@@ -113,6 +326,38 @@ def create_chat_history(payload: ChatHistoryCreate) -> int:
     )
 
 
+def bulk_create_chat_history(payloads: Iterable[ChatHistoryCreate], skip_existing: bool = True,
+                             page_size: int = 1000) -> int:
+    """Insert many chat history rows with multi-row INSERTs in a single transaction.
+    With skip_existing, rows whose id already exists are ignored, which makes re-running a load safe.
+    Returns the number of rows inserted; raises if the transaction could not be committed.
+    """
+    rows = [
+        (
+            p.id if p.id is not None else next_id(),
+            p.user_id,
+            p.user_inquiry,
+            p.assistant_response,
+            p.reference_id,
+            p.chat_group_id,
+            p.created_ts,
+        )
+        for p in payloads
+    ]
+    conflict = " ON CONFLICT (id) DO NOTHING" if skip_existing else ""
+    sql = (
+        f"INSERT INTO {SCHEMA}.chat_history "
+        f"(id, user_id, user_inquiry, assistant_response, reference_id, chat_group_id, created_ts) "
+        f"VALUES %s{conflict};"
+    )
+    return execute_values_query(
+        sql,
+        rows,
+        template="(%s, %s, %s, %s, %s, %s, COALESCE(%s::timestamptz, CURRENT_TIMESTAMP))",
+        page_size=page_size,
+    )
+
+
 essential_history_fields = {
     "user_id",
     "user_inquiry",
@@ -122,17 +367,24 @@ essential_history_fields = {
 }
 
 
-def update_chat_history(record_id: int, payload: ChatHistoryUpdate) -> int:
+def chat_history_update_query(record_id: int, payload: ChatHistoryUpdate) -> Optional[Tuple[str, tuple]]:
+    """SQL and params of update_chat_history (shared with async_crud); None when there is nothing to set."""
     data: Dict[str, Any] = payload.model_dump(exclude_none=True)
     if not data:
-        return 0
+        return None
     data = {k: v for k, v in data.items() if k in essential_history_fields}
     if not data:
-        return 0
+        return None
     sets = ", ".join([f"{k} = %s" for k in data])
     params = list(data.values()) + [record_id]
-    sql = f"UPDATE {SCHEMA}.chat_history SET {sets} WHERE id = %s;"
-    return execute_query(sql, tuple(params))
+    return f"UPDATE {SCHEMA}.chat_history SET {sets} WHERE id = %s;", tuple(params)
+
+
+def update_chat_history(record_id: int, payload: ChatHistoryUpdate) -> int:
+    query = chat_history_update_query(record_id, payload)
+    if query is None:
+        return 0
+    return execute_query(*query)
 
 
 def delete_chat_history(record_id: int) -> int:
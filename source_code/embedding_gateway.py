@@ -0,0 +1,364 @@
+"""
+Shared embedding gateway in front of Ollama.
+
+Speaks Ollama's /api/embed (and the older /api/embeddings), so any OllamaEmbeddings client can use it by pointing
+base_url at it; the ingestion script, the watch daemon and the chat app do so when EMBEDDING_GATEWAY_URL is set.
+Requests from all of them meet in one process, where:
+  - texts already embedded are answered from an LRU cache (EMBED_GATEWAY_CACHE_SIZE float32 vectors); only
+    requests of at most EMBED_GATEWAY_CACHE_MAX_TEXTS texts (queries, not ingestion batches) add to it,
+  - a text that is being embedded for another request is not sent again, both requests wait for the same result,
+  - the remaining texts are micro-batched: a batch goes to Ollama once it holds EMBED_GATEWAY_MAX_BATCH texts or
+    its oldest text has waited EMBED_GATEWAY_WAIT_MS, so concurrent single-query requests share one model call.
+GET /metrics returns batch-size and latency histograms plus cache and dedup counters; other requests are
+forwarded to Ollama unchanged.
+
+Run from source_code/:
+    python embedding_gateway.py --port 11500
+and set EMBEDDING_GATEWAY_URL="http://127.0.0.1:11500" for the clients.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    from model_warmup import post_json, get_ollama_base_url
+    from stats import summarize
+except ModuleNotFoundError:
+    from source_code.model_warmup import post_json, get_ollama_base_url
+    from source_code.stats import summarize
+
+load_dotenv()
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# the request fields that change the vectors; requests agreeing on them can share a batch and cache entries
+_OUTPUT_FIELDS = ("model", "truncate", "dimensions", "options")
+
+
+class Histogram:
+    """Counts per upper bound (last bucket open-ended) plus a bounded sample for percentiles."""
+
+    def __init__(self, bounds: Sequence[float], sample_size: int = 10000):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sample: List[float] = []
+        self.sample_size = sample_size
+        self._next = 0
+
+    def observe(self, value: float) -> None:
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[index] += 1
+        # ring buffer of recent values
+        if len(self.sample) < self.sample_size:
+            self.sample.append(value)
+        else:
+            self.sample[self._next] = value
+            self._next = (self._next + 1) % self.sample_size
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"<={b:g}" for b in self.bounds] + [f">{self.bounds[-1]:g}"]
+        return {"buckets": dict(zip(labels, self.counts)), **summarize(self.sample)}
+
+
+def get_gateway_url() -> Optional[str]:
+    return (os.getenv("EMBEDDING_GATEWAY_URL") or "").rstrip("/") or None
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from many threads into batched calls of embed_batch(params, texts).
+
+    params is a tuple of the request fields that affect the output (_OUTPUT_FIELDS, JSON-encoded); only texts
+    with equal params are batched, cached or deduplicated together. Cached vectors are kept as array('f'),
+    a quarter of the memory of a list of Python floats.
+    """
+
+    def __init__(self, embed_batch: Callable[[Tuple, List[str]], List[List[float]]], max_batch: int = 64,
+                 max_wait: float = 0.005, cache_size: int = 10000, max_in_flight: int = 2):
+        self.embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, array]" = OrderedDict()
+        self._in_flight: Dict[Tuple, Future] = {}
+        self._cache_on_arrival = set()  # in-flight keys that a cacheable request asked for
+        self._pending: "OrderedDict[Tuple, List[Tuple[str, float]]]" = OrderedDict()  # params -> [(text, queued_at)]
+        self._cond = threading.Condition()
+        self._workers = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-batch")
+        self._slots = threading.Semaphore(max_in_flight)
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.batch_latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.request_latency_ms = Histogram(LATENCY_BUCKETS_MS)
+        self.counters = {"requests": 0, "texts": 0, "cache_hits": 0, "deduplicated": 0, "embedded": 0,
+                         "uncached": 0, "errors": 0}
+        self._stopped = False
+        threading.Thread(target=self._dispatch_loop, name="embed-dispatch", daemon=True).start()
+
+    def embed(self, params: Tuple, texts: List[str], cache: bool = True) -> List[List[float]]:
+        """Vectors for texts; with cache=False, cached vectors are still used but new ones are not stored."""
+        started = time.perf_counter()
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        waiting: List[Tuple[int, Future]] = []
+        with self._cond:
+            self.counters["requests"] += 1
+            self.counters["texts"] += len(texts)
+            for i, text in enumerate(texts):
+                key = (params, text)
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    self.counters["cache_hits"] += 1
+                    results[i] = vector.tolist()
+                    continue
+                future = self._in_flight.get(key)
+                if future is not None:
+                    self.counters["deduplicated"] += 1
+                else:
+                    future = Future()
+                    self._in_flight[key] = future
+                    self._pending.setdefault(params, []).append((text, time.monotonic()))
+                    self._cond.notify()
+                if cache:
+                    self._cache_on_arrival.add(key)
+                waiting.append((i, future))
+        for i, future in waiting:
+            results[i] = future.result()
+        self.request_latency_ms.observe((time.perf_counter() - started) * 1000.0)
+        return results
+
+    def _next_batch(self) -> Optional[Tuple[Tuple, List[str]]]:
+        """Wait until some params group is full or its oldest text has waited max_wait, then take a batch of it."""
+        with self._cond:
+            while not self._stopped:
+                now = time.monotonic()
+                deadline = None
+                for params, queued in self._pending.items():
+                    due = queued[0][1] + self.max_wait
+                    if len(queued) >= self.max_batch or due <= now:
+                        batch = [text for text, _ in queued[:self.max_batch]]
+                        del queued[:self.max_batch]
+                        if not queued:
+                            del self._pending[params]
+                        return params, batch
+                    deadline = due if deadline is None else min(deadline, due)
+                self._cond.wait(None if deadline is None else deadline - now)
+        return None
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            # hold texts back while max_in_flight batches are running, so they can still grow into bigger batches
+            self._slots.acquire()
+            job = self._next_batch()
+            if job is None:
+                return
+            self._workers.submit(self._run_batch, *job)
+
+    def _run_batch(self, params: Tuple, texts: List[str]) -> None:
+        started = time.perf_counter()
+        try:
+            vectors = self.embed_batch(params, texts)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"Ollama returned {len(vectors)} embeddings for {len(texts)} texts")
+            error = None
+        except Exception as e:
+            vectors, error = None, e
+        finally:
+            self._slots.release()
+        self.batch_sizes.observe(len(texts))
+        self.batch_latency_ms.observe((time.perf_counter() - started) * 1000.0)
+        with self._cond:
+            for i, text in enumerate(texts):
+                key = (params, text)
+                future = self._in_flight.pop(key)
+                cacheable = key in self._cache_on_arrival
+                self._cache_on_arrival.discard(key)
+                if error is not None:
+                    future.set_exception(error)
+                    continue
+                # the model's vectors are float32: rounding here makes fresh and cached answers identical
+                vector = array("f", vectors[i])
+                if cacheable:
+                    self._cache[key] = vector
+                else:
+                    self.counters["uncached"] += 1
+                future.set_result(vector.tolist())
+            if error is not None:
+                self.counters["errors"] += 1
+            else:
+                self.counters["embedded"] += len(texts)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = sum(len(q) for q in self._pending.values())
+            return {
+                **self.counters,
+                "cache_entries": len(self._cache),
+                "pending_texts": pending,
+                "in_flight_texts": len(self._in_flight) - pending,
+                "batch_size": self.batch_sizes.snapshot(),
+                "batch_latency_ms": self.batch_latency_ms.snapshot(),
+                "request_latency_ms": self.request_latency_ms.snapshot(),
+            }
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._slots.release()
+        self._workers.shutdown(wait=False)
+
+
+def ollama_embed_batch(upstream: str, timeout: float = 600.0) -> Callable[[Tuple, List[str]], List[List[float]]]:
+    """embed_batch for EmbeddingBatcher that calls Ollama's /api/embed; keep_alive is the gateway's OLLAMA_KEEP_ALIVE."""
+    keep_alive = os.getenv("OLLAMA_KEEP_ALIVE") or "30m"
+
+    def embed_batch(params: Tuple, texts: List[str]) -> List[List[float]]:
+        payload = {name: json.loads(value) for name, value in zip(_OUTPUT_FIELDS, params) if value != "null"}
+        payload.update(input=texts, keep_alive=keep_alive)
+        return post_json(f"{upstream}/api/embed", payload, timeout)["embeddings"]
+
+    return embed_batch
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    batcher: EmbeddingBatcher = None  # type: ignore[assignment]
+    upstream: str = ""
+    cache_max_texts: int = 8
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _forward(self, body: Optional[bytes]) -> None:
+        req = urllib.request.Request(f"{self.upstream}{self.path}", data=body, method=self.command,
+                                     headers={"Content-Type": self.headers.get("Content-Type", "application/json")})
+        try:
+            with urllib.request.urlopen(req, timeout=600) as resp:
+                status, content_type, payload = resp.status, resp.headers.get("Content-Type"), resp.read()
+        except urllib.error.HTTPError as e:
+            status, content_type, payload = e.code, e.headers.get("Content-Type"), e.read()
+        except urllib.error.URLError as e:
+            self._send_json({"error": f"Ollama unreachable at {self.upstream}: {e.reason}"}, status=502)
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._send_json(self.batcher.metrics())
+        else:
+            self._forward(None)
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path not in ("/api/embed", "/api/embeddings"):
+            self._forward(body)
+            return
+        try:
+            req = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self._send_json({"error": "invalid JSON body"}, status=400)
+            return
+        texts = req.get("input", req.get("prompt", ""))
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        params = tuple(json.dumps(req.get(name), sort_keys=True) for name in _OUTPUT_FIELDS)
+        started = time.perf_counter()
+        try:
+            # large requests are ingestion batches, embedded once: caching them would evict the hot queries
+            vectors = self.batcher.embed(params, texts, cache=len(texts) <= self.cache_max_texts)
+        except Exception as e:
+            self._send_json({"error": str(e)}, status=502)
+            return
+        if self.path == "/api/embeddings":
+            self._send_json({"embedding": vectors[0] if vectors else []})
+        else:
+            self._send_json({"model": req.get("model"), "embeddings": vectors,
+                             "total_duration": int((time.perf_counter() - started) * 1e9)})
+
+
+class GatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # every chat process and ingestion worker connects at once; the default backlog of 5 resets connections
+    request_queue_size = 128
+
+
+def start_gateway(host: str = "127.0.0.1", port: int = 0, upstream: Optional[str] = None,
+                  max_batch: Optional[int] = None, max_wait_ms: Optional[float] = None,
+                  cache_size: Optional[int] = None, max_in_flight: Optional[int] = None,
+                  cache_max_texts: Optional[int] = None) -> Tuple[ThreadingHTTPServer, EmbeddingBatcher, str]:
+    """Start the gateway in a daemon thread; returns (server, batcher, base_url). port=0 picks a free port."""
+    upstream = (upstream or get_ollama_base_url()).rstrip("/")
+    batcher = EmbeddingBatcher(
+        ollama_embed_batch(upstream),
+        max_batch=max_batch or int(os.getenv("EMBED_GATEWAY_MAX_BATCH", "64")),
+        max_wait=(max_wait_ms if max_wait_ms is not None else float(os.getenv("EMBED_GATEWAY_WAIT_MS", "5"))) / 1000.0,
+        cache_size=cache_size if cache_size is not None else int(os.getenv("EMBED_GATEWAY_CACHE_SIZE", "10000")),
+        max_in_flight=max_in_flight or int(os.getenv("EMBED_GATEWAY_MAX_IN_FLIGHT", "2")),
+    )
+    if cache_max_texts is None:
+        cache_max_texts = int(os.getenv("EMBED_GATEWAY_CACHE_MAX_TEXTS", "8"))
+    handler = type("BoundGatewayHandler", (GatewayHandler,),
+                   {"batcher": batcher, "upstream": upstream, "cache_max_texts": cache_max_texts})
+    server = GatewayServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="embedding-gateway", daemon=True).start()
+    return server, batcher, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the batching, caching embedding gateway in front of Ollama.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--upstream", default=None, help="Ollama base URL (default: OLLAMA_HOST)")
+    parser.add_argument("--max-batch", type=int, default=None, help="Texts per Ollama call (default EMBED_GATEWAY_MAX_BATCH)")
+    parser.add_argument("--wait-ms", type=float, default=None,
+                        help="How long a text may wait for others to share its batch (default EMBED_GATEWAY_WAIT_MS)")
+    parser.add_argument("--cache-size", type=int, default=None, help="Cached embeddings (default EMBED_GATEWAY_CACHE_SIZE)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Concurrent Ollama calls (default EMBED_GATEWAY_MAX_IN_FLIGHT)")
+    parser.add_argument("--cache-max-texts", type=int, default=None,
+                        help="Only cache requests of at most this many texts (default EMBED_GATEWAY_CACHE_MAX_TEXTS)")
+    args = parser.parse_args(argv)
+
+    server, batcher, base_url = start_gateway(args.host, args.port, args.upstream, args.max_batch, args.wait_ms,
+                                              args.cache_size, args.max_in_flight, args.cache_max_texts)
+    print(f"Embedding gateway listening on {base_url}, forwarding to {server.RequestHandlerClass.upstream} "
+          f"(Ctrl+C to stop; GET {base_url}/metrics for histograms)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        batcher.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
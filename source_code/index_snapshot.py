@@ -0,0 +1,290 @@
+"""
+Snapshots of the vector index, so a new node can start from a file instead of re-embedding the corpus.
+
+A snapshot holds every vector of the live version with its id, text and metadata, the embedding model that
+produced it and the corpus manifest (the ingestion checkpoint and the watch-mode manifest, which record
+what is already indexed). Layout, little-endian:
+
+    [0, 64)          magic b"RAGSNAP1", zero padded
+    [64, 64 + n*d*4) float32 vectors, row-major (n vectors of dimension d) -- np.memmap-able as is
+    records          JSON Lines, one {"id", "document", "metadata"} per vector, in the same order
+    header           JSON: model, dimension, count, block offsets/lengths and their sha256 checksums, manifest
+    footer           uint64 header length + magic
+
+Imports verify both checksums, then bulk-write the vectors into a new index version and swap it in like a
+blue/green rebuild (index_versions.py), so a running chat app switches over atomically.
+
+Run from source_code/:
+    python index_snapshot.py export [--path PATH]
+    python index_snapshot.py import [--path PATH] [--force]
+    python index_snapshot.py verify [--path PATH]
+"""
+import argparse
+import hashlib
+import json
+import os
+import struct
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+try:
+    from answer_cache import bump_corpus_version
+    from index_versions import (collect_garbage, count_vectors, current_live, drop_version, iter_records,
+                                new_version, open_version, swap_live, write_records)
+except ModuleNotFoundError:
+    from source_code.answer_cache import bump_corpus_version
+    from source_code.index_versions import (collect_garbage, count_vectors, current_live, drop_version,
+                                            iter_records, new_version, open_version, swap_live, write_records)
+
+load_dotenv()
+
+MAGIC = b"RAGSNAP1"
+VECTORS_OFFSET = 64
+_FOOTER = struct.Struct("<Q8s")
+_HASH_CHUNK = 64 * 1024 * 1024
+
+
+def get_snapshot_path() -> str:
+    return os.path.join(os.getenv("DATASET_STORAGE_FOLDER") or "datasets", os.getenv("SNAPSHOT_STORAGE_FILE") or "rag_index.snap")
+
+
+def _manifest_paths() -> Dict[str, str]:
+    """The corpus manifest files a snapshot carries, by name."""
+    # imported lazily: they pull in the PDF reader, Ollama and the text splitter
+    from local_docs_chunking_embedding_ingestion import get_checkpoint_path
+    from watch_ingest import get_manifest_path
+    return {"ingest_checkpoint": get_checkpoint_path(), "watch_manifest": get_manifest_path()}
+
+
+def _read_manifest() -> Dict[str, Any]:
+    manifest = {}
+    for name, path in _manifest_paths().items():
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                manifest[name] = json.load(f)
+    return manifest
+
+
+def export_snapshot(embeddings: Embeddings, path: Optional[str] = None, batch_size: int = 1000) -> Dict[str, Any]:
+    """Write the live version to a snapshot file (atomically) and return its header."""
+    path = path or get_snapshot_path()
+    live = current_live()
+    store = open_version(embeddings, live)
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    records_path = f"{path}.records.tmp"
+    vectors_sha, records_sha = hashlib.sha256(), hashlib.sha256()
+    count, dimension = 0, None
+    try:
+        # vectors go straight into the snapshot; records are spooled aside and appended after the vector block
+        with open(tmp_path, "wb") as out, open(records_path, "wb") as records:
+            out.write(MAGIC.ljust(VECTORS_OFFSET, b"\0"))
+            for ids, documents, metadatas, vectors in iter_records(store, batch_size):
+                block = np.asarray(vectors, dtype="<f4")
+                if dimension is None:
+                    dimension = block.shape[1]
+                elif block.shape[1] != dimension:
+                    raise ValueError(f"Mixed vector dimensions in the collection ({dimension} and {block.shape[1]})")
+                data = block.tobytes()
+                out.write(data)
+                vectors_sha.update(data)
+                lines = "".join(json.dumps({"id": i, "document": d, "metadata": m or {}}, ensure_ascii=False) + "\n"
+                                for i, d, m in zip(ids, documents, metadatas)).encode("utf-8")
+                records.write(lines)
+                records_sha.update(lines)
+                count += len(ids)
+            if count == 0:
+                raise ValueError(f"The live version '{live['collection']}' is empty; nothing to export")
+
+        with open(tmp_path, "ab") as out, open(records_path, "rb") as records:
+            records_offset = out.tell()
+            while True:
+                chunk = records.read(_HASH_CHUNK)
+                if not chunk:
+                    break
+                out.write(chunk)
+            header = {
+                "format": 1,
+                "created_at": time.time(),
+                "embedding_model": os.getenv("EMBEDDING_MODEL"),
+                "dimension": dimension,
+                "count": count,
+                "dtype": "float32",
+                "collection": live["collection"],
+                "backend": live["backend"],
+                "sharded": live.get("sharded", False),
+                "vectors_offset": VECTORS_OFFSET,
+                "vectors_length": count * dimension * 4,
+                "vectors_sha256": vectors_sha.hexdigest(),
+                "records_offset": records_offset,
+                "records_length": out.tell() - records_offset,
+                "records_sha256": records_sha.hexdigest(),
+                "manifest": _read_manifest(),
+            }
+            encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            out.write(encoded)
+            out.write(_FOOTER.pack(len(encoded), MAGIC))
+        os.replace(tmp_path, path)
+    finally:
+        for leftover in (tmp_path, records_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return header
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size < VECTORS_OFFSET + _FOOTER.size:
+            raise ValueError(f"{path} is too small to be a snapshot")
+        f.seek(size - _FOOTER.size)
+        header_length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        f.seek(0)
+        if magic != MAGIC or f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an index snapshot")
+        f.seek(size - _FOOTER.size - header_length)
+        return json.loads(f.read(header_length).decode("utf-8"))
+
+
+def open_vectors(path: str, header: Dict[str, Any]) -> np.ndarray:
+    """The vector block, memory-mapped read-only: (count, dimension) float32 without loading the file."""
+    return np.memmap(path, dtype="<f4", mode="r", offset=header["vectors_offset"],
+                     shape=(header["count"], header["dimension"]))
+
+
+def verify_snapshot(path: str, header: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Check both block checksums; raises ValueError on a corrupt or truncated file."""
+    header = header or read_header(path)
+    with open(path, "rb") as f:
+        for block in ("vectors", "records"):
+            digest = hashlib.sha256()
+            f.seek(header[f"{block}_offset"])
+            remaining = header[f"{block}_length"]
+            while remaining:
+                chunk = f.read(min(remaining, _HASH_CHUNK))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            if remaining or digest.hexdigest() != header[f"{block}_sha256"]:
+                raise ValueError(f"{path}: {block} block is corrupt or truncated (checksum mismatch)")
+    return header
+
+
+def iter_snapshot(path: str, header: Dict[str, Any], batch_size: int) -> Iterator[Tuple[list, list, list, np.ndarray]]:
+    """(ids, documents, metadatas, vectors) batches, vectors as zero-copy slices of the memory map."""
+    vectors = open_vectors(path, header)
+    with open(path, "rb") as f:
+        f.seek(header["records_offset"])
+        end = header["records_offset"] + header["records_length"]
+        row = 0
+        while row < header["count"]:
+            ids: List[str] = []
+            documents: List[str] = []
+            metadatas: List[dict] = []
+            while len(ids) < batch_size and f.tell() < end:
+                record = json.loads(f.readline())
+                ids.append(record["id"])
+                documents.append(record["document"])
+                metadatas.append(record["metadata"])
+            if not ids:
+                raise ValueError(f"{path}: fewer records than vectors")
+            yield ids, documents, metadatas, vectors[row:row + len(ids)]
+            row += len(ids)
+
+
+def _restore_manifest(manifest: Dict[str, Any], version: Dict[str, Any]) -> None:
+    for name, path in _manifest_paths().items():
+        if name not in manifest:
+            continue
+        content = manifest[name]
+        if name == "ingest_checkpoint":
+            # --resume continues into the imported version
+            content = {**content, "target": version, "in_progress": None}
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(content, f)
+        os.replace(tmp_path, path)
+
+
+def import_snapshot(embeddings: Embeddings, path: Optional[str] = None, force: bool = False,
+                    batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Load a snapshot into a new index version and make it live; returns that version.
+    Raises ValueError for a corrupt or mismatched snapshot; a partly written version is dropped first.
+    """
+    path = path or get_snapshot_path()
+    header = verify_snapshot(path)
+    model = os.getenv("EMBEDDING_MODEL")
+    if header["embedding_model"] != model and not force:
+        raise ValueError(f"Snapshot vectors come from '{header['embedding_model']}' but EMBEDDING_MODEL is '{model}'; "
+                         f"queries would be embedded in a different space (pass --force to import anyway)")
+
+    target = {**new_version(), "sharded": header["sharded"]}
+    try:
+        store = open_version(embeddings, target)
+        for ids, documents, metadatas, vectors in iter_snapshot(path, header, batch_size):
+            write_records(store, ids, documents, metadatas, vectors)
+        target["vectors"] = count_vectors(store)
+        if target["vectors"] != header["count"]:
+            raise ValueError(f"Imported {target['vectors']} vectors, expected {header['count']}; "
+                             f"the live version is unchanged")
+    except BaseException:
+        # never leave a half-written version (vectors and index) behind
+        try:
+            drop_version(embeddings, target)
+        except Exception as e:
+            print(f"[WARN] Could not drop the partly imported version '{target['collection']}': {e}")
+        raise
+
+    swap_live(target)
+    _restore_manifest(header.get("manifest", {}), target)
+    bump_corpus_version()
+    collect_garbage(embeddings)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a snapshot of the vector index.")
+    parser.add_argument("command", choices=["export", "import", "verify"])
+    parser.add_argument("--path", default=None, help="Snapshot file (default: DATASET_STORAGE_FOLDER/SNAPSHOT_STORAGE_FILE)")
+    parser.add_argument("--force", action="store_true", help="Import even if the snapshot's embedding model differs")
+    args = parser.parse_args()
+    path = args.path or get_snapshot_path()
+
+    if args.command == "verify":
+        try:
+            header = verify_snapshot(path)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"{path}: OK, {header['count']} vectors x {header['dimension']} from '{header['embedding_model']}'")
+        return
+
+    from langchain_ollama import OllamaEmbeddings
+    embeddings = OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL"))
+    started = time.perf_counter()
+    if args.command == "export":
+        header = export_snapshot(embeddings, path)
+        print(f"Exported {header['count']} vectors of '{header['collection']}' to {path} "
+              f"({os.path.getsize(path) / 1e6:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    else:
+        try:
+            version = import_snapshot(embeddings, path, force=args.force)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"Imported {version['vectors']} vectors into '{version['collection']}' and made it live "
+              f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Blue/green versions of the vector index.
+
+A full rebuild writes a new versioned collection, "<COLLECTION_NAME>__v<timestamp>" (for on-disk Chroma in its
+own directory under DATABASE_LOCATION), while the chat app keeps searching the live one. Once the new version is
+validated, swap_live() atomically replaces the index pointer file (INDEX_POINTER_FILE); readers holding a
+vector_backend.LiveVectorStore switch on their next search. The previous version is retired and dropped by
+collect_garbage() once it has been drained for INDEX_DRAIN_SECONDS, i.e. no search can still be using it.
+
+Run from source_code/:
+    python index_versions.py status
+    python index_versions.py gc          # drop drained retired versions
+    python index_versions.py compact     # reclaim the space of deleted vectors
+    python index_versions.py rollback    # make the most recently retired version live again
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+try:
+    from sharding import ShardedVectorStore, get_shard_map_path
+    from vector_backend import (get_chroma_server_url, get_index_pointer_path, get_vector_backend, get_vector_store,
+                                read_index_pointer)
+except ModuleNotFoundError:
+    from source_code.sharding import ShardedVectorStore, get_shard_map_path
+    from source_code.vector_backend import (get_chroma_server_url, get_index_pointer_path, get_vector_backend,
+                                            get_vector_store, read_index_pointer)
+
+load_dotenv()
+
+
+def get_drain_seconds() -> float:
+    return float(os.getenv("INDEX_DRAIN_SECONDS", "600"))
+
+
+def get_min_ratio() -> float:
+    return float(os.getenv("INDEX_MIN_RATIO", "0.8"))
+
+
+def current_live(backend: Optional[str] = None) -> Dict[str, Any]:
+    """The live version, including the implicit one (COLLECTION_NAME in DATABASE_LOCATION) before the first swap."""
+    backend = backend or get_vector_backend()
+    pointer = read_index_pointer()
+    if pointer and pointer.get("live", {}).get("backend") == backend:
+        return pointer["live"]
+    return {"collection": os.getenv("COLLECTION_NAME"), "backend": backend, "persist_directory": None,
+            "sharded": bool(get_shard_map_path())}
+
+
+def new_version(backend: Optional[str] = None) -> Dict[str, Any]:
+    """Where the next full rebuild writes: a fresh collection (and, for Chroma, a fresh directory)."""
+    backend = backend or get_vector_backend()
+    collection = f"{os.getenv('COLLECTION_NAME')}__v{datetime.now():%Y%m%d%H%M%S}"
+    persist_directory = None
+    if backend == "chroma" and not get_chroma_server_url():
+        persist_directory = os.path.join(os.getenv("DATABASE_LOCATION") or "chroma_db", collection)
+    return {"collection": collection, "backend": backend, "persist_directory": persist_directory,
+            "sharded": bool(get_shard_map_path()), "created_at": time.time()}
+
+
+def open_version(embeddings: Embeddings, version: Dict[str, Any]) -> VectorStore:
+    return get_vector_store(embeddings, version["collection"], version["backend"], version.get("persist_directory"),
+                            sharded=version.get("sharded", False))
+
+
+def _physical_stores(store: VectorStore) -> List[VectorStore]:
+    if isinstance(store, ShardedVectorStore):
+        return [store.shard(name) for name in store.shard_map.all_shards()]
+    return [store]
+
+
+def count_vectors(store: VectorStore) -> int:
+    total = 0
+    for physical in _physical_stores(store):
+        # PgVectorStore.count(), or the underlying Chroma collection's
+        total += physical.count() if hasattr(physical, "count") else physical._collection.count()
+    return total
+
+
+def validate_version(embeddings: Embeddings, version: Dict[str, Any], probe: str,
+                     min_ratio: Optional[float] = None) -> List[str]:
+    """Problems that make the version unfit to go live (empty when it is fine)."""
+    min_ratio = get_min_ratio() if min_ratio is None else min_ratio
+    store = open_version(embeddings, version)
+    problems = []
+    count = count_vectors(store)
+    if count == 0:
+        return ["the new version is empty"]
+    live = current_live(version["backend"])
+    try:
+        live_count = count_vectors(open_version(embeddings, live))
+    except Exception as e:
+        print(f"[WARN] Could not count the live version '{live['collection']}': {e}")
+        live_count = 0
+    if live_count and count < min_ratio * live_count:
+        problems.append(f"{count} vectors, fewer than {min_ratio:.0%} of the live version's {live_count}")
+    if not store.similarity_search(probe, k=1):
+        problems.append("a probe search returned nothing")
+    version["vectors"] = count
+    return problems
+
+
+def _write_pointer(pointer: Dict[str, Any]) -> None:
+    path = get_index_pointer_path()
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(pointer, f, indent=2)
+    # Atomic on POSIX and Windows: a reader sees the old pointer or the new one, never a half-written file
+    os.replace(tmp_path, path)
+
+
+def swap_live(version: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Make version live and retire the previous live version; returns the retired version."""
+    pointer = read_index_pointer() or {"retired": []}
+    previous = current_live(version["backend"])
+    retired = [v for v in pointer.get("retired", []) if v["collection"] != version["collection"]]
+    if previous["collection"] != version["collection"]:
+        retired.append({**previous, "retired_at": time.time()})
+    _write_pointer({"live": {**version, "swapped_at": time.time()}, "retired": retired})
+    return previous
+
+
+def drop_version(embeddings: Embeddings, version: Dict[str, Any]) -> None:
+    open_version(embeddings, version).delete_collection()
+    # versioned Chroma collections have their own directory; the implicit one shares DATABASE_LOCATION
+    if version.get("persist_directory"):
+        shutil.rmtree(version["persist_directory"], ignore_errors=True)
+
+
+def collect_garbage(embeddings: Embeddings, drain_seconds: Optional[float] = None) -> List[str]:
+    """Drop the retired versions that have been out of service for drain_seconds; returns their collections."""
+    drain_seconds = get_drain_seconds() if drain_seconds is None else drain_seconds
+    pointer = read_index_pointer()
+    if not pointer:
+        return []
+    dropped = []
+    for version in pointer.get("retired", []):
+        if time.time() - version["retired_at"] < drain_seconds:
+            continue
+        try:
+            drop_version(embeddings, version)
+            dropped.append(version["collection"])
+        except Exception as e:
+            print(f"[WARN] Could not drop retired version '{version['collection']}': {e}")
+    if dropped:
+        # re-read: a swap may have happened while dropping
+        pointer = read_index_pointer() or pointer
+        pointer["retired"] = [v for v in pointer.get("retired", []) if v["collection"] not in dropped]
+        _write_pointer(pointer)
+    return dropped
+
+
+def iter_records(store: VectorStore, batch_size: int = 1000) -> Iterator[Tuple[list, list, list, Sequence]]:
+    """(ids, documents, metadatas, embeddings) batches of every vector in a version, shard by shard."""
+    for physical in _physical_stores(store):
+        if hasattr(physical, "iter_records"):
+            for rows in physical.iter_records(batch_size):
+                yield [r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows], [r[3] for r in rows]
+            continue
+        offset = 0
+        while True:
+            batch = physical._collection.get(include=["embeddings", "documents", "metadatas"],
+                                             limit=batch_size, offset=offset)
+            if not batch["ids"]:
+                break
+            yield batch["ids"], batch["documents"], batch["metadatas"], batch["embeddings"]
+            offset += len(batch["ids"])
+
+
+def write_records(store: VectorStore, ids: list, documents: list, metadatas: list, embeddings: Sequence) -> None:
+    """Store precomputed vectors (no re-embedding); a sharded version routes them by their "shard" metadata."""
+    if isinstance(store, ShardedVectorStore):
+        by_shard: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            metadata = metadata or {}
+            shard = metadata.get("shard") or store.shard_map.shard_for_source(metadata.get("source", ""))
+            by_shard.setdefault(shard, []).append(i)
+        for shard, rows in by_shard.items():
+            write_records(store.shard(shard), [ids[i] for i in rows], [documents[i] for i in rows],
+                          [metadatas[i] for i in rows], [embeddings[i] for i in rows])
+        return
+    if hasattr(store, "add_embeddings"):
+        store.add_embeddings(documents, [list(map(float, v)) for v in embeddings], metadatas, ids)
+    else:
+        # Chroma rejects empty metadata dicts
+        store._collection.upsert(ids=ids, embeddings=embeddings, documents=documents,
+                                 metadatas=[m or None for m in metadatas])
+
+
+def source_chunk_ids(store: VectorStore, source: str) -> List[str]:
+    """Ids of every chunk whose "source" metadata is source, in all shards of a version."""
+    ids: List[str] = []
+    for physical in _physical_stores(store):
+        if hasattr(physical, "ids_for_source"):
+            ids.extend(physical.ids_for_source(source))
+        else:
+            ids.extend(physical._collection.get(where={"source": source}, include=[])["ids"])
+    return ids
+
+
+def copy_version(embeddings: Embeddings, source: Dict[str, Any], target: Dict[str, Any], batch_size: int = 1000) -> int:
+    """Copy every vector of a version into another one, without re-embedding; returns the count."""
+    source_store, target_store = open_version(embeddings, source), open_version(embeddings, target)
+    copied = 0
+    for ids, documents, metadatas, vectors in iter_records(source_store, batch_size):
+        write_records(target_store, ids, documents, metadatas, vectors)
+        copied += len(ids)
+    return copied
+
+
+def compact(embeddings: Embeddings, backend: Optional[str] = None) -> None:
+    """
+    pgvector: VACUUM the embeddings table and rebuild its HNSW index in place.
+    Chroma: deleted vectors stay in the collection's files, so the live version is copied into a fresh one,
+    which is swapped in like a rebuild; the old one is garbage-collected once drained.
+    """
+    backend = backend or get_vector_backend()
+    live = current_live(backend)
+    if backend == "pgvector":
+        get_vector_store(embeddings, live["collection"], backend, sharded=False).compact()
+        print("Vacuumed personal_chat.rag_embeddings and rebuilt its HNSW index")
+        return
+    target = {**new_version(backend), "sharded": live.get("sharded", False)}
+    copied = copy_version(embeddings, live, target)
+    target["vectors"] = count_vectors(open_version(embeddings, target))
+    if target["vectors"] != copied:
+        raise SystemExit(f"Compacted copy has {target['vectors']} vectors, expected {copied}; live version unchanged")
+    swap_live(target)
+    print(f"Copied {copied} vectors into '{target['collection']}' and made it live")
+
+
+def rollback(backend: Optional[str] = None) -> Dict[str, Any]:
+    pointer = read_index_pointer()
+    candidates = [v for v in (pointer or {}).get("retired", []) if v["backend"] == (backend or get_vector_backend())]
+    if not candidates:
+        raise SystemExit("No retired version left to roll back to")
+    version = {k: v for k, v in candidates[-1].items() if k != "retired_at"}
+    swap_live(version)
+    return version
+
+
+def print_status() -> None:
+    pointer = read_index_pointer()
+    live = current_live()
+    print(f"Pointer: {get_index_pointer_path()}{'' if pointer else ' (none yet)'}")
+    print(f"Live:    {live['collection']} ({live['backend']}, {live.get('vectors', '?')} vectors)")
+    for version in (pointer or {}).get("retired", []):
+        age = time.time() - version["retired_at"]
+        state = "drained" if age >= get_drain_seconds() else f"draining, {get_drain_seconds() - age:.0f}s left"
+        print(f"Retired: {version['collection']} ({version['backend']}, {state})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and maintain the blue/green versions of the vector index.")
+    parser.add_argument("command", choices=["status", "gc", "compact", "rollback"])
+    parser.add_argument("--drain-seconds", type=float, default=None,
+                        help="With gc: minimum time a version has been retired before it is dropped (default INDEX_DRAIN_SECONDS)")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print_status()
+        return
+    if args.command == "rollback":
+        print(f"'{rollback()['collection']}' is live again")
+        return
+
+    from langchain_ollama import OllamaEmbeddings
+    embeddings = OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL"))
+    if args.command == "gc":
+        dropped = collect_garbage(embeddings, args.drain_seconds)
+        print(f"Dropped {len(dropped)} retired versions: {', '.join(dropped) or '-'}")
+    else:
+        compact(embeddings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+try:
+    from stats import summarize
+except ModuleNotFoundError:
+    from source_code.stats import summarize
+
+# Session on whose behalf the current thread is calling the models (set while a slot is held)
+current_session: ContextVar[str] = ContextVar("current_session", default="anonymous")
+
+
+class SchedulerBusyError(RuntimeError):
+    """Raised when the wait queue is full and a new request is turned away (backpressure)."""
+
+
+class _Ticket:
+    __slots__ = ("session_id", "enqueued_at", "granted")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+
+
+class LlmScheduler:
+    """
+    Limits the number of in-flight model calls and queues the rest.
+
+    Waiting requests are dispatched round-robin across sessions, so one session sending
+    many requests cannot starve the others. When more than max_queue requests are already
+    waiting, new ones are rejected with SchedulerBusyError instead of piling up.
+    """
+
+    def __init__(self, name: str, max_in_flight: int = 2, max_queue: int = 64):
+        self.name = name
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        self._in_flight = 0
+        self._queued = 0
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._max_queue_seen = 0
+        self._completed = 0
+        self._rejected = 0
+
+    # ---------- internal helpers (call with the lock held) ----------
+
+    def _dispatch(self) -> None:
+        granted = False
+        while self._in_flight < self.max_in_flight and self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            # Rotate: the session goes to the back of the line for its next request
+            del self._queues[session_id]
+            if queue:
+                self._queues[session_id] = queue
+            ticket.granted = True
+            self._queued -= 1
+            self._in_flight += 1
+            self._waits.append(time.perf_counter() - ticket.enqueued_at)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _position(self, ticket: _Ticket) -> int:
+        """1-based position of a waiting ticket in round-robin dispatch order."""
+        queue = self._queues.get(ticket.session_id)
+        if queue is None or ticket not in queue:
+            return 0
+        depth = queue.index(ticket)
+        position = 1
+        before_own = True
+        for session_id, other in self._queues.items():
+            if session_id == ticket.session_id:
+                before_own = False
+            # every full round ahead of ours dispatches one ticket per session that still has one
+            position += min(len(other), depth)
+            if before_own and len(other) > depth:
+                position += 1
+        return position
+
+    def _remove(self, ticket: _Ticket) -> None:
+        queue = self._queues.get(ticket.session_id)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            self._queued -= 1
+            if not queue:
+                del self._queues[ticket.session_id]
+
+    # ---------- public API ----------
+
+    @contextmanager
+    def slot(self, session_id: str, on_wait: Optional[Callable[[int], None]] = None, poll_interval: float = 0.5):
+        """
+        Hold one in-flight slot for the duration of the block.
+
+        on_wait(position) is called from the waiting thread (outside the lock) whenever the
+        queue position changes, so the caller can show it in the UI.
+        """
+        ticket = _Ticket(session_id)
+        with self._cond:
+            if self._in_flight >= self.max_in_flight and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise SchedulerBusyError(f"{self.name} queue is full ({self._queued} waiting)")
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            self._queued += 1
+            self._max_queue_seen = max(self._max_queue_seen, self._queued)
+            self._dispatch()
+
+        try:
+            last_position = None
+            while True:
+                with self._cond:
+                    if not ticket.granted:
+                        self._cond.wait(poll_interval)
+                    if ticket.granted:
+                        break
+                    position = self._position(ticket)
+                if on_wait and position != last_position:
+                    on_wait(position)
+                    last_position = position
+        except BaseException:
+            # Interrupted while waiting (e.g. a Streamlit rerun): give up the place or the slot
+            with self._cond:
+                if ticket.granted:
+                    self._in_flight -= 1
+                    self._dispatch()
+                else:
+                    self._remove(ticket)
+            raise
+
+        token = current_session.set(session_id)
+        try:
+            yield
+        finally:
+            current_session.reset(token)
+            with self._cond:
+                self._in_flight -= 1
+                self._completed += 1
+                self._dispatch()
+
+    def run(self, session_id: str, fn: Callable, *args, on_wait: Optional[Callable[[int], None]] = None, **kwargs):
+        with self.slot(session_id, on_wait=on_wait):
+            return fn(*args, **kwargs)
+
+    def metrics(self) -> Dict[str, object]:
+        with self._cond:
+            waits = list(self._waits)
+            return {
+                "name": self.name,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_seen,
+                "waiting_sessions": len(self._queues),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_seconds": summarize(waits),
+            }
+
+
+class ScheduledEmbeddings(Embeddings):
+    """Embeddings wrapper that routes every call through a scheduler on behalf of current_session."""
+
+    def __init__(self, inner: Embeddings, scheduler: LlmScheduler):
+        self.inner = inner
+        self.scheduler = scheduler
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.scheduler.run(current_session.get(), self.inner.embed_documents, texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.scheduler.run(current_session.get(), self.inner.embed_query, text)
+
+
+_schedulers: Dict[str, LlmScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> LlmScheduler:
+    """
+    Process-wide scheduler per backend ("chat" or "embed"), shared by all Streamlit sessions.
+    Limits come from <NAME>_MAX_IN_FLIGHT / <NAME>_MAX_QUEUE, e.g. CHAT_MAX_IN_FLIGHT.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            prefix = name.upper()
+            scheduler = LlmScheduler(
+                name,
+                max_in_flight=int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", "2")),
+                max_queue=int(os.getenv(f"{prefix}_MAX_QUEUE", "64")),
+            )
+            _schedulers[name] = scheduler
+        return scheduler
+
+
+def all_metrics() -> List[Dict[str, object]]:
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [s.metrics() for s in schedulers]
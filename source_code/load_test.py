@@ -0,0 +1,249 @@
+"""
+Headless load test of the chat flow: for each concurrency level, N simulated sessions each send a number of
+questions through the same calls render_chatbot_app makes per turn (append_history, answer_question,
+append_history, _persist_exchange_to_db), and the run reports throughput, latency percentiles and error rates.
+
+By default the models are served by the in-process stub Ollama server (ollama_stub_server.py) and chat_history
+inserts go to an in-memory fake with a configurable latency; use --ollama-host / --db postgres for real services.
+
+Run from source_code/, e.g.:
+    python load_test.py --concurrency 1,5,20,100 --turns 5 --llm-latency 0.5
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from embedding_gateway import start_gateway
+from ollama_stub_server import start_stub_server
+from stats import summarize
+from tracing import load_spans, stage_summary
+
+TOPICS = ["revenue", "valuation", "cap table", "board seats", "liquidation preference", "vesting", "dividends",
+          "pro rata rights", "warrants", "convertible notes", "SAFE terms", "drag-along", "exit timeline"]
+
+
+class FakeChatHistoryStore:
+    """Stands in for crud.create_chat_history: sleeps like a DB round trip and keeps rows in memory."""
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def create_chat_history(self, payload) -> int:
+        time.sleep(self.latency_seconds)
+        with self._lock:
+            self.rows += 1
+        return 1
+
+
+class CountingWriter:
+    """Wraps create_chat_history to count failures the chat page itself swallows."""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, payload) -> int:
+        try:
+            rows = self.inner(payload)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        if rows == 0:
+            with self._lock:
+                self.failures += 1
+        return rows
+
+
+def make_question(session_index: int, turn: int, question_pool: int, level: int = 0) -> str:
+    if question_pool > 0:
+        n = random.randrange(question_pool)
+        return f"What does the memo say about {TOPICS[n % len(TOPICS)]} (question {n})?"
+    # the level keeps "all unique" questions unique across runs too (e.g. for the gateway's embedding cache)
+    return f"Run {level}, session {session_index}, turn {turn}: what does the memo say about {random.choice(TOPICS)}?"
+
+
+def run_level(chat, concurrency: int, turns: int, think_time: float, question_pool: int,
+              writer: CountingWriter) -> Dict[str, Any]:
+    """Run `concurrency` sessions of `turns` questions each, all starting together."""
+    latencies: List[float] = []
+    outcomes = {"ok": 0, "cached": 0, "busy": 0, "error": 0}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(concurrency + 1)
+    failures_before = writer.failures
+
+    def session(session_index: int) -> None:
+        scheduler_session_id = str(uuid4())
+        chat_id = str(uuid4())
+        messages: list = []
+        start_barrier.wait()
+        for turn in range(turns):
+            question = make_question(session_index, turn, question_pool, concurrency)
+            request_id = str(uuid4())
+            started = time.perf_counter()
+            try:
+                with chat.trace_request(request_id), chat.span("request"):
+                    messages.append(chat.HumanMessage(question))
+                    with chat.span("append_history", role="user"):
+                        chat.append_history("user", question, request_id, chat_id=chat_id, chat_name="load test")
+                    answer, cached = chat.answer_question(question, messages, chat_id, session_id=scheduler_session_id)
+                    messages.append(chat.AIMessage(answer))
+                    with chat.span("append_history", role="assistant"):
+                        chat.append_history("assistant", answer, request_id, chat_id=chat_id, chat_name="load test")
+                    with chat.span("persist_db"):
+                        chat._persist_exchange_to_db(question, answer)
+                if answer == chat.BUSY_MESSAGE:
+                    outcome = "busy"
+                elif answer.startswith(chat.ERROR_MESSAGE_PREFIX):
+                    outcome = "error"
+                else:
+                    outcome = "cached" if cached else "ok"
+            except Exception as e:
+                print(f"[WARN] session {session_index} turn {turn} failed: {e}")
+                outcome = "error"
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                outcomes[outcome] += 1
+            if think_time:
+                time.sleep(random.uniform(0, 2 * think_time))
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - started
+
+    total = sum(outcomes.values())
+    return {
+        "concurrency": concurrency,
+        "turns": total,
+        "duration_seconds": duration,
+        "throughput_per_second": total / duration if duration else 0.0,
+        "latency_seconds": summarize(latencies),
+        "outcomes": outcomes,
+        "error_rate": outcomes["error"] / total if total else 0.0,
+        "busy_rate": outcomes["busy"] / total if total else 0.0,
+        "db_failures": writer.failures - failures_before,
+    }
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print(f"{'sessions':>8}{'turns':>7}{'turns/s':>9}{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'max s':>8}"
+          f"{'errors':>8}{'busy':>7}{'cached':>8}{'db fail':>9}")
+    for r in results:
+        lat = r["latency_seconds"]
+        print(f"{r['concurrency']:>8}{r['turns']:>7}{r['throughput_per_second']:>9.2f}{lat['p50']:>8.2f}"
+              f"{lat['p95']:>8.2f}{lat['p99']:>8.2f}{lat['max']:>8.2f}{100 * r['error_rate']:>7.1f}%"
+              f"{100 * r['busy_rate']:>6.1f}%{r['outcomes']['cached']:>8}{r['db_failures']:>9}")
+        stages = ", ".join(f"{name} p95 {s['p95']:.0f}ms" for name, s in r["stages_ms"].items() if name != "request")
+        print(f"{'':>8}  {stages}")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load-test the chat flow with concurrent simulated sessions.")
+    parser.add_argument("--concurrency", default="1,5,20,50,100", help="Comma-separated session counts to run in turn")
+    parser.add_argument("--turns", type=int, default=5, help="Questions per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a session's questions (s)")
+    parser.add_argument("--question-pool", type=int, default=0,
+                        help="Draw questions from this many distinct ones (exercises the answer cache); 0 = all unique")
+    parser.add_argument("--ollama-host", help="Use this Ollama server instead of the in-process stub")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub chat latency per call (s)")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="Stub extra latency per generated word (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Stub embedding latency per call (s)")
+    parser.add_argument("--gateway", action="store_true",
+                        help="Send query embeddings through an in-process embedding gateway (batching, dedup, cache)")
+    parser.add_argument("--db", choices=("fake", "postgres"), default="fake",
+                        help="Persist exchanges to an in-memory fake or to the configured Postgres")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Fake DB insert latency (s)")
+    parser.add_argument("--seed-docs", type=int, default=50, help="Synthetic chunks loaded into a scratch collection")
+    parser.add_argument("--json", help="Also write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    # Everything the chat page writes goes to a scratch directory; env vars must be set before it is imported
+    workdir = tempfile.mkdtemp(prefix="chat_load_test_")
+    server = None
+    if args.ollama_host:
+        os.environ["OLLAMA_HOST"] = args.ollama_host
+    else:
+        server, _state, base_url = start_stub_server(
+            load_seconds=0.0, latency_seconds=args.llm_latency, embed_latency_seconds=args.embed_latency,
+            token_latency_seconds=args.llm_token_latency, embedding_dim=int(os.getenv("EMBEDDING_DIM", "1024")))
+        os.environ["OLLAMA_HOST"] = base_url
+        os.environ["MODEL_PROVIDER"] = "ollama"
+        os.environ.setdefault("CHAT_MODEL", "stub-chat")
+        os.environ.setdefault("EMBEDDING_MODEL", "stub-embed")
+    gateway = None
+    if args.gateway:
+        gateway, gateway_batcher, gateway_url = start_gateway(upstream=os.environ["OLLAMA_HOST"])
+        os.environ["EMBEDDING_GATEWAY_URL"] = gateway_url
+    else:
+        os.environ["EMBEDDING_GATEWAY_URL"] = ""
+    os.environ["CHAT_HISTORY_FILE"] = os.path.join(workdir, "chat_history.jsonl")
+    os.environ["DATABASE_LOCATION"] = os.path.join(workdir, "chroma_db")
+    os.environ["COLLECTION_NAME"] = "load_test"
+    os.environ["INDEX_POINTER_FILE"] = os.path.join(workdir, "chroma_db.index.json")
+
+    from pages import launch_chatbot as chat
+
+    # the stub has no load time to hide; heartbeats would only add noise
+    chat.model_keeper.stop()
+    chat.agent_executor.verbose = False
+    if args.seed_docs:
+        chat.vector_store.get().add_texts(
+            [f"Memo {i}: notes on {TOPICS[i % len(TOPICS)]} for portfolio company {i}." for i in range(args.seed_docs)],
+            metadatas=[{"source": f"memo_{i}.pdf", "title": f"memo {i}"} for i in range(args.seed_docs)],
+        )
+    fake_store = FakeChatHistoryStore(args.db_latency) if args.db == "fake" else None
+    writer = CountingWriter(fake_store.create_chat_history if fake_store else chat.create_chat_history)
+    chat.create_chat_history = writer
+
+    results = []
+    try:
+        for level in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            os.environ["TRACE_FILE"] = os.path.join(workdir, f"traces_{level}.jsonl")
+            # the answer cache is process-wide: without this, a level would hit answers from the ones before it
+            chat.answer_cache.clear()
+            result = run_level(chat, level, args.turns, args.think_time, args.question_pool, writer)
+            result["stages_ms"] = stage_summary(load_spans(limit=1_000_000, path=os.environ["TRACE_FILE"]))
+            result["schedulers"] = chat.all_metrics()
+            if gateway is not None:
+                result["gateway"] = gateway_batcher.metrics()
+            results.append(result)
+            print(f"... {level} sessions: {result['throughput_per_second']:.2f} turns/s, "
+                  f"p95 {result['latency_seconds']['p95']:.2f}s")
+    finally:
+        if gateway is not None:
+            gateway_batcher.stop()
+            gateway.shutdown()
+        if server is not None:
+            server.shutdown()
+
+    print_report(results)
+    if gateway is not None:
+        metrics = results[-1]["gateway"] if results else gateway_batcher.metrics()
+        print(f"Embedding gateway: {metrics['texts']} texts, {metrics['cache_hits']} cache hits, "
+              f"{metrics['deduplicated']} deduplicated, {metrics['embedded']} embedded in "
+              f"{metrics['batch_size']['count']} batches (mean size {metrics['batch_size']['mean']:.1f})")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Wrote results to {args.json}")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,44 +3,48 @@
 #################################################################################################################################################################
 
 from dotenv import load_dotenv
+import argparse
+import hashlib
+import itertools
 import os
 import json
 import pandas as pd
-from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
 from langchain_ollama import OllamaEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from uuid import uuid4
-import shutil
 import time
 
+from answer_cache import bump_corpus_version
+from chunking import chunk_id, get_chunker_name, get_text_splitter
+from embedding_gateway import get_gateway_url
+from index_versions import (collect_garbage, current_live, new_version, open_version, source_chunk_ids, swap_live,
+                            validate_version)
+from profiling import StageProfiler, add_profile_arguments, profiling_session
+from vector_backend import get_vector_store
+
 
 load_dotenv()
 
-###############################   INITIALIZE EMBEDDINGS MODEL  #################################################################################################
 
-embeddings = OllamaEmbeddings(
-    model=os.getenv("EMBEDDING_MODEL"),
-)
+class ProfiledEmbeddings(Embeddings):
+    """Embeddings wrapper that books embedding calls under the "embed" stage, so the vector store write is timed on its own."""
+
+    def __init__(self, inner: Embeddings, profiler: StageProfiler):
+        self.inner = inner
+        self.profiler = profiler
 
-###############################   DELETE CHROMA DB IF EXISTS AND INITIALIZE   ##################################################################################
+    def embed_documents(self, texts):
+        with self.profiler.stage("embed"):
+            return self.inner.embed_documents(texts)
 
-if os.path.exists(os.getenv("DATABASE_LOCATION")):
-    shutil.rmtree(os.getenv("DATABASE_LOCATION"))
+    def embed_query(self, text):
+        with self.profiler.stage("embed"):
+            return self.inner.embed_query(text)
 
-vector_store = Chroma(
-    collection_name=os.getenv("COLLECTION_NAME"),
-    embedding_function=embeddings,
-    persist_directory=os.getenv("DATABASE_LOCATION"), 
-)
 
 ###############################   INITIALIZE TEXT SPLITTER   ###################################################################################################
 
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len,
-    is_separator_regex=False,
-)
+# CHUNKER=structured (the default) respects pages, headings and paragraphs and records offsets; "recursive" is the old splitter
+text_splitter = get_text_splitter()
 
 #################################################################################################################################################################
 ###############################   2.  PROCESSING THE JSON RESPONSE LINE BY LINE   ###############################################################################
@@ -50,65 +54,430 @@ text_splitter = RecursiveCharacterTextSplitter(
 
 
 
+_READ_SIZE = 1 << 20
+
+
+class _MappingReader:
+    """
+    Streams the (key, value) pairs of a top-level JSON object whose values are strings, e.g. the
+    {file_name: content} corpus of read_pdf_from_local.py: only the current value is held in memory.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+
+    def _more(self) -> int:
+        """Append the next chunk, dropping what was consumed; returns how far the buffer shifted (-1 at EOF)."""
+        chunk = self.f.read(_READ_SIZE)
+        if not chunk:
+            return -1
+        shift = self.pos
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return shift
+
+    def _peek(self) -> str:
+        """Next non-whitespace character ("" at EOF), not consumed."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self._more() < 0:
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        c = self._peek()
+        if not c or c not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return c
+
+    def _string(self) -> str:
+        self._expect('"')
+        self.pos -= 1  # keep the opening quote in the buffer
+        scan = self.pos + 1
+        while True:
+            end = self.buf.find('"', scan)
+            if end < 0:
+                shift = self._more()
+                if shift < 0:
+                    raise json.JSONDecodeError("Unterminated string", self.buf, self.pos)
+                scan -= shift
+                continue
+            backslashes = 0
+            while self.buf[end - 1 - backslashes] == "\\":
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            scan = end + 1
+        value = json.loads(self.buf[self.pos:end + 1])
+        self.pos = end + 1
+        return value
+
+    def __iter__(self):
+        self._expect("{")
+        if self._peek() == "}":
+            return
+        while True:
+            key = self._string()
+            self._expect(":")
+            yield key, self._string()
+            if self._expect(",}") == "}":
+                return
+
+
+def iter_dataset(file_path: str):
+    """
+    Records of the corpus, read incrementally so that only one document is in memory at a time:
+    a {name: content} JSON mapping (what read_pdf_from_local.py writes), JSON Lines, or a JSON list of records.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        first_line = f.readline().strip()
+        try:
+            first = json.loads(first_line) if first_line else None
+        except json.JSONDecodeError:
+            first = None
+        rest = f.readline()
+        while rest and not rest.strip():
+            rest = f.readline()
+        if isinstance(first, dict) and rest:
+            # JSON Lines: one record per line
+            yield first
+            lines = [rest]
+        else:
+            f.seek(0)
+            head = f.read(1)
+            while head and head.isspace():
+                head = f.read(1)
+            f.seek(0)
+            if head == "{":
+                # If it's a mapping {name: content}
+                for k, v in _MappingReader(f):
+                    title = os.path.splitext(os.path.basename(k))[0]
+                    yield {
+                        "url": k,
+                        "title": title,
+                        "raw_text": v,
+                    }
+                return
+            if head == "[":
+                # If it's already a list of objects (e.g., Bright Data export)
+                yield from json.load(f)
+                return
+            lines = []
+        # Fallback to JSONL parsing
+        for line in itertools.chain(lines, f):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Skip malformed lines
+                continue
+
+
 def load_dataset(file_path: str):
     """Load dataset supporting both full-file JSON (dict or list) and JSON Lines (JSONL)."""
-    # Try full-file JSON first
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        # If it's a mapping {name: content}
-        if isinstance(data, dict):
-            items = []
-            for k, v in data.items():
-                title = os.path.splitext(os.path.basename(k))[0]
-                items.append({
-                    "url": k,
-                    "title": title,
-                    "raw_text": v,
-                })
-            return items
-        # If it's already a list of objects (e.g., Bright Data export)
-        if isinstance(data, list):
-            return data
-        return []
-    except json.JSONDecodeError:
-        # Fallback to JSONL parsing
-        items = []
-        with open(file_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                    items.append(obj)
-                except json.JSONDecodeError:
-                    # Skip malformed lines
-                    continue
-        return items
+    return list(iter_dataset(file_path))
+
 
-input_folder = os.getenv("DATASET_STORAGE_FOLDER") or "datasets"
-input_file = os.getenv("DATASET_STORAGE_FILE_NAME") or "data.txt"
-input_path = os.path.join(input_folder, input_file)
-file_content = load_dataset(input_path)
+def default_input_path() -> str:
+    input_folder = os.getenv("DATASET_STORAGE_FOLDER") or "datasets"
+    input_file = os.getenv("DATASET_STORAGE_FILE_NAME") or "data.txt"
+    return os.path.join(input_folder, input_file)
 
 
 #################################################################################################################################################################
 ###############################   3.  CHUNKING, EMBEDDING AND INGESTION   #######################################################################################
 ##################################################################################################################################################################
 
-for line in file_content:
+def get_checkpoint_path() -> str:
+    return os.getenv("INGEST_CHECKPOINT_FILE") or f"{os.getenv('DATABASE_LOCATION') or 'chroma_db'}.ingest_checkpoint.json"
+
+
+def get_quarantine_path() -> str:
+    return os.getenv("INGEST_QUARANTINE_FILE") or f"{os.getenv('DATABASE_LOCATION') or 'chroma_db'}.quarantine.jsonl"
+
+
+def run_settings() -> dict:
+    """What the vector store contents depend on; a checkpoint is only resumable under the same settings."""
+    return {
+        "vector_backend": os.getenv("VECTOR_BACKEND") or "chroma",
+        "collection": os.getenv("COLLECTION_NAME"),
+        "embedding_model": os.getenv("EMBEDDING_MODEL"),
+        # the settings get_text_splitter() built text_splitter from
+        "chunker": get_chunker_name(),
+        "chunk_size": int(os.getenv("CHUNK_SIZE", "1000")),
+        "chunk_overlap": int(os.getenv("CHUNK_OVERLAP", "200")),
+    }
+
+
+class IngestCheckpoint:
+    """
+    Progress of an ingestion run, saved periodically (atomically) so --resume can pick it up.
+
+    completed:   record source -> content hash, for records whose chunks are all in the vector store
+    in_progress: the record being loaded and how many of its batches are already in the vector store
+    quarantined: record source -> content hash and last error, for records that kept failing
+    chunk_ids:   record source -> ids of its chunks that may be in the vector store, recorded before each write,
+                 so the chunks of a record's previous content (or of a failed load) can be deleted
+    target:      the index version a full rebuild writes to (index_versions.new_version), swapped in at the end
+    Chunk ids are derived from the content, so anything re-done after a crash is upserted, not duplicated.
+    """
+
+    def __init__(self, path: str, settings: dict, every_seconds: float):
+        self.path = path
+        self.settings = settings
+        self.every_seconds = every_seconds
+        self.completed = {}
+        self.in_progress = None
+        self.quarantined = {}
+        self.chunk_ids = {}
+        # whether chunk_ids covers every chunk written to the collection; when not (no checkpoint, or one
+        # saved before chunk ids were tracked), a record's previous chunks are looked up by source
+        self.tracks_chunks = True
+        self.target = None
+        self._last_saved = time.monotonic()
+
+    @classmethod
+    def load(cls, path: str, settings: dict, every_seconds: float) -> "IngestCheckpoint":
+        checkpoint = cls(path, settings, every_seconds)
+        if not os.path.exists(path):
+            print(f"No checkpoint at {path}; loading every record into the existing collection")
+            checkpoint.tracks_chunks = False
+            return checkpoint
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("settings") != settings:
+            raise SystemExit(
+                f"Checkpoint {path} was written with different settings ({saved.get('settings')}); "
+                f"run without --resume to rebuild."
+            )
+        checkpoint.completed = saved.get("completed", {})
+        checkpoint.in_progress = saved.get("in_progress")
+        checkpoint.quarantined = saved.get("quarantined", {})
+        checkpoint.chunk_ids = saved.get("chunk_ids", {})
+        checkpoint.tracks_chunks = "chunk_ids" in saved
+        checkpoint.target = saved.get("target")
+        return checkpoint
+
+    def save(self) -> None:
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "settings": self.settings,
+                "saved_at": time.time(),
+                "completed": self.completed,
+                "in_progress": self.in_progress,
+                "quarantined": self.quarantined,
+                "chunk_ids": self.chunk_ids,
+                "target": self.target,
+            }, f)
+        os.replace(tmp_path, self.path)
+        self._last_saved = time.monotonic()
+
+    def maybe_save(self) -> None:
+        if time.monotonic() - self._last_saved >= self.every_seconds:
+            self.save()
+
+    def batches_done(self, source: str, content_hash: str) -> int:
+        if self.in_progress and self.in_progress["source"] == source and self.in_progress["hash"] == content_hash:
+            return self.in_progress["batches_done"]
+        return 0
+
+
+def quarantine(source: str, content_hash: str, batch_index: int, error: Exception, checkpoint: IngestCheckpoint) -> None:
+    checkpoint.quarantined[source] = {"hash": content_hash, "batch": batch_index, "error": str(error)}
+    folder = os.path.dirname(get_quarantine_path())
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(get_quarantine_path(), "a", encoding="utf-8") as f:
+        f.write(json.dumps({"ts": time.time(), "source": source, "hash": content_hash, "batch": batch_index,
+                            "error": f"{type(error).__name__}: {error}"}, ensure_ascii=False) + "\n")
+
+
+def drop_record_chunks(vector_store, source: str, checkpoint: IngestCheckpoint) -> None:
+    """Delete every chunk recorded for a record (e.g. the partial batches of a quarantined one); retried next run on failure."""
+    ids = checkpoint.chunk_ids.get(source)
+    if not ids:
+        return
+    try:
+        vector_store.delete(ids=ids)
+        checkpoint.chunk_ids.pop(source, None)
+    except Exception as e:
+        print(f"[WARN] Could not delete the {len(ids)} chunks of '{source}': {e}")
+
+
+def add_batch_with_retries(vector_store, documents, ids, max_retries: int, retry_backoff: float) -> None:
+    """add_documents, retried up to max_retries times with exponential backoff (e.g. while Ollama restarts)."""
+    for attempt in range(max_retries + 1):
+        try:
+            vector_store.add_documents(documents=documents, ids=ids)
+            return
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * (2 ** attempt)
+            print(f"[WARN] Batch failed ({e}); retry {attempt + 1}/{max_retries} in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def finish_rebuild(embeddings, target: dict, probe: str, force_swap: bool = False) -> None:
+    """Validate the freshly built version, make it live and drop old versions that are drained by now."""
+    problems = validate_version(embeddings, target, probe)
+    if problems and not force_swap:
+        raise SystemExit(
+            f"Not swapping in '{target['collection']}': {'; '.join(problems)}. The live version is unchanged; "
+            f"fix the input and re-run with --resume, or pass --force-swap."
+        )
+    previous = swap_live(target)
+    print(f"'{target['collection']}' is live ({target['vectors']} vectors); '{previous['collection']}' retired")
+    dropped = collect_garbage(embeddings)
+    if dropped:
+        print(f"Dropped drained versions: {', '.join(dropped)}")
+
+
+def ingest(input_path: str, profiler: StageProfiler, resume: bool = False, batch_size: int = 64,
+           max_retries: int = 3, retry_backoff: float = 2.0, checkpoint_every: float = 30.0,
+           retry_quarantined: bool = False, force_swap: bool = False) -> None:
+
+    ###############################   INITIALIZE EMBEDDINGS MODEL  #############################################################################################
+
+    # through the shared embedding gateway when EMBEDDING_GATEWAY_URL is set, else straight to Ollama
+    embeddings = ProfiledEmbeddings(OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL"), base_url=get_gateway_url()), profiler)
+
+    ###############################   INITIALIZE THE VECTOR STORE VERSION TO WRITE   ##########################################################################
+
+    # Chroma or pgvector, per VECTOR_BACKEND. A full rebuild writes a new version while the live one keeps
+    # serving the chat app; it is swapped in once complete and validated (see index_versions.py)
+    if resume:
+        checkpoint = IngestCheckpoint.load(get_checkpoint_path(), run_settings(), checkpoint_every)
+        target = checkpoint.target
+        vector_store = open_version(embeddings, target) if target else get_vector_store(embeddings)
+        print(f"Resuming: {len(checkpoint.completed)} records already loaded, {len(checkpoint.quarantined)} quarantined")
+    else:
+        checkpoint = IngestCheckpoint(get_checkpoint_path(), run_settings(), checkpoint_every)
+        checkpoint.target = target = new_version()
+        vector_store = open_version(embeddings, target)
+        checkpoint.save()
+        print(f"Building '{target['collection']}'; '{current_live()['collection']}' stays live until it is complete")
+    probe = None
+
+    # records are streamed from the corpus file: memory holds the current document, not the whole corpus
+    file_content = iter_dataset(input_path)
+
+    try:
+        for line in file_content:
+
+            url = line.get('url') or line.get('source') or line.get('file') or 'unknown'
+            title = line.get('title') or os.path.basename(url)
+            raw_text = line.get('raw_text') or line.get('content') or line.get('text') or ''
+            if not raw_text:
+                continue
+
+            content_hash = hashlib.sha256(raw_text.encode("utf-8")).hexdigest()
+            if checkpoint.completed.get(url) == content_hash:
+                continue
+            quarantined = checkpoint.quarantined.get(url)
+            if quarantined and quarantined["hash"] == content_hash and not retry_quarantined:
+                # left over when the deletion failed along with the load
+                drop_record_chunks(vector_store, url, checkpoint)
+                continue
+
+            print(url)
+
+            with profiler.stage("split", item=url):
+                texts = text_splitter.create_documents([raw_text], metadatas=[{"source": url, "title": title}])
+            if texts and probe is None:
+                probe = texts[0].page_content
+
+            # deterministic ids: batches re-done after a crash overwrite themselves instead of duplicating
+            ids = [chunk_id(url, i, doc.page_content) for i, doc in enumerate(texts)]
+            previous = checkpoint.chunk_ids.get(url)
+            if previous is None and not checkpoint.tracks_chunks:
+                with profiler.stage("find_previous_chunks", item=url):
+                    previous = source_chunk_ids(vector_store, url)
+            written = set(previous or [])
+
+            first_batch = checkpoint.batches_done(url, content_hash)
+            checkpoint.in_progress = {"source": url, "hash": content_hash, "batches_done": first_batch}
+            batch_starts = list(range(0, len(texts), batch_size))
+            failed = False
+            for batch_index in range(first_batch, len(batch_starts)):
+                start = batch_starts[batch_index]
+                # recorded before the write, so a crash part-way still leaves them known
+                written.update(ids[start:start + batch_size])
+                checkpoint.chunk_ids[url] = sorted(written)
+                try:
+                    # embedding happens inside add_documents and is booked separately under "embed"
+                    with profiler.stage("vector_write", item=url):
+                        add_batch_with_retries(vector_store, texts[start:start + batch_size], ids[start:start + batch_size],
+                                               max_retries, retry_backoff)
+                except Exception as e:
+                    print(f"[WARN] Quarantining '{url}' after {max_retries + 1} failed attempts on batch {batch_index}: {e}")
+                    quarantine(url, content_hash, batch_index, e, checkpoint)
+                    failed = True
+                    break
+                checkpoint.in_progress["batches_done"] = batch_index + 1
+                checkpoint.maybe_save()
+
+            checkpoint.in_progress = None
+            if failed:
+                # a partially loaded record would answer with half a document: it stays out until it loads fully
+                checkpoint.completed.pop(url, None)
+                drop_record_chunks(vector_store, url, checkpoint)
+            else:
+                # chunks of the record's previous content; deleted after the upsert so readers never miss the record
+                stale = written - set(ids)
+                if stale:
+                    vector_store.delete(ids=sorted(stale))
+                checkpoint.chunk_ids[url] = ids
+                checkpoint.completed[url] = content_hash
+                checkpoint.quarantined.pop(url, None)
+            checkpoint.maybe_save()
+    finally:
+        checkpoint.save()
+
+    if checkpoint.quarantined:
+        print(f"{len(checkpoint.quarantined)} records quarantined, see {get_quarantine_path()} "
+              f"(re-run with --resume --retry-quarantined once fixed)")
+
+    if target and target["collection"] != current_live(target["backend"])["collection"]:
+        with profiler.stage("swap"):
+            finish_rebuild(embeddings, target, probe or "document", force_swap)
+
+    # new and changed chunks are now visible to the chat app: invalidate answers cached against the old ones
+    bump_corpus_version()
 
-    url = line.get('url') or line.get('source') or line.get('file') or 'unknown'
-    title = line.get('title') or os.path.basename(url)
-    raw_text = line.get('raw_text') or line.get('content') or line.get('text') or ''
-    if not raw_text:
-        continue
 
-    print(url)
+def main():
+    parser = argparse.ArgumentParser(description="Chunk, embed and load the extracted corpus into the vector store.")
+    parser.add_argument("--input", default=default_input_path(),
+                        help="Corpus written by read_pdf_from_local.py (default: DATASET_STORAGE_FOLDER/DATASET_STORAGE_FILE_NAME)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the last checkpoint instead of rebuilding the collection from scratch")
+    parser.add_argument("--retry-quarantined", action="store_true", help="With --resume, retry quarantined records too")
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks embedded and written per batch")
+    parser.add_argument("--max-retries", type=int, default=3, help="Retries of a failed batch before its record is quarantined")
+    parser.add_argument("--retry-backoff", type=float, default=2.0, help="Seconds before the first retry, doubled each time")
+    parser.add_argument("--force-swap", action="store_true",
+                        help="Make the rebuilt version live even if it fails validation (empty, much smaller than the live one)")
+    parser.add_argument("--checkpoint-every", type=float, default=30.0, help="Seconds between checkpoint writes")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
 
-    texts = text_splitter.create_documents([raw_text], metadatas=[{"source": url, "title": title}])
+    with profiling_session(args) as profiler:
+        ingest(args.input, profiler, resume=args.resume, batch_size=args.batch_size, max_retries=args.max_retries,
+               retry_backoff=args.retry_backoff, checkpoint_every=args.checkpoint_every,
+               retry_quarantined=args.retry_quarantined, force_swap=args.force_swap)
 
-    uuids = [str(uuid4()) for _ in range(len(texts))]
 
-    vector_store.add_documents(documents=texts, ids=uuids)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+try:
+    from ollama_stub_server import parse_keep_alive, start_stub_server
+except ModuleNotFoundError:
+    from source_code.ollama_stub_server import parse_keep_alive, start_stub_server
+
+load_dotenv()
+
+
+def get_ollama_base_url() -> str:
+    """Base URL of the Ollama server, honouring OLLAMA_HOST the same way the ollama client does."""
+    host = os.getenv("OLLAMA_HOST") or "http://localhost:11434"
+    if "://" not in host:
+        host = f"http://{host}"
+    return host.rstrip("/")
+
+
+def get_keep_alive() -> str:
+    return os.getenv("OLLAMA_KEEP_ALIVE") or "30m"
+
+
+def uses_ollama_chat() -> bool:
+    """Whether the chat model is served by Ollama (MODEL_PROVIDER, case-insensitive, defaults to ollama)."""
+    return (os.getenv("MODEL_PROVIDER") or "ollama").strip().lower() == "ollama"
+
+
+def keep_alive_seconds(value: Optional[str] = None) -> int:
+    """keep_alive as whole seconds (-1 = forever), for clients that only accept an int."""
+    seconds = parse_keep_alive(value or get_keep_alive())
+    return -1 if seconds == float("inf") else int(seconds)
+
+
+def post_json(url: str, payload: dict, timeout: float) -> dict:
+    """POST payload as JSON to an Ollama endpoint and return the (last) JSON object of the response."""
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        # /api/generate streams NDJSON by default; the last line carries the final status
+        lines = [line for line in resp.read().decode("utf-8").splitlines() if line.strip()]
+    return json.loads(lines[-1]) if lines else {}
+
+
+class ModelKeeper:
+    """
+    Pre-loads the chat and embedding models into the Ollama server and keeps them resident.
+
+    Ollama unloads an idle model once its keep_alive expires, and the next question then pays
+    the full load time. An empty generate/embed request loads a model without producing output,
+    and re-sending it every heartbeat_seconds (shorter than keep_alive) keeps it loaded.
+    """
+
+    def __init__(self, chat_model: Optional[str], embedding_model: Optional[str], base_url: Optional[str] = None,
+                 keep_alive: Optional[str] = None, heartbeat_seconds: float = 240.0, timeout: float = 600.0):
+        self.chat_model = chat_model
+        self.embedding_model = embedding_model
+        self.base_url = base_url or get_ollama_base_url()
+        self.keep_alive = keep_alive or get_keep_alive()
+        self.heartbeat_seconds = heartbeat_seconds
+        self.timeout = timeout
+        self.last_warm_seconds: Dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "ModelKeeper":
+        # Only the chat model is served by Ollama when MODEL_PROVIDER is ollama; embeddings always are
+        return cls(
+            chat_model=os.getenv("CHAT_MODEL") if uses_ollama_chat() else None,
+            embedding_model=os.getenv("EMBEDDING_MODEL"),
+            heartbeat_seconds=float(os.getenv("OLLAMA_HEARTBEAT_SECONDS", "240")),
+        )
+
+    def warm_chat(self) -> float:
+        started = time.perf_counter()
+        post_json(f"{self.base_url}/api/generate",
+                  {"model": self.chat_model, "prompt": "", "keep_alive": self.keep_alive}, self.timeout)
+        return time.perf_counter() - started
+
+    def warm_embedding(self) -> float:
+        started = time.perf_counter()
+        post_json(f"{self.base_url}/api/embed",
+                  {"model": self.embedding_model, "input": "", "keep_alive": self.keep_alive}, self.timeout)
+        return time.perf_counter() - started
+
+    def warm_all(self) -> Dict[str, float]:
+        """Load (or refresh) every configured model; returns seconds per model. Errors are logged, not raised."""
+        timings: Dict[str, float] = {}
+        for model, warm in ((self.chat_model, self.warm_chat), (self.embedding_model, self.warm_embedding)):
+            if not model:
+                continue
+            try:
+                timings[model] = warm()
+            except Exception as e:
+                print(f"[WARN] Could not warm model '{model}' at {self.base_url}: {e}")
+        self.last_warm_seconds.update(timings)
+        return timings
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.warm_all()
+            self._stop.wait(self.heartbeat_seconds)
+
+    def start(self) -> None:
+        """Warm up in the background and keep sending heartbeats; safe to call more than once."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ollama-model-keeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_model_keeper: Optional[ModelKeeper] = None
+_model_keeper_lock = threading.Lock()
+
+
+def get_model_keeper() -> ModelKeeper:
+    """
+    Process-wide keeper, created and started on first use. Streamlit re-executes the page script on every
+    rerun, so a keeper created there would start another heartbeat thread each time.
+    """
+    global _model_keeper
+    with _model_keeper_lock:
+        if _model_keeper is None:
+            _model_keeper = ModelKeeper.from_env()
+            _model_keeper.start()
+        return _model_keeper
+
+
+def _timed_chat(base_url: str, model: str, keep_alive: str) -> float:
+    started = time.perf_counter()
+    post_json(f"{base_url}/api/chat",
+              {"model": model, "messages": [{"role": "user", "content": "hello"}], "keep_alive": keep_alive},
+              timeout=60)
+    return time.perf_counter() - started
+
+
+def measure_against_stub(load_seconds: float, latency_seconds: float, keep_alive: str = "2s") -> Dict[str, float]:
+    """
+    Cold vs warm first-question latency against a local stub server:
+      cold      - first question with nothing loaded
+      warm      - immediate follow-up question
+      idle      - first question after keep_alive expired (no keeper)
+      prewarmed - first question after keep_alive expired, with ModelKeeper heartbeats running
+    """
+    server, _state, base_url = start_stub_server(load_seconds=load_seconds, latency_seconds=latency_seconds)
+    model = "stub-chat"
+    idle_wait = parse_keep_alive(keep_alive) + 0.5
+    try:
+        results = {"cold": _timed_chat(base_url, model, keep_alive)}
+        results["warm"] = _timed_chat(base_url, model, keep_alive)
+        time.sleep(idle_wait)
+        results["idle"] = _timed_chat(base_url, model, keep_alive)
+
+        time.sleep(idle_wait)
+        keeper = ModelKeeper(model, None, base_url=base_url, keep_alive=keep_alive,
+                             heartbeat_seconds=parse_keep_alive(keep_alive) / 2)
+        keeper.start()
+        while model not in keeper.last_warm_seconds:
+            time.sleep(0.05)
+        time.sleep(idle_wait)
+        results["prewarmed"] = _timed_chat(base_url, model, keep_alive)
+        keeper.stop()
+        return results
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the configured Ollama models or measure cold/warm latency.")
+    parser.add_argument("--measure", action="store_true",
+                        help="Measure cold-start vs warm latency against a local stub server instead")
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="Stub model load time (with --measure)")
+    parser.add_argument("--latency-seconds", type=float, default=0.2, help="Stub per-request latency (with --measure)")
+    args = parser.parse_args()
+
+    if args.measure:
+        for label, seconds in measure_against_stub(args.load_seconds, args.latency_seconds).items():
+            print(f"{label:>10}: {seconds * 1000:8.1f} ms")
+    else:
+        keeper = ModelKeeper.from_env()
+        for model_name, seconds in keeper.warm_all().items():
+            print(f"Warmed {model_name} in {seconds:.2f}s (keep_alive={keeper.keep_alive})")
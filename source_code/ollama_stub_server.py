@@ -0,0 +1,242 @@
+"""
+Minimal stand-in for the Ollama HTTP API, for latency experiments and load tests.
+
+It speaks just enough of /api/generate, /api/chat, /api/embed, /api/embeddings, /api/ps and
+/api/tags for langchain_ollama clients, with configurable per-request latency and a simulated
+model load time that is paid again once a model's keep-alive expires.
+
+Run standalone with: python ollama_stub_server.py --port 11435 --load-seconds 3
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_KEEP_ALIVE_SECONDS = 300.0
+
+
+def parse_keep_alive(value, default: float = DEFAULT_KEEP_ALIVE_SECONDS) -> float:
+    """Ollama keep_alive semantics: seconds or a duration string ("30s", "5m", "1h"); negative keeps forever."""
+    if value is None or value == "":
+        return default
+    if isinstance(value, (int, float)):
+        return math.inf if value < 0 else float(value)
+    match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*", str(value))
+    if not match:
+        return default
+    amount = float(match.group(1))
+    unit = match.group(2) or "s"
+    seconds = amount * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return math.inf if seconds < 0 else seconds
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit vector derived from the text, so equal texts embed identically."""
+    values: List[float] = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend((b - 127.5) / 127.5 for b in digest)
+        counter += 1
+    values = values[:dim]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class StubState:
+    """Loaded models and their expiry times, shared by all handler threads."""
+
+    def __init__(self, load_seconds: float, latency_seconds: float, embed_latency_seconds: float,
+                 token_latency_seconds: float, embedding_dim: int):
+        self.load_seconds = load_seconds
+        self.latency_seconds = latency_seconds
+        self.embed_latency_seconds = embed_latency_seconds
+        self.token_latency_seconds = token_latency_seconds
+        self.embedding_dim = embedding_dim
+        self.loaded: Dict[str, float] = {}
+        self.requests = 0
+        self.cold_loads = 0
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Event] = {}
+
+    def ensure_loaded(self, model: str, keep_alive) -> float:
+        """Block for the load time if the model is not resident; returns the load time paid."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            expires = self.loaded.get(model)
+            resident = expires is not None and expires > now
+            loading = self._loading.get(model)
+            if not resident and loading is None:
+                loading = threading.Event()
+                self._loading[model] = loading
+                owner = True
+            else:
+                owner = False
+        paid = 0.0
+        if not resident:
+            if owner:
+                time.sleep(self.load_seconds)
+                with self._lock:
+                    self.cold_loads += 1
+                    del self._loading[model]
+                loading.set()
+                paid = self.load_seconds
+            else:
+                started = time.monotonic()
+                loading.wait()
+                paid = time.monotonic() - started
+        with self._lock:
+            self.loaded[model] = time.monotonic() + parse_keep_alive(keep_alive)
+        return paid
+
+    def loaded_models(self) -> List[Tuple[str, float]]:
+        now = time.monotonic()
+        with self._lock:
+            return [(m, exp - now) for m, exp in self.loaded.items() if exp > now]
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None  # type: ignore[assignment]
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # keep load tests quiet
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_ndjson(self, lines: List[dict]) -> None:
+        body = b"".join(json.dumps(line).encode("utf-8") + b"\n" for line in lines)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            models = [{"name": m, "model": m, "expires_in_seconds": round(ttl, 1)} for m, ttl in self.state.loaded_models()]
+            self._send_json({"models": models})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": m, "model": m} for m, _ttl in self.state.loaded_models()]})
+        else:
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def do_POST(self):
+        req = self._read_json()
+        model = req.get("model") or "stub"
+        load_paid = self.state.ensure_loaded(model, req.get("keep_alive"))
+        load_ns = int(load_paid * 1e9)
+
+        if self.path == "/api/generate":
+            prompt = req.get("prompt") or ""
+            if prompt:
+                time.sleep(self.state.latency_seconds)
+            reply = f"Stub completion for: {prompt[:60]}" if prompt else ""
+            payload = {"model": model, "created_at": _now_iso(), "response": reply, "done": True,
+                       "done_reason": "stop" if prompt else "load", "load_duration": load_ns}
+            if req.get("stream", True):
+                self._send_ndjson([payload])
+            else:
+                self._send_json(payload)
+        elif self.path == "/api/chat":
+            messages = req.get("messages") or []
+            last_user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+            words = f"Stub answer to: {last_user[:80]}".split() if messages else []
+            time.sleep(self.state.latency_seconds + self.state.token_latency_seconds * len(words))
+            final = {"model": model, "created_at": _now_iso(), "message": {"role": "assistant", "content": ""},
+                     "done": True, "done_reason": "stop" if messages else "load", "load_duration": load_ns,
+                     "prompt_eval_count": sum(len(str(m.get("content", ""))) // 4 for m in messages),
+                     "eval_count": len(words)}
+            if req.get("stream", True):
+                chunks = [{"model": model, "created_at": _now_iso(),
+                           "message": {"role": "assistant", "content": w + " "}, "done": False} for w in words]
+                self._send_ndjson(chunks + [final])
+            else:
+                final["message"]["content"] = " ".join(words)
+                self._send_json(final)
+        elif self.path in ("/api/embed", "/api/embeddings"):
+            texts = req.get("input", req.get("prompt", ""))
+            texts = [texts] if isinstance(texts, str) else list(texts)
+            time.sleep(self.state.embed_latency_seconds)
+            vectors = [fake_embedding(t, self.state.embedding_dim) for t in texts]
+            if self.path == "/api/embed":
+                self._send_json({"model": model, "embeddings": vectors, "load_duration": load_ns})
+            else:
+                self._send_json({"embedding": vectors[0] if vectors else []})
+        else:
+            self._send_json({"error": f"unsupported endpoint {self.path}"}, status=404)
+
+
+def start_stub_server(host: str = "127.0.0.1", port: int = 0, load_seconds: float = 2.0,
+                      latency_seconds: float = 0.2, embed_latency_seconds: float = 0.02,
+                      token_latency_seconds: float = 0.0, embedding_dim: int = 1024
+                      ) -> Tuple[ThreadingHTTPServer, StubState, str]:
+    """Start the stub in a daemon thread; returns (server, state, base_url). port=0 picks a free port."""
+    state = StubState(load_seconds, latency_seconds, embed_latency_seconds, token_latency_seconds, embedding_dim)
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="ollama-stub", daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run a stub Ollama API server for latency and load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--load-seconds", type=float, default=2.0, help="Simulated cold model load time")
+    parser.add_argument("--latency-seconds", type=float, default=0.2, help="Fixed latency per chat/generate call")
+    parser.add_argument("--embed-latency-seconds", type=float, default=0.02, help="Latency per embed call")
+    parser.add_argument("--token-latency-seconds", type=float, default=0.0, help="Extra latency per generated word")
+    parser.add_argument("--embedding-dim", type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    server, _state, base_url = start_stub_server(
+        args.host, args.port, args.load_seconds, args.latency_seconds,
+        args.embed_latency_seconds, args.token_latency_seconds, args.embedding_dim,
+    )
+    print(f"Stub Ollama server listening on {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,16 @@ except ModuleNotFoundError:
 
 try:
     from crud import (
-        list_chat_groups,
+        list_chat_groups_page,
+        get_group_cache_stats,
         create_chat_group,
         update_chat_group,
         delete_chat_group,
     )
 except ModuleNotFoundError:
     from ..crud import (
-        list_chat_groups,
+        list_chat_groups_page,
+        get_group_cache_stats,
         create_chat_group,
         update_chat_group,
         delete_chat_group,
@@ -39,6 +41,9 @@ def render_chat_groups_page():
     # Inline editing state
     if "edit_group_id" not in st.session_state:
         st.session_state.edit_group_id = None
+    # Keyset paging state: ("after" | "before", cursor) or None for the first page
+    if "cg_page" not in st.session_state:
+        st.session_state.cg_page = None
 
     # Submenu
     left, right = st.columns([1, 5])
@@ -46,7 +51,8 @@ def render_chat_groups_page():
         action_cg = st.radio("Action", ["List", "Create"], index=0, key="cg_action_tab")
         active_only = None
         if action_cg == "List":
-            active_only = st.checkbox("Show only active", value=False, key="cg_active_only")
+            active_only = st.checkbox("Show only active", value=False, key="cg_active_only",
+                                      on_change=lambda: st.session_state.update(cg_page=None))
 
     with right:
         if action_cg == "Create":
@@ -74,8 +80,27 @@ def render_chat_groups_page():
                 else:
                     st.error("Failed to create group. Check logs and DB connectivity.")
         else:
-            st.subheader("Chat Groups (max 50)")
-            groups = list_chat_groups(active_only=bool(active_only))[:50]
+            st.subheader("Chat Groups (50 per page)")
+            direction, cursor = st.session_state.cg_page or (None, None)
+            page = list_chat_groups_page(
+                limit=50,
+                after=cursor if direction == "after" else None,
+                before=cursor if direction == "before" else None,
+                active_only=bool(active_only),
+            )
+            groups = page.items
+            if not groups and st.session_state.cg_page is not None:
+                # the page emptied (e.g. rows deleted); start over from the first page
+                st.session_state.cg_page = None
+                st.rerun()
+
+            prev_col, next_col, _ = st.columns([1, 1, 6])
+            if prev_col.button("◀ Previous", key="cg_prev", disabled=page.prev_cursor is None):
+                st.session_state.cg_page = ("before", page.prev_cursor)
+                st.rerun()
+            if next_col.button("Next ▶", key="cg_next", disabled=page.next_cursor is None):
+                st.session_state.cg_page = ("after", page.next_cursor)
+                st.rerun()
 
             st.markdown('<div style="max-height:500px; overflow-y:auto;">', unsafe_allow_html=True)
 
@@ -139,3 +164,10 @@ def render_chat_groups_page():
                         st.rerun()
 
             st.markdown('</div>', unsafe_allow_html=True)
+
+            cache = get_group_cache_stats()
+            st.caption(
+                f"Group cache: {cache['hits']} hits / {cache['misses']} misses "
+                f"({cache['hit_ratio']:.0%} hit ratio), {cache['entries']} entries, "
+                f"{cache['invalidations']} invalidations, TTL {cache['ttl_seconds']:.0f}s"
+            )
@@ -1,3 +1,7 @@
+import csv
+import os
+import tempfile
+
 import streamlit as st
 
 # Robust imports to work whether running as a package or script
@@ -8,19 +12,63 @@ except ModuleNotFoundError:
 
 try:
     from crud import (
-        list_chat_history,
+        list_chat_groups,
+        list_chat_history_page,
+        search_chat_history,
+        iter_chat_history,
         create_chat_history,
         update_chat_history,
         delete_chat_history,
     )
 except ModuleNotFoundError:
     from source_code.crud import (
-        list_chat_history,
+        list_chat_groups,
+        list_chat_history_page,
+        search_chat_history,
+        iter_chat_history,
         create_chat_history,
         update_chat_history,
         delete_chat_history,
     )
 
+try:
+    from async_crud import load_history_page_with_groups
+    from config.pg_async_conn_manager import async_db_available, run_async
+except ModuleNotFoundError:
+    from source_code.async_crud import load_history_page_with_groups
+    from source_code.config.pg_async_conn_manager import async_db_available, run_async
+
+
+EXPORT_COLUMNS = ["id", "user_id", "user_inquiry", "assistant_response", "reference_id", "chat_group_id", "created_ts"]
+
+
+def export_chat_history_csv(batch_size: int = 2000) -> tuple[str, int]:
+    """Write the whole chat history to a temporary CSV file, one batch at a time; returns (path, rows)."""
+    exported = 0
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", prefix="chat_history_", suffix=".csv",
+                                     delete=False) as f:
+        try:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            for batch in iter_chat_history(batch_size=batch_size):
+                writer.writerows(
+                    [r.id, r.user_id, r.user_inquiry, r.assistant_response, r.reference_id,
+                     r.chat_group_id, r.created_ts.isoformat()]
+                    for r in batch
+                )
+                exported += len(batch)
+        except BaseException:
+            f.close()
+            os.remove(f.name)
+            raise
+    return f.name, exported
+
+
+def _remove_export_file() -> None:
+    path = st.session_state.pop("ch_export_path", None)
+    if path and os.path.exists(path):
+        os.remove(path)
+
 
 def render_chat_history_page():
     # Flash banner (shared via session_state)
@@ -39,10 +87,16 @@ def render_chat_history_page():
     # Inline editing state
     if "edit_history_id" not in st.session_state:
         st.session_state.edit_history_id = None
+    # Keyset paging state: ("after" | "before", (created_ts, id)) or None for the newest page
+    if "ch_page" not in st.session_state:
+        st.session_state.ch_page = None
+    # Search paging state: stack of (rank, id) cursors, one per page visited
+    if "ch_search_cursors" not in st.session_state:
+        st.session_state.ch_search_cursors = []
 
     left, right = st.columns([1, 5])
     with left:
-        action_ch = st.radio("Action", ["List", "Create"], index=0, key="ch_action_tab")
+        action_ch = st.radio("Action", ["List", "Create", "Export"], index=0, key="ch_action_tab")
 
     with right:
         if action_ch == "Create":
@@ -71,9 +125,71 @@ def render_chat_history_page():
                     st.rerun()
                 else:
                     st.error("Failed to create record")
+        elif action_ch == "Export":
+            st.subheader("Export Chat History")
+            st.caption("Streams the full table through a server-side cursor in batches into a temporary CSV file.")
+            if st.button("Prepare CSV", key="ch_export_prepare"):
+                _remove_export_file()
+                st.session_state.ch_export_path, st.session_state.ch_export_count = export_chat_history_csv()
+            export_path = st.session_state.get("ch_export_path")
+            if export_path and os.path.exists(export_path):
+                # only the path is kept in session state; the file is read when the button is rendered
+                with open(export_path, "rb") as f:
+                    st.download_button(
+                        f"Download {st.session_state.get('ch_export_count', 0)} records (CSV)",
+                        data=f,
+                        file_name="chat_history.csv",
+                        mime="text/csv",
+                        key="ch_export_download",
+                    )
         else:
-            st.subheader("Chat History (max 50)")
-            records = list_chat_history(limit=50)
+            search_query = st.text_input(
+                "Search conversations",
+                key="ch_search",
+                placeholder='Words, "exact phrase", -exclude',
+                on_change=lambda: st.session_state.update(ch_search_cursors=[]),
+            ).strip()
+
+            if search_query:
+                st.subheader("Search results (best match first)")
+                cursors = st.session_state.ch_search_cursors
+                result = search_chat_history(search_query, limit=50, after=cursors[-1] if cursors else None)
+                records, groups_by_id = result.items, {}
+                if not records:
+                    st.info("No matching conversations.")
+
+                prev_col, next_col, _ = st.columns([1, 1, 6])
+                if prev_col.button("◀ Previous", key="ch_search_prev", disabled=not cursors):
+                    st.session_state.ch_search_cursors = cursors[:-1]
+                    st.rerun()
+                if next_col.button("Next ▶", key="ch_search_next", disabled=result.next_cursor is None):
+                    st.session_state.ch_search_cursors = cursors + [result.next_cursor]
+                    st.rerun()
+            else:
+                st.subheader("Chat History (50 per page, newest first)")
+                direction, cursor = st.session_state.ch_page or (None, None)
+                after = cursor if direction == "after" else None
+                before = cursor if direction == "before" else None
+                if async_db_available():
+                    # history page and group names are fetched concurrently
+                    page, groups_by_id = run_async(load_history_page_with_groups(limit=50, after=after, before=before))
+                else:
+                    # without psycopg3, one query after the other; group reads come from crud's cache
+                    page = list_chat_history_page(limit=50, after=after, before=before)
+                    groups_by_id = {g.id: g for g in list_chat_groups()}
+                records = page.items
+                if not records and st.session_state.ch_page is not None:
+                    # the page emptied (e.g. rows deleted); start over from the first page
+                    st.session_state.ch_page = None
+                    st.rerun()
+
+                newer_col, older_col, _ = st.columns([1, 1, 6])
+                if newer_col.button("◀ Newer", key="ch_newer", disabled=page.prev_cursor is None):
+                    st.session_state.ch_page = ("before", page.prev_cursor)
+                    st.rerun()
+                if older_col.button("Older ▶", key="ch_older", disabled=page.next_cursor is None):
+                    st.session_state.ch_page = ("after", page.next_cursor)
+                    st.rerun()
 
             st.markdown('<div style="max-height:500px; overflow-y:auto;">', unsafe_allow_html=True)
 
@@ -122,7 +238,9 @@ def render_chat_history_page():
                         st.rerun()
                 else:
                     c2.write(r.user_id)
-                    c3.write(r.chat_group_id or "-")
+                    group = groups_by_id.get(r.chat_group_id)
+                    c3.write(f"{r.chat_group_id} · {group.group_name}" if group and group.group_name
+                             else (r.chat_group_id or "-"))
                     c4.write((r.user_inquiry or "")[0:80] + ("…" if len(r.user_inquiry or "") > 80 else ""))
                     c5.write((r.assistant_response or "")[0:80] + ("…" if len(r.assistant_response or "") > 80 else ""))
                     c6.write(r.reference_id or "-")
@@ -11,66 +11,106 @@ from dotenv import load_dotenv
 from langchain.agents import AgentExecutor
 from langchain.agents import create_tool_calling_agent
 from langchain.chat_models import init_chat_model
-from langchain_chroma import Chroma
 from langchain_core.messages import AIMessage, HumanMessage
 from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import tool
 from langchain_ollama import OllamaEmbeddings
 
+try:
+    from answer_cache import get_answer_cache
+    from embedding_gateway import get_gateway_url
+    from llm_scheduler import SchedulerBusyError, ScheduledEmbeddings, all_metrics, current_session, get_scheduler
+    from model_warmup import get_keep_alive, get_model_keeper, keep_alive_seconds, uses_ollama_chat
+    from sharding import current_chat_group
+    from tracing import LlmSpanCallback, span, trace_request
+    from vector_backend import LiveVectorStore
+except ModuleNotFoundError:
+    from source_code.answer_cache import get_answer_cache
+    from source_code.embedding_gateway import get_gateway_url
+    from source_code.llm_scheduler import SchedulerBusyError, ScheduledEmbeddings, all_metrics, current_session, get_scheduler
+    from source_code.model_warmup import get_keep_alive, get_model_keeper, keep_alive_seconds, uses_ollama_chat
+    from source_code.sharding import current_chat_group
+    from source_code.tracing import LlmSpanCallback, span, trace_request
+    from source_code.vector_backend import LiveVectorStore
+
 # load environment variables
 load_dotenv()
 
 ###############################   INITIALIZE EMBEDDINGS MODEL  #################################################################################################
 
-embeddings = OllamaEmbeddings(
-    model=os.getenv("EMBEDDING_MODEL"),
+# every embedding call (query embedding for retrieval) goes through the shared embed scheduler, and through the
+# embedding gateway shared with other chat processes and ingestion when EMBEDDING_GATEWAY_URL is set
+embeddings = ScheduledEmbeddings(
+    OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL"), keep_alive=keep_alive_seconds(), base_url=get_gateway_url()),
+    get_scheduler("embed"),
 )
 
-###############################   INITIALIZE CHROMA VECTOR STORE   #############################################################################################
+###############################   INITIALIZE VECTOR STORE   ####################################################################################################
 
-vector_store = Chroma(
-    collection_name=os.getenv("COLLECTION_NAME"),
-    embedding_function=embeddings,
-    persist_directory=os.getenv("DATABASE_LOCATION"),
-)
+# Chroma or pgvector, per VECTOR_BACKEND; sharded per chat group when SHARD_MAP_FILE is set.
+# vector_store.get() follows the index pointer, so a rebuild swapped in by the ingestion script is picked up live
+vector_store = LiveVectorStore(embeddings)
 
 ###############################   INITIALIZE CHAT MODEL   #######################################################################################################
 
+_chat_model_kwargs = {"keep_alive": get_keep_alive()} if uses_ollama_chat() else {}
 llm = init_chat_model(
     os.getenv("CHAT_MODEL"),
     model_provider=os.getenv("MODEL_PROVIDER"),
-    temperature=0
+    temperature=0,
+    **_chat_model_kwargs,
 )
 
-# pulling prompt from hub
-prompt = PromptTemplate.from_template("""
+# load the models now and keep them resident, so the first question after an idle period does not pay the load time;
+# one keeper per process, however often Streamlit re-runs this script
+model_keeper = get_model_keeper()
+
+# The static instructions come first and the per-turn parts last, so consecutive turns share an
+# identical prompt prefix that the model server can reuse instead of re-processing it every time.
+# The chat history only grows at its end, which extends the reusable prefix across turns.
+SYSTEM_PROMPT_PREFIX = """
 You are a helpful assistant. You will be provided with a user query and the chat history.
 
 You MAY use the 'retrieve' tool to fetch relevant information from the vector store when it is helpful.
 If the question is general-knowledge or the retriever does not return anything useful, answer from your own knowledge without using the tool.
 
-The query is:
-{input}
+Be concise and informative. If after reasoning you truly don't know, say "I don't know".
+
+Citations policy:
+- If you used retrieved content in your final answer, add a line at the end: "Source: <source_url>".
+- If you did NOT use retrieved content, do NOT add any Source line.
+"""
 
+prompt = PromptTemplate.from_template(SYSTEM_PROMPT_PREFIX + """
 The chat history is:
 {chat_history}
 
-Be concise and informative. If after reasoning you truly don't know, say "I don't know".
+The query is:
+{input}
 
 Use the scratchpad for intermediate reasoning or notes:
 {agent_scratchpad}
+""")
 
-Citations policy:
-- If you used retrieved content in your final answer, add a line at the end: "Source: <source_url>".
-- If you did NOT use retrieved content, do NOT add any Source line.
-""" )
+
+RETRIEVAL_K = 2
+
+
+def search_documents(query: str) -> list:
+    """Embed the query and search the vector store, as two separately traced stages."""
+    with span("embed"):
+        query_vector = embeddings.embed_query(query)
+    with span("search", k=RETRIEVAL_K) as search_span:
+        docs = vector_store.get().similarity_search_by_vector(query_vector, k=RETRIEVAL_K)
+        search_span["hits"] = len(docs)
+    return docs
 
 
 # creating the retriever tool
 @tool
 def retrieve(query: str):
     """Retrieve information related to a query."""
-    retrieved_docs = vector_store.similarity_search(query, k=2)
+    retrieved_docs = search_documents(query)
 
     serialized = ""
 
@@ -89,6 +129,52 @@ agent = create_tool_calling_agent(llm, tools, prompt)
 # create the agent executor
 agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
 
+# records an "llm" span for every model call made by the agent
+llm_span_callback = LlmSpanCallback()
+
+BUSY_MESSAGE = "The assistant is busy right now, please try again in a moment."
+ERROR_MESSAGE_PREFIX = "Sorry, something went wrong while generating a response."
+
+# answers shared by all sessions of this process; invalidated when the ingestion script bumps the corpus version
+answer_cache = get_answer_cache()
+
+
+def answer_question(user_question: str, chat_history: list, chat_id: str | None = None,
+                    session_id: str = "anonymous", on_wait=None, chat_group_id: int | None = None) -> tuple[str, bool]:
+    """Run the agent for a question, serving repeated questions from the answer cache.
+    The agent run holds a slot of the shared chat scheduler; on_wait(position) is called while queued.
+    Retrieval is limited to the shards of chat_group_id (all shards when None).
+    Returns (answer, cached).
+    """
+    current_session.set(session_id)
+    current_chat_group.set(chat_group_id)
+    # keyed before retrieval: a hit costs no embedding or search, and the corpus version covers re-ingestion
+    cache_key = answer_cache.make_key(user_question, os.getenv("CHAT_MODEL") or "", chat_history,
+                                      scope=None if chat_group_id is None else str(chat_group_id))
+    cached_answer = answer_cache.get(cache_key)
+    if cached_answer is not None:
+        return cached_answer, True
+
+    try:
+        with span("agent"):
+            result = get_scheduler("chat").run(
+                session_id,
+                agent_executor.invoke,
+                {"input": user_question, "chat_history": chat_history, "chat_id": chat_id},
+                config={"callbacks": [llm_span_callback]},
+                on_wait=on_wait,
+            )
+        ai_message = result.get("output", "")
+    except SchedulerBusyError:
+        return BUSY_MESSAGE, False
+    except Exception as e:
+        return f"{ERROR_MESSAGE_PREFIX} ({e})", False
+
+    if not ai_message:
+        return "I don't know.", False
+    answer_cache.put(cache_key, ai_message)
+    return ai_message, False
+
 
 # ===== Chat history persistence helpers =====
 
@@ -193,20 +279,18 @@ except ModuleNotFoundError:
     crud_mod = importlib.import_module("source_code.crud")
 ChatHistoryCreate = getattr(models_mod, "ChatHistoryCreate")
 create_chat_history = getattr(crud_mod, "create_chat_history")
+list_chat_groups = getattr(crud_mod, "list_chat_groups")
 
 
 def _persist_exchange_to_db(user_inquiry: str, assistant_response: str,
                             user_id: int = 1, reference_id: int | None = None,
                             chat_group_id: int | None = None) -> None:
     """Best-effort insert of a prompt/response pair into personal_chat.chat_history.
-    Generates a bigint-like id based on current UTC time in milliseconds.
+    The id is left to crud, which assigns a collision-free Snowflake id (config.id_generator).
     Fails silently (logs via st.warning) to avoid breaking the UI if DB is down.
     """
     try:
-        # Millisecond epoch as increasing bigint id
-        new_id = int(datetime.utcnow().timestamp() * 1000)
         payload = ChatHistoryCreate(
-            id=new_id,
             user_id=user_id,
             user_inquiry=user_inquiry,
             assistant_response=assistant_response,
@@ -262,6 +346,8 @@ def render_chatbot_app(use_internal_sidebar: bool = False):
         st.session_state.loaded_chat_id = None
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "scheduler_session_id" not in st.session_state:
+        st.session_state.scheduler_session_id = str(uuid4())
 
     # Chat sessions panel: in embedded mode, place it in a left column; otherwise use Streamlit's sidebar
     if use_internal_sidebar:
@@ -303,6 +389,31 @@ def render_chatbot_app(use_internal_sidebar: bool = False):
         # Rename current chat (kept in state, persisted on next message write)
         st.text_input("Chat name", key="current_chat_name", value=st.session_state.get("current_chat_name", "New Chat"))
 
+        # Chat group: scopes document search to the group's shards and is stored with each exchange
+        try:
+            groups = list_chat_groups(active_only=True)
+        except Exception:
+            groups = []
+        if groups:
+            group_ids = [None] + [g.id for g in groups]
+            group_names = {g.id: g.group_name or f"Group {g.id}" for g in groups}
+            current_group = st.session_state.get("current_chat_group_id")
+            st.session_state.current_chat_group_id = st.selectbox(
+                "Chat group",
+                group_ids,
+                index=group_ids.index(current_group) if current_group in group_ids else 0,
+                format_func=lambda gid: "All groups" if gid is None else group_names[gid],
+            )
+
+        # Shared model queue (all sessions of this app process)
+        with st.expander("Model queue", expanded=False):
+            for m in all_metrics():
+                st.caption(
+                    f"{m['name']}: {m['in_flight']}/{m['max_in_flight']} in flight, {m['queue_depth']} queued "
+                    f"(max {m['max_queue_depth']}), wait p95 {m['wait_seconds']['p95']:.2f}s, "
+                    f"{m['completed']} done, {m['rejected']} rejected"
+                )
+
     # Ensure current session messages are loaded once per session selection
     if st.session_state.loaded_chat_id != st.session_state.current_chat_id:
         st.session_state.messages = load_session_messages(records, st.session_state.current_chat_id)
@@ -342,6 +453,8 @@ def render_chatbot_app(use_internal_sidebar: bool = False):
             elif isinstance(message, AIMessage):
                 with st.chat_message("assistant"):
                     st.markdown(message.content)
+                    if message.response_metadata.get("cached"):
+                        st.caption("⚡ cached")
         st.markdown("</div>", unsafe_allow_html=True)
 
         # Input box uses current chat name for friendliness and is kept at the bottom of the page
@@ -353,24 +466,33 @@ def render_chatbot_app(use_internal_sidebar: bool = False):
             chat_id = st.session_state.current_chat_id
             chat_name = st.session_state.current_chat_name
 
-            # Persist the user message first (do not render inline below the input)
-            st.session_state.messages.append(HumanMessage(user_question))
-            append_history("user", user_question, request_id, chat_id=chat_id, chat_name=chat_name)
-
-            # Invoke the agent using only this session's history
-            try:
-                result = agent_executor.invoke(
-                    {"input": user_question, "chat_history": st.session_state.messages, "chat_id": chat_id})
-                ai_message = result.get("output", "")
-                if not ai_message:
-                    ai_message = "I don't know."
-            except Exception as e:
-                ai_message = f"Sorry, something went wrong while generating a response. ({e})"
-
-            # Persist the assistant message and DB record
-            st.session_state.messages.append(AIMessage(ai_message))
-            append_history("assistant", ai_message, request_id, chat_id=chat_id, chat_name=chat_name)
-            _persist_exchange_to_db(user_question, ai_message)
+            queue_notice = st.empty()
+
+            def _show_queue_position(position: int) -> None:
+                queue_notice.info(f"⏳ Waiting for the model… you are number {position} in the queue.")
+
+            # every stage of this turn is traced under its request_id (see the Settings page)
+            with trace_request(request_id), span("request") as request_span:
+                # Persist the user message first (do not render inline below the input)
+                st.session_state.messages.append(HumanMessage(user_question))
+                with span("append_history", role="user"):
+                    append_history("user", user_question, request_id, chat_id=chat_id, chat_name=chat_name)
+
+                # Invoke the agent using only this session's history (or serve a cached answer)
+                ai_message, cached = answer_question(user_question, st.session_state.messages, chat_id,
+                                                     session_id=st.session_state.scheduler_session_id,
+                                                     on_wait=_show_queue_position,
+                                                     chat_group_id=st.session_state.get("current_chat_group_id"))
+                request_span["cached"] = cached
+                queue_notice.empty()
+
+                # Persist the assistant message and DB record
+                st.session_state.messages.append(AIMessage(ai_message, response_metadata={"cached": cached}))
+                with span("append_history", role="assistant"):
+                    append_history("assistant", ai_message, request_id, chat_id=chat_id, chat_name=chat_name)
+                with span("persist_db"):
+                    _persist_exchange_to_db(user_question, ai_message,
+                                            chat_group_id=st.session_state.get("current_chat_group_id"))
 
             # Rerun so the newly added messages render ABOVE the input (in the history area)
             st.rerun()
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+import streamlit as st
+
+# Robust imports to work whether running as a package or script
+try:
+    from tracing import get_trace_path, load_spans, slowest_requests, stage_summary
+    from watch_ingest import read_watch_status
+except ModuleNotFoundError:
+    from source_code.tracing import get_trace_path, load_spans, slowest_requests, stage_summary
+    from source_code.watch_ingest import read_watch_status
+
+
+def render_index_status():
+    status = read_watch_status()
+    if not status:
+        return
+    st.subheader("Document index")
+    updated = datetime.fromtimestamp(status["updated_at"]).strftime("%Y-%m-%d %H:%M:%S")
+    cols = st.columns(4)
+    cols[0].metric("Indexed files", status.get("indexed_files", 0))
+    cols[1].metric("Pending files", status.get("pending_files", 0))
+    cols[2].metric("Index lag", f"{status.get('lag_seconds', 0.0):.0f}s")
+    cols[3].metric("Watcher heartbeat", updated)
+    if status.get("last_error"):
+        st.caption(f"Last error: {status['last_error']['path']}: {status['last_error']['error']}")
+
+
+def render_settings_page():
+    render_index_status()
+
+    st.subheader("Request latency")
+    window = st.selectbox("Spans analysed (most recent)", [1000, 5000, 20000, 100000], index=2)
+    if st.button("Refresh"):
+        st.rerun()
+
+    spans = load_spans(limit=window)
+    if not spans:
+        st.info(f"No traces recorded yet ({get_trace_path()}). Ask the chatbot something first.")
+        return
+
+    summary = stage_summary(spans)
+    st.caption(f"{len(spans)} spans from {get_trace_path()} — latencies in milliseconds")
+    st.dataframe(
+        [
+            {
+                "stage": name,
+                "count": s["count"],
+                "p50": round(s["p50"], 1),
+                "p95": round(s["p95"], 1),
+                "p99": round(s["p99"], 1),
+                "max": round(s["max"], 1),
+                "mean": round(s["mean"], 1),
+                "errors": s["errors"],
+            }
+            for name, s in summary.items()
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+
+    st.subheader("Slowest requests")
+    slowest = slowest_requests(spans)
+    if not slowest:
+        st.info("No complete requests in this window.")
+        return
+    stages = [name for name in summary if name != "request"]
+    st.dataframe(
+        [
+            {
+                "request_id": r["request_id"],
+                "started": datetime.fromtimestamp(r["start_ts"]).strftime("%Y-%m-%d %H:%M:%S"),
+                "total": round(r.get("request", 0.0), 1),
+                **{name: round(r.get(name, 0.0), 1) for name in stages},
+            }
+            for r in slowest
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
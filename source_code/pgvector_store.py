@@ -0,0 +1,326 @@
+import hashlib
+import io
+import json
+import os
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import psycopg2
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+try:
+    from config.pg_db_conn_manager import get_db_connection, stream_data
+except ModuleNotFoundError:
+    from source_code.config.pg_db_conn_manager import get_db_connection, stream_data
+
+SCHEMA = "personal_chat"
+TABLE = f"{SCHEMA}.rag_embeddings"
+SOURCE_INDEX = "rag_embeddings_source_idx"
+
+
+def get_embedding_dim() -> int:
+    return int(os.getenv("EMBEDDING_DIM", "1024"))
+
+
+def get_ef_search() -> int:
+    return int(os.getenv("PGVECTOR_EF_SEARCH", "40"))
+
+
+def get_iterative_scan() -> Optional[str]:
+    """hnsw.iterative_scan mode for filtered searches (pgvector 0.8+): "strict_order", "relaxed_order" or unset."""
+    return os.getenv("PGVECTOR_ITERATIVE_SCAN") or None
+
+
+def collection_index_name(collection: str) -> str:
+    """Name of a collection's partial HNSW index; hashed, as collection names may exceed 63 bytes."""
+    return f"rag_embeddings_hnsw_{hashlib.blake2b(collection.encode('utf-8'), digest_size=8).hexdigest()}"
+
+
+def _vector_literal(vector: Iterable[float]) -> str:
+    return "[" + ",".join(repr(float(v)) for v in vector) + "]"
+
+
+def _copy_escape(value: str) -> str:
+    """Escape a value for COPY ... FROM STDIN text format."""
+    return (value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class PgVectorStore(VectorStore):
+    """
+    LangChain vector store on Postgres + pgvector, sharing the pooled pg_db_conn_manager connections.
+
+    All collections live in one table (personal_chat.rag_embeddings) keyed by (collection, id). Each
+    collection has its own partial HNSW cosine index (WHERE collection = ...), so a search walks a graph
+    of that collection's vectors only: shards and index versions do not dilute each other's recall or
+    cost. Writes are bulk-loaded with COPY into a temporary staging table and upserted from there, so
+    re-adding an id replaces it (like Chroma's upsert).
+    """
+
+    def __init__(self, collection_name: str, embedding_function: Embeddings):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.dimensions = get_embedding_dim()
+        self._schema_ready = False
+        self._indexes_ready = False
+        self._index_checked = False
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    # ---------- schema ----------
+
+    def ensure_schema(self) -> None:
+        if self._schema_ready:
+            return
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+                    f" collection text NOT NULL,"
+                    f" id text NOT NULL,"
+                    f" content text NOT NULL,"
+                    f" metadata jsonb NOT NULL DEFAULT '{{}}'::jsonb,"
+                    f" embedding vector({self.dimensions}) NOT NULL,"
+                    f" CONSTRAINT rag_embeddings_pkey PRIMARY KEY (collection, id));"
+                )
+                # for vector(n) columns the type modifier is n
+                cur.execute(
+                    "SELECT atttypmod FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'embedding';",
+                    (TABLE,),
+                )
+                table_dim = cur.fetchone()[0]
+            conn.commit()
+        if table_dim != self.dimensions:
+            raise RuntimeError(f"{TABLE}.embedding is vector({table_dim}) but EMBEDDING_DIM is {self.dimensions}; "
+                               f"set EMBEDDING_DIM to the embedding model's dimension and recreate the table")
+        self._schema_ready = True
+
+    def _find_index(self, cur, name: str) -> Optional[bool]:
+        """Whether index name is valid; None if it does not exist."""
+        cur.execute(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace WHERE n.nspname = %s AND c.relname = %s;",
+            (SCHEMA, name),
+        )
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def ensure_indexes(self) -> None:
+        """
+        Create this collection's partial HNSW index and the table's (collection, source) index without
+        blocking writers. Runs on the write path (add_embeddings), so a search never waits on an index build.
+        """
+        if self._indexes_ready:
+            return
+        self.ensure_schema()
+        indexes = [
+            (collection_index_name(self.collection_name),
+             f"USING hnsw (embedding vector_cosine_ops) WHERE collection = %s", (self.collection_name,)),
+            # chunks of one source document (re-ingestion and watch mode replace a document's chunks)
+            (SOURCE_INDEX, "USING btree (collection, (metadata->>'source'))", ()),
+        ]
+        with get_db_connection() as conn:
+            # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    for name, definition, params in indexes:
+                        valid = self._find_index(cur, name)
+                        if valid:
+                            continue
+                        if valid is not None:
+                            # left invalid by an interrupted concurrent build
+                            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{name};")
+                        cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {TABLE} {definition};", params)
+                self._indexes_ready = True
+            except psycopg2.Error as e:
+                # e.g. another process is building the same index; queries still work, unindexed
+                print(f"[WARN] Could not create the indexes of collection '{self.collection_name}': {e}")
+            finally:
+                conn.autocommit = False
+
+    def _check_index(self) -> None:
+        """Read path: only look the collection's HNSW index up (once), never build it."""
+        if self._index_checked:
+            return
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                valid = self._find_index(cur, collection_index_name(self.collection_name))
+        if not valid:
+            print(f"[WARN] Collection '{self.collection_name}' has no valid HNSW index; searches scan it sequentially "
+                  f"until the next write builds one")
+        self._index_checked = True
+
+    # ---------- writes ----------
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Bulk-load precomputed vectors (COPY into a staging table, then upsert)."""
+        if not texts:
+            return []
+        self.ensure_indexes()
+        ids = ids or [str(uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        buffer = io.StringIO()
+        for doc_id, text, metadata, vector in zip(ids, texts, metadatas, embeddings):
+            buffer.write("\t".join((
+                _copy_escape(self.collection_name),
+                _copy_escape(doc_id),
+                _copy_escape(text),
+                _copy_escape(json.dumps(metadata or {}, ensure_ascii=False)),
+                _vector_literal(vector),
+            )) + "\n")
+        buffer.seek(0)
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # ord keeps the load order, so the last row of a repeated id wins
+                cur.execute(
+                    f"CREATE TEMP TABLE rag_embeddings_stage (LIKE {TABLE} INCLUDING DEFAULTS, ord bigserial) "
+                    f"ON COMMIT DROP;"
+                )
+                cur.copy_expert(
+                    "COPY rag_embeddings_stage (collection, id, content, metadata, embedding) FROM STDIN",
+                    buffer,
+                )
+                cur.execute(
+                    f"INSERT INTO {TABLE} (collection, id, content, metadata, embedding) "
+                    f"SELECT DISTINCT ON (collection, id) collection, id, content, metadata, embedding "
+                    f"FROM rag_embeddings_stage ORDER BY collection, id, ord DESC "
+                    f"ON CONFLICT (collection, id) DO UPDATE SET content = EXCLUDED.content, "
+                    f"metadata = EXCLUDED.metadata, embedding = EXCLUDED.embedding;"
+                )
+            conn.commit()
+        return list(ids)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding_function.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        self.ensure_schema()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {TABLE} WHERE collection = %s AND id = ANY(%s);",
+                            (self.collection_name, list(ids)))
+            conn.commit()
+        return True
+
+    def delete_collection(self) -> None:
+        # the table only: building this collection's index here would be thrown away a few lines down
+        self.ensure_schema()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DELETE FROM {TABLE} WHERE collection = %s;", (self.collection_name,))
+            conn.commit()
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{collection_index_name(self.collection_name)};")
+            finally:
+                conn.autocommit = False
+        self._indexes_ready = False
+        self._index_checked = False
+
+    def compact(self) -> None:
+        """Reclaim the space of deleted rows and rebuild the HNSW indexes without their tombstones (table-wide)."""
+        self.ensure_schema()
+        with get_db_connection() as conn:
+            # VACUUM and REINDEX CONCURRENTLY cannot run inside a transaction block
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"VACUUM (ANALYZE) {TABLE};")
+                    cur.execute(f"REINDEX TABLE CONCURRENTLY {TABLE};")
+            finally:
+                conn.autocommit = False
+
+    # ---------- reads ----------
+
+    def count(self) -> int:
+        self.ensure_schema()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT count(*) FROM {TABLE} WHERE collection = %s;", (self.collection_name,))
+                return cur.fetchone()[0]
+
+    def iter_records(self, batch_size: int = 1000) -> Iterator[List[Tuple[str, str, dict, List[float]]]]:
+        """Every (id, content, metadata, embedding) of the collection, in batches, through a server-side cursor."""
+        self.ensure_schema()
+        query = f"SELECT id, content, metadata, embedding::text FROM {TABLE} WHERE collection = %s ORDER BY id;"
+        for rows in stream_data(query, (self.collection_name,), as_dicts=False, batch_size=batch_size):
+            # the text form of a vector, "[0.1,0.2,...]", is a JSON array
+            yield [(row[0], row[1], row[2], json.loads(row[3])) for row in rows]
+
+    def ids_for_source(self, source: str) -> List[str]:
+        """Ids of the collection's chunks whose "source" metadata is source."""
+        self.ensure_schema()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT id FROM {TABLE} WHERE collection = %s AND metadata->>'source' = %s;",
+                            (self.collection_name, source))
+                return [row[0] for row in cur.fetchall()]
+
+    def storage_bytes(self) -> int:
+        """On-disk size of this collection's rows (its HNSW index is not included)."""
+        self.ensure_schema()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT coalesce(sum(pg_column_size(t.*)), 0) FROM {TABLE} t WHERE collection = %s;",
+                            (self.collection_name,))
+                return int(cur.fetchone()[0])
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        """Nearest neighbours by cosine distance (lower is closer), optionally filtered on metadata."""
+        self.ensure_schema()
+        self._check_index()
+        vector = _vector_literal(embedding)
+        params: List[Any] = [vector, self.collection_name]
+        metadata_clause = ""
+        if filter:
+            metadata_clause = "AND metadata @> %s::jsonb"
+            params.append(json.dumps(filter))
+        params.extend([vector, k])
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                # the index returns at most ef_search candidates; fewer than k would come back short
+                cur.execute("SELECT set_config('hnsw.ef_search', %s, true);", (str(max(k, get_ef_search())),))
+                if filter and get_iterative_scan():
+                    # keep scanning the index until k rows pass the metadata filter
+                    cur.execute("SELECT set_config('hnsw.iterative_scan', %s, true);", (get_iterative_scan(),))
+                cur.execute(
+                    # a constant query vector and collection literal: the planner can match the collection's
+                    # partial index and scan it in distance order
+                    f"SELECT id, content, metadata, embedding <=> %s::vector AS distance "
+                    f"FROM {TABLE} "
+                    f"WHERE collection = %s {metadata_clause} "
+                    f"ORDER BY embedding <=> %s::vector LIMIT %s;",
+                    tuple(params),
+                )
+                rows = cur.fetchall()
+        return [(Document(id=r[0], page_content=r[1], metadata=r[2] or {}), float(r[3])) for r in rows]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, kwargs.get("filter"))]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding_function.embed_query(query), k, kwargs.get("filter"))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, collection_name: str = "rag_data", **kwargs: Any
+                   ) -> "PgVectorStore":
+        store = cls(collection_name, embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,179 @@
+import argparse
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class StageProfiler:
+    """
+    Wall and CPU time per named stage of a batch job, and per item (e.g. input file).
+
+    Stages may nest; each stage reports its total time and its self time (total minus nested
+    stages), so the self times of all stages add up to the profiled run. A disabled profiler
+    costs one attribute check per stage.
+    """
+
+    def __init__(self, enabled: bool = True, top_n: int = 10):
+        self.enabled = enabled
+        self.top_n = top_n
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.items: Dict[str, Dict[str, float]] = {}
+        self._stack: List[Dict[str, Any]] = []
+        self._started_wall = time.perf_counter()
+        self._started_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str, item: Optional[str] = None) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        if item is None and self._stack:
+            item = self._stack[-1]["item"]
+        frame = {"item": item, "child_wall": 0.0, "child_cpu": 0.0}
+        self._stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]["child_wall"] += wall
+                self._stack[-1]["child_cpu"] += cpu
+            stats = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "self_wall": 0.0, "self_cpu": 0.0})
+            stats["calls"] += 1
+            stats["wall"] += wall
+            stats["cpu"] += cpu
+            stats["self_wall"] += wall - frame["child_wall"]
+            stats["self_cpu"] += cpu - frame["child_cpu"]
+            if item is not None:
+                per_item = self.items.setdefault(item, {})
+                per_item[name] = per_item.get(name, 0.0) + wall - frame["child_wall"]
+
+    def slowest_items(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        ranked = sorted(self.items.items(), key=lambda kv: sum(kv[1].values()), reverse=True)
+        return [{"item": item, "total": sum(stages.values()), **stages} for item, stages in ranked[:n or self.top_n]]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "wall_seconds": time.perf_counter() - self._started_wall,
+            "cpu_seconds": time.process_time() - self._started_cpu,
+            "stages": self.stages,
+            "slowest_items": self.slowest_items(),
+        }
+
+    def report(self) -> str:
+        summary = self.summary()
+        run_wall = summary["wall_seconds"] or 1e-9
+        lines = [
+            f"Profile: {summary['wall_seconds']:.2f}s wall, {summary['cpu_seconds']:.2f}s CPU",
+            f"{'stage':<24}{'calls':>8}{'self wall s':>13}{'self cpu s':>12}{'cpu %':>8}{'% of run':>10}{'total wall s':>14}",
+        ]
+        for name, s in sorted(self.stages.items(), key=lambda kv: kv[1]["self_wall"], reverse=True):
+            cpu_share = 100.0 * s["self_cpu"] / s["self_wall"] if s["self_wall"] > 0 else 0.0
+            lines.append(
+                f"{name:<24}{int(s['calls']):>8}{s['self_wall']:>13.3f}{s['self_cpu']:>12.3f}{cpu_share:>8.0f}"
+                f"{100.0 * s['self_wall'] / run_wall:>10.1f}{s['wall']:>14.3f}"
+            )
+        slowest = summary["slowest_items"]
+        if slowest:
+            lines.append(f"Slowest {len(slowest)} items (self wall seconds per stage):")
+            for entry in slowest:
+                breakdown = ", ".join(f"{k}={v:.3f}" for k, v in entry.items() if k not in ("item", "total"))
+                lines.append(f"  {entry['total']:8.3f}s  {entry['item']}  ({breakdown})")
+        return "\n".join(lines)
+
+    def write_json(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+class StackSampler:
+    """
+    Samples the call stack of one thread at a fixed interval and counts collapsed stacks
+    ("outer;inner;leaf count" lines), the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._sample, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def write_collapsed(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("profiling")
+    group.add_argument("--profile", action="store_true",
+                       help="Print wall/CPU time per stage and the slowest files when done.")
+    group.add_argument("--profile-top", type=int, default=10, help="How many of the slowest files to list (default: 10).")
+    group.add_argument("--profile-json", help="Also write the stage/file timings as JSON to this path.")
+    group.add_argument("--profile-cprofile", help="Write cProfile stats to this path (view with snakeviz or flameprof).")
+    group.add_argument("--profile-stacks",
+                       help="Write sampled collapsed stacks to this path (render with flamegraph.pl or speedscope).")
+    group.add_argument("--profile-interval", type=float, default=0.005,
+                       help="Stack sampling interval in seconds (default: 0.005).")
+
+
+@contextmanager
+def profiling_session(args: argparse.Namespace) -> Iterator[StageProfiler]:
+    """Run a CLI's work under the profilers requested by the add_profile_arguments options."""
+    enabled = bool(args.profile or args.profile_json or args.profile_cprofile or args.profile_stacks)
+    profiler = StageProfiler(enabled=enabled, top_n=args.profile_top)
+    cprofile = cProfile.Profile() if args.profile_cprofile else None
+    sampler = StackSampler(interval=args.profile_interval) if args.profile_stacks else None
+    if sampler is not None:
+        sampler.start()
+    if cprofile is not None:
+        cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if cprofile is not None:
+            cprofile.disable()
+            cprofile.dump_stats(args.profile_cprofile)
+            print(f"Wrote cProfile stats to {args.profile_cprofile}")
+        if sampler is not None:
+            sampler.stop()
+            sampler.write_collapsed(args.profile_stacks)
+            print(f"Wrote {sum(sampler.counts.values())} stack samples to {args.profile_stacks}")
+        if enabled:
+            print(profiler.report())
+        if args.profile_json:
+            profiler.write_json(args.profile_json)
+            print(f"Wrote profile summary to {args.profile_json}")
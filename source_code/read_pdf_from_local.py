@@ -3,12 +3,20 @@ import datetime
 import json
 import os
 import re
-from typing import Dict, Iterable, Tuple
+from typing import Dict, Iterable, Iterator, Optional, Tuple
 
 from dotenv import load_dotenv
 
+try:
+    from profiling import StageProfiler, add_profile_arguments, profiling_session
+except ModuleNotFoundError:
+    from source_code.profiling import StageProfiler, add_profile_arguments, profiling_session
+
 load_dotenv()
 
+# stand-in when no profiling was requested
+_NO_PROFILER = StageProfiler(enabled=False)
+
 try:
     from pypdf import PdfReader  # lightweight and widely used
 except Exception:  # pragma: no cover - optional dependency handling
@@ -26,6 +34,9 @@ TEXT_EXTENSIONS = {
 }
 
 
+PAGE_BREAK = "\f"
+
+
 def normalize_whitespace(text: str) -> str:
     """Collapse multiple whitespace characters and strip ends."""
     # Replace Windows newlines, tabs, and multiple spaces/newlines with single spaces
@@ -33,28 +44,83 @@ def normalize_whitespace(text: str) -> str:
     return text.strip()
 
 
-def read_pdf(path: str) -> str:
+_INLINE_SPACE = re.compile(r"[^\S\n\f]+")
+_SPACE_AROUND_BREAK = re.compile(r" ?([\n\f]) ?")
+_EXTRA_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_structured(text: str) -> str:
+    """Tidy whitespace but keep lines, paragraphs (blank lines) and page breaks (form feeds) for the chunker."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = _INLINE_SPACE.sub(" ", text)
+    text = _SPACE_AROUND_BREAK.sub(r"\1", text)
+    text = _EXTRA_BLANK_LINES.sub("\n\n", text)
+    return text.strip()
+
+
+def iter_pdf_pages(path: str, profiler: Optional[StageProfiler] = None,
+                   keep_structure: bool = False) -> Iterator[Tuple[int, str]]:
+    """
+    (page_number, normalized text) for every page, 1-based, extracted and normalized one page at a time:
+    memory is bounded by the largest page rather than the whole document. Empty pages yield "".
+    """
+    profiler = profiler or _NO_PROFILER
     if PdfReader is None:
         raise RuntimeError(
             "pypdf is not installed. Please install dependencies (see requirements.txt)."
         )
+    page_number = 0
     try:
-        reader = PdfReader(path)
-        parts = []
-        for page in reader.pages:
-            page_text = page.extract_text() or ""
-            parts.append(page_text)
-        return normalize_whitespace("\n".join(parts))
+        with profiler.stage("pdf_open"):
+            reader = PdfReader(path)
+        for page_number in range(1, len(reader.pages) + 1):
+            with profiler.stage("pdf_extract_text"):
+                page_text = reader.pages[page_number - 1].extract_text() or ""
+            with profiler.stage("normalize_whitespace"):
+                page_text = normalize_structured(page_text) if keep_structure else normalize_whitespace(page_text)
+            yield page_number, page_text
     except Exception as e:
-        raise RuntimeError(f"Failed to read PDF '{path}': {e}")
+        where = f" at page {page_number}" if page_number else ""
+        raise RuntimeError(f"Failed to read PDF '{path}'{where}: {e}")
+
+
+def iter_pdf_text(path: str, profiler: Optional[StageProfiler] = None, keep_structure: bool = False) -> Iterator[str]:
+    """
+    The text read_pdf returns, as consecutive pieces (about one per page), so it can be written out as it is read.
+    With keep_structure, pages are separated by PAGE_BREAK, including empty ones, so page numbers stay countable.
+    """
+    separator = PAGE_BREAK if keep_structure else " "
+    pending_breaks = 0  # separators are held back until text follows, so nothing trails the last page
+    started = False
+    for _page_number, page_text in iter_pdf_pages(path, profiler, keep_structure):
+        if not page_text:
+            if keep_structure:
+                pending_breaks += 1
+            continue
+        if started:
+            yield separator * max(pending_breaks, 1)
+        elif pending_breaks:
+            yield separator * pending_breaks
+        yield page_text
+        started = True
+        pending_breaks = 1 if keep_structure else 0
+
+
+def read_pdf(path: str, profiler: Optional[StageProfiler] = None, keep_structure: bool = False) -> str:
+    """Text of all pages; with keep_structure, pages are separated by PAGE_BREAK and line breaks are kept."""
+    return "".join(iter_pdf_text(path, profiler, keep_structure))
 
 
-def read_text_file(path: str) -> str:
+def read_text_file(path: str, profiler: Optional[StageProfiler] = None, keep_structure: bool = False) -> str:
+    profiler = profiler or _NO_PROFILER
     # Try UTF-8 first, then fall back to latin-1 to avoid crashes on odd encodings
     for encoding in ("utf-8", "utf-8-sig", "latin-1"):
         try:
-            with open(path, "r", encoding=encoding, errors="replace") as f:
-                return normalize_whitespace(f.read())
+            with profiler.stage("text_read"):
+                with open(path, "r", encoding=encoding, errors="replace") as f:
+                    raw = f.read()
+            with profiler.stage("normalize_whitespace"):
+                return normalize_structured(raw) if keep_structure else normalize_whitespace(raw)
         except Exception:
             continue
     raise RuntimeError(f"Failed to read text file '{path}' with common encodings")
@@ -73,22 +139,27 @@ def iter_files(input_dir: str) -> Iterable[Tuple[str, str]]:
                 yield abs_path, ext
 
 
-def build_corpus(input_dir: str, use_basename_keys: bool = True) -> Dict[str, str]:
+def build_corpus(input_dir: str, use_basename_keys: bool = True,
+                 profiler: Optional[StageProfiler] = None, keep_structure: bool = False) -> Dict[str, str]:
     """
     Build a mapping from file name to extracted text content.
 
     - If use_basename_keys is True, keys are just the file's base name.
     - Otherwise, keys are paths relative to the input_dir (using forward slashes).
+    - profiler, if given, records time per stage and per file.
+    - keep_structure keeps line, paragraph and page breaks (for the structured chunker).
     """
+    profiler = profiler or _NO_PROFILER
     mapping: Dict[str, str] = {}
     input_dir_abs = os.path.abspath(input_dir)
 
     for abs_path, ext in iter_files(input_dir):
         try:
-            if ext == ".pdf":
-                content = read_pdf(abs_path)
-            else:
-                content = read_text_file(abs_path)
+            with profiler.stage("read_file", item=abs_path):
+                if ext == ".pdf":
+                    content = read_pdf(abs_path, profiler, keep_structure)
+                else:
+                    content = read_text_file(abs_path, profiler, keep_structure)
         except Exception as e:
             # Log to console and skip file on error
             print(f"[WARN] Skipping '{abs_path}': {e}")
@@ -109,8 +180,7 @@ def build_corpus(input_dir: str, use_basename_keys: bool = True) -> Dict[str, st
     return mapping
 
 
-def save_json(mapping: Dict[str, str], output_path: str) -> None:
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+def _backup_existing(output_path: str) -> None:
     # if file exists, rename the existing with the current timestamp and .txt at the end
     if os.path.exists(output_path):
         timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
@@ -118,11 +188,80 @@ def save_json(mapping: Dict[str, str], output_path: str) -> None:
         os.rename(output_path, backup_path)
         print(f"Renamed existing file to {backup_path}")
 
+
+def save_json(mapping: Dict[str, str], output_path: str) -> None:
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    _backup_existing(output_path)
+
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(mapping, f, ensure_ascii=False, indent=2)
     print(f"Wrote {len(mapping)} items to {output_path}")
 
 
+def _json_string_body(text: str) -> str:
+    """text escaped for use inside a JSON string literal, without the quotes."""
+    return json.dumps(text, ensure_ascii=False)[1:-1]
+
+
+def write_corpus(input_dir: str, output_path: str, use_basename_keys: bool = True,
+                 profiler: Optional[StageProfiler] = None, keep_structure: bool = False) -> int:
+    """
+    Same output as save_json(build_corpus(...)), but streamed: each PDF is written page by page as it is read,
+    so memory is bounded by the largest page instead of the whole corpus. Returns the number of files written.
+    A PDF that fails part-way keeps the pages read before the failure. Entries cannot be overwritten once
+    written, so when two files map to the same key the first one is kept (build_corpus keeps the last).
+    """
+    profiler = profiler or _NO_PROFILER
+    input_dir_abs = os.path.abspath(input_dir)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    written = 0
+    seen = set()
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        out.write("{")
+        for abs_path, ext in iter_files(input_dir):
+            if use_basename_keys:
+                key = os.path.basename(abs_path)
+            else:
+                key = os.path.relpath(abs_path, input_dir_abs).replace(os.sep, "/")
+            if key in seen:
+                print(f"[WARN] Skipping '{abs_path}': another file was already written as '{key}'")
+                continue
+            started = failed = False
+            try:
+                with profiler.stage("read_file", item=abs_path):
+                    if ext == ".pdf":
+                        pieces = iter_pdf_text(abs_path, profiler, keep_structure)
+                    else:
+                        pieces = [read_text_file(abs_path, profiler, keep_structure)]
+                    for piece in pieces:
+                        if not piece:
+                            continue
+                        if not started:
+                            # the entry is only opened once there is text, so empty files leave no trace
+                            out.write(("," if written else "") + "\n  " + json.dumps(key, ensure_ascii=False) + ': "')
+                            started = True
+                        out.write(_json_string_body(piece))
+            except Exception as e:
+                failed = True
+                if started:
+                    print(f"[WARN] Truncated '{abs_path}': {e}")
+                else:
+                    # Log to console and skip file on error
+                    print(f"[WARN] Skipping '{abs_path}': {e}")
+            if started:
+                out.write('"')
+                written += 1
+                seen.add(key)
+            elif not failed:
+                print(f"[INFO] Skipping empty file: {abs_path}")
+        out.write("\n}" if written else "}")
+    _backup_existing(output_path)
+    os.replace(tmp_path, output_path)
+    print(f"Wrote {written} items to {output_path}")
+    return written
+
+
 def main():
     parser = argparse.ArgumentParser(
         description=(
@@ -155,11 +294,18 @@ def main():
         action="store_true",
         help="Use paths relative to input-dir as keys instead of just base names.",
     )
+    parser.add_argument(
+        "--flatten",
+        action="store_true",
+        help="Collapse all whitespace (the old output) instead of keeping lines, paragraphs and page breaks.",
+    )
+    add_profile_arguments(parser)
 
     args = parser.parse_args()
 
-    corpus = build_corpus(args.input_dir, use_basename_keys=not args.relative_keys)
-    save_json(corpus, args.output)
+    with profiling_session(args) as profiler:
+        write_corpus(args.input_dir, args.output, use_basename_keys=not args.relative_keys, profiler=profiler,
+                     keep_structure=not args.flatten)
 
 
 if __name__ == "__main__":
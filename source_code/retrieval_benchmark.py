@@ -0,0 +1,237 @@
+"""
+Retrieval quality vs latency benchmark.
+
+Builds a scratch index for every (backend, chunker, chunk_size, chunk_overlap) combination from the extracted corpus,
+runs a labeled question set against it for every k, and prints one comparable table:
+recall@k, MRR@k, chunk count, index size, build time (embedding and vector store write) and search latency.
+
+The labels file is JSON Lines, one question per line, with the corpus keys (the "source" of its chunks) that
+answer it:
+    {"question": "What is the liquidation preference?", "sources": ["Series A term sheet.pdf"]}
+
+Run from source_code/, e.g.:
+    python retrieval_benchmark.py --labels datasets/retrieval_labels.jsonl --chunk-sizes 500,1000,2000 \\
+        --overlaps 0,200 --k 1,2,4,8 --backends chroma,pgvector
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from chunking import get_text_splitter
+from local_docs_chunking_embedding_ingestion import default_input_path, load_dataset
+from stats import summarize
+from vector_backend import BACKENDS, get_vector_store
+
+load_dotenv()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeds each distinct text once, so every backend indexes identical vectors and build times compare writes."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        self.vectors: Dict[str, List[float]] = {}
+        self.embed_seconds = 0.0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        missing = list(dict.fromkeys(t for t in texts if t not in self.vectors))
+        if missing:
+            started = time.perf_counter()
+            for text, vector in zip(missing, self.inner.embed_documents(missing)):
+                self.vectors[text] = vector
+            self.embed_seconds += time.perf_counter() - started
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if text not in self.vectors:
+            started = time.perf_counter()
+            self.vectors[text] = self.inner.embed_query(text)
+            self.embed_seconds += time.perf_counter() - started
+        return self.vectors[text]
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    labels = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            sources = obj.get("sources") or ([obj["source"]] if obj.get("source") else [])
+            if obj.get("question") and sources:
+                labels.append({"question": obj["question"], "sources": set(sources)})
+    return labels
+
+
+def split_corpus(items: List[Dict[str, Any]], chunker: str, chunk_size: int, chunk_overlap: int):
+    splitter = get_text_splitter(chunker, chunk_size, chunk_overlap)
+    texts, metadatas = [], []
+    for line in items:
+        url = line.get('url') or line.get('source') or line.get('file') or 'unknown'
+        title = line.get('title') or os.path.basename(url)
+        raw_text = line.get('raw_text') or line.get('content') or line.get('text') or ''
+        if not raw_text:
+            continue
+        for doc in splitter.create_documents([raw_text], metadatas=[{"source": url, "title": title}]):
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+    return texts, metadatas
+
+
+def directory_bytes(path: str) -> int:
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def score(ranked_sources: List[str], relevant: set, k: int):
+    """(recall@k, reciprocal rank within k) of one query, by source document."""
+    top = ranked_sources[:k]
+    recall = len(relevant.intersection(top)) / len(relevant)
+    reciprocal_rank = next((1.0 / rank for rank, source in enumerate(top, start=1) if source in relevant), 0.0)
+    return recall, reciprocal_rank
+
+
+def run_config(backend: str, chunker: str, chunk_size: int, chunk_overlap: int, ks: Sequence[int], items, labels,
+               embeddings: CachedEmbeddings, workdir: str, batch_size: int, repeats: int) -> List[Dict[str, Any]]:
+    texts, metadatas = split_corpus(items, chunker, chunk_size, chunk_overlap)
+    embed_before = embeddings.embed_seconds
+    embeddings.embed_documents(texts)  # new chunk texts are embedded here, once for all backends
+    embed_seconds = embeddings.embed_seconds - embed_before
+
+    collection = f"bench_{chunker}_{chunk_size}_{chunk_overlap}"
+    persist_directory = os.path.join(workdir, f"{backend}_{collection}")
+    store = get_vector_store(embeddings, collection_name=collection, backend=backend,
+                             persist_directory=persist_directory)
+    if backend == "pgvector":
+        store.delete_collection()
+
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        store.add_texts(texts[i:i + batch_size], metadatas=metadatas[i:i + batch_size],
+                        ids=[f"{collection}-{j}" for j in range(i, min(i + batch_size, len(texts)))])
+    write_seconds = time.perf_counter() - started
+    index_bytes = store.storage_bytes() if backend == "pgvector" else directory_bytes(persist_directory)
+
+    query_vectors = [embeddings.embed_query(label["question"]) for label in labels]
+    rows = []
+    try:
+        for k in ks:
+            latencies, recalls, reciprocal_ranks = [], [], []
+            for label, vector in zip(labels, query_vectors):
+                for _ in range(repeats):
+                    started = time.perf_counter()
+                    docs = store.similarity_search_by_vector(vector, k=k)
+                    latencies.append((time.perf_counter() - started) * 1000.0)
+                recall, reciprocal_rank = score([d.metadata.get("source") for d in docs], label["sources"], k)
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+            latency = summarize(latencies)
+            rows.append({
+                "backend": backend,
+                "chunker": chunker,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "k": k,
+                "chunks": len(texts),
+                "recall_at_k": sum(recalls) / len(recalls),
+                "mrr_at_k": sum(reciprocal_ranks) / len(reciprocal_ranks),
+                "index_mb": index_bytes / 1_000_000,
+                "embed_seconds": embed_seconds,
+                "write_seconds": write_seconds,
+                "latency_p50_ms": latency["p50"],
+                "latency_p95_ms": latency["p95"],
+                "latency_p99_ms": latency["p99"],
+            })
+    finally:
+        store.delete_collection()
+        shutil.rmtree(persist_directory, ignore_errors=True)
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    print(f"{'backend':<10}{'chunker':<12}{'size':>6}{'ovl':>5}{'k':>4}{'chunks':>8}{'recall@k':>10}{'MRR':>7}{'index MB':>10}"
+          f"{'embed s':>9}{'write s':>9}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}")
+    for r in rows:
+        print(f"{r['backend']:<10}{r['chunker']:<12}{r['chunk_size']:>6}{r['chunk_overlap']:>5}{r['k']:>4}{r['chunks']:>8}"
+              f"{r['recall_at_k']:>10.3f}{r['mrr_at_k']:>7.3f}{r['index_mb']:>10.2f}{r['embed_seconds']:>9.2f}"
+              f"{r['write_seconds']:>9.2f}{r['latency_p50_ms']:>8.2f}{r['latency_p95_ms']:>8.2f}{r['latency_p99_ms']:>8.2f}")
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Sweep chunking, k and vector backends; report retrieval quality and latency.")
+    parser.add_argument("--corpus", default=default_input_path(), help="Extracted corpus (default: the ingestion input)")
+    parser.add_argument("--labels", required=True, help="JSONL of {question, sources} pairs")
+    parser.add_argument("--chunkers", default="recursive,structured", help="Comma-separated, see chunking.get_text_splitter")
+    parser.add_argument("--chunk-sizes", type=_int_list, default=[500, 1000, 2000])
+    parser.add_argument("--overlaps", type=_int_list, default=[0, 200])
+    parser.add_argument("--k", type=_int_list, default=[1, 2, 4, 8])
+    parser.add_argument("--backends", default="chroma", help=f"Comma-separated, from {BACKENDS}")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks per add_texts call while building")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed searches per question and k")
+    parser.add_argument("--stub", action="store_true",
+                        help="Embed with the in-process stub Ollama server (latency/size only; recall is meaningless)")
+    parser.add_argument("--json", help="Write all rows as JSON to this path")
+    parser.add_argument("--csv", help="Write all rows as CSV to this path")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.stub:
+        from ollama_stub_server import start_stub_server
+        server, _state, base_url = start_stub_server(load_seconds=0.0, latency_seconds=0.0, embed_latency_seconds=0.0,
+                                                     embedding_dim=int(os.getenv("EMBEDDING_DIM", "1024")))
+        os.environ["OLLAMA_HOST"] = base_url
+    from langchain_ollama import OllamaEmbeddings
+    embeddings = CachedEmbeddings(OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL")))
+
+    items = load_dataset(args.corpus)
+    labels = load_labels(args.labels)
+    if not labels:
+        raise SystemExit(f"No labeled questions in {args.labels}")
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    workdir = tempfile.mkdtemp(prefix="retrieval_bench_")
+    rows: List[Dict[str, Any]] = []
+    try:
+        for chunker in [c.strip() for c in args.chunkers.split(",") if c.strip()]:
+            for chunk_size in args.chunk_sizes:
+                for chunk_overlap in args.overlaps:
+                    if chunk_overlap >= chunk_size:
+                        continue
+                    for backend in backends:
+                        print(f"... {backend} {chunker} chunk_size={chunk_size} overlap={chunk_overlap}")
+                        rows.extend(run_config(backend, chunker, chunk_size, chunk_overlap, args.k, items, labels,
+                                               embeddings, workdir, args.batch_size, args.repeats))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            server.shutdown()
+
+    print(f"{len(labels)} questions, {len(items)} documents")
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+    if args.csv and rows:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
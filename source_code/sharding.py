@@ -0,0 +1,193 @@
+import fnmatch
+import heapq
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Sharding splits the corpus into one collection per shard, "<COLLECTION_NAME>__<shard>". SHARD_MAP_FILE says
+# which sources go to which shard and which chat groups (chat_group_dtl.id) search which shards:
+#
+#   {"shards": {
+#       "contracts": {"sources": ["contracts/*", "*agreement*"], "groups": [1, 4]},
+#       "research":  {"sources": ["research/*"], "groups": [2]}
+#   }}
+#
+# Sources matching no pattern go to the "default" shard, which every group searches. Without SHARD_MAP_FILE
+# there is a single collection, as before.
+DEFAULT_SHARD = "default"
+
+# chat group of the question being answered; the retrieve tool searches that group's shards only
+current_chat_group: ContextVar[Optional[int]] = ContextVar("current_chat_group", default=None)
+
+# shared by every ShardedVectorStore: LiveVectorStore re-opens the store after each index swap, and a
+# pool per store would leave its threads behind every time
+_search_executor: Optional[ThreadPoolExecutor] = None
+_search_executor_lock = threading.Lock()
+
+
+def get_search_executor() -> ThreadPoolExecutor:
+    global _search_executor
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(max_workers=int(os.getenv("SHARD_SEARCH_WORKERS", "8")),
+                                                      thread_name_prefix="shard-search")
+    return _search_executor
+
+
+def get_shard_map_path() -> Optional[str]:
+    return os.getenv("SHARD_MAP_FILE") or None
+
+
+class ShardMap:
+    def __init__(self, shards: Dict[str, Dict[str, Any]]):
+        self.shards = shards
+
+    @classmethod
+    def load(cls, path: str) -> "ShardMap":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f).get("shards", {}))
+
+    def all_shards(self) -> List[str]:
+        return list(self.shards) + [DEFAULT_SHARD]
+
+    def shard_for_source(self, source: str) -> str:
+        for shard, spec in self.shards.items():
+            if any(fnmatch.fnmatch(source, pattern) for pattern in spec.get("sources", [])):
+                return shard
+        return DEFAULT_SHARD
+
+    def shards_for_group(self, group_id: Optional[int]) -> List[str]:
+        """The group's own shards plus the default one; no group (or an unmapped one) searches everything."""
+        if group_id is None:
+            return self.all_shards()
+        own = [shard for shard, spec in self.shards.items() if group_id in spec.get("groups", [])]
+        return own + [DEFAULT_SHARD] if own else self.all_shards()
+
+
+def shard_collection_name(base: str, shard: str) -> str:
+    return f"{base}__{shard}"
+
+
+def _search_with_distance(store: VectorStore, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+    """(document, distance) pairs, lower is closer, for the backends vector_backend can create."""
+    if hasattr(store, "similarity_search_by_vector_with_score"):
+        return store.similarity_search_by_vector_with_score(embedding, k)
+    # Chroma: despite the name, the score is the collection's distance
+    return store.similarity_search_by_vector_with_relevance_scores(embedding, k)
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    One vector store per shard behind the LangChain VectorStore API.
+
+    Writes are routed by each document's "source" metadata. A search embeds the query once, runs it on the
+    shards in scope (those of current_chat_group unless shards/group_id is given) in parallel, and merges
+    their top-k by distance, so a search costs as much as the shards it touches rather than the whole corpus.
+    Each shard has its own index: a Chroma collection, or on pgvector a partial HNSW index over the shard's
+    rows of the shared table (see pgvector_store.py).
+    """
+
+    def __init__(self, shard_map: ShardMap, base_collection: str, embedding_function: Embeddings,
+                 store_factory: Callable[[str], VectorStore]):
+        self.shard_map = shard_map
+        self.base_collection = base_collection
+        self.embedding_function = embedding_function
+        self._store_factory = store_factory
+        self._stores: Dict[str, VectorStore] = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def shard(self, name: str) -> VectorStore:
+        if name not in self._stores:
+            self._stores[name] = self._store_factory(shard_collection_name(self.base_collection, name))
+        return self._stores[name]
+
+    # ---------- writes ----------
+
+    def add_documents(self, documents: List[Document], **kwargs: Any) -> List[str]:
+        ids = kwargs.get("ids") or [None] * len(documents)
+        by_shard: Dict[str, Tuple[List[Document], List[Optional[str]]]] = {}
+        for doc, doc_id in zip(documents, ids):
+            shard = self.shard_map.shard_for_source(doc.metadata.get("source", ""))
+            doc.metadata["shard"] = shard
+            by_shard.setdefault(shard, ([], []))
+            by_shard[shard][0].append(doc)
+            by_shard[shard][1].append(doc_id)
+        added: List[str] = []
+        for shard, (docs, doc_ids) in by_shard.items():
+            if all(doc_ids):
+                added.extend(self.shard(shard).add_documents(docs, ids=doc_ids))
+            else:
+                added.extend(self.shard(shard).add_documents(docs))
+        return added
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=t, metadata=dict(m)) for t, m in zip(texts, metadatas)]
+        return self.add_documents(documents, ids=ids) if ids else self.add_documents(documents)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Chunk ids do not name their shard, so the delete goes to every shard."""
+        if not ids:
+            return False
+        for shard in self.shard_map.all_shards():
+            self.shard(shard).delete(ids=ids)
+        return True
+
+    def delete_collection(self) -> None:
+        for shard in self.shard_map.all_shards():
+            self.shard(shard).delete_collection()
+        self._stores.clear()
+
+    # ---------- reads ----------
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               shards: Optional[List[str]] = None,
+                                               group_id: Optional[int] = None) -> List[Tuple[Document, float]]:
+        if shards is None:
+            shards = self.shard_map.shards_for_group(group_id if group_id is not None else current_chat_group.get())
+        if len(shards) == 1:
+            return _search_with_distance(self.shard(shards[0]), embedding, k)
+        stores = [self.shard(name) for name in shards]
+        results = get_search_executor().map(lambda store: _search_with_distance(store, embedding, k), stores)
+        return heapq.nsmallest(k, (hit for shard_hits in results for hit in shard_hits), key=lambda hit: hit[1])
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        hits = self.similarity_search_by_vector_with_score(embedding, k, kwargs.get("shards"), kwargs.get("group_id"))
+        return [doc for doc, _ in hits]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(
+            self.embedding_function.embed_query(query), k, kwargs.get("shards"), kwargs.get("group_id"))
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   **kwargs: Any) -> "ShardedVectorStore":
+        """
+        Sharded store (SHARD_MAP_FILE) over the backend's collections, filled with texts.
+        Accepts collection_name, backend and persist_directory as vector_backend.get_vector_store does, and ids.
+        """
+        try:
+            from vector_backend import get_vector_store
+        except ModuleNotFoundError:
+            from source_code.vector_backend import get_vector_store
+
+        store = get_vector_store(embedding, kwargs.get("collection_name"), kwargs.get("backend"),
+                                 kwargs.get("persist_directory"), sharded=True)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
@@ -4,6 +4,7 @@ from streamlit_option_menu import option_menu
 from pages.launch_chatbot import render_chatbot_app
 from pages.chat_groups import render_chat_groups_page
 from pages.chat_history import render_chat_history_page
+from pages.settings import render_settings_page
 
 # Configure page with proper icon and wide layout
 st.set_page_config(
@@ -60,8 +61,10 @@ elif selected_top == "Home":
         st.error(f"Navigation failed to Chatbot: {e}")
     # Render chatbot embedded, with its internal left menu living in-page
 elif selected_top == "Settings":
-    # Placeholder; remain on Home for now
-    st.write("Settings page")
-    st.stop()
+    try:
+        render_settings_page()
+        st.stop()
+    except Exception as e:
+        st.error(f"Navigation failed to Settings: {e}")
 else:
     pass
\ No newline at end of file
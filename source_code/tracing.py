@@ -0,0 +1,198 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+try:
+    from stats import summarize
+except ModuleNotFoundError:
+    from source_code.stats import summarize
+
+# Optional OpenTelemetry export: when the API is installed and TRACE_OTEL is on, every span is mirrored to the
+# globally configured tracer provider (configure exporters the usual way, e.g. opentelemetry-instrument/OTEL_* vars).
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover - optional dependency
+    otel_trace = None
+
+# Stages of a chat turn, in the order they happen
+STAGES = ("request", "embed", "search", "agent", "llm", "append_history", "persist_db")
+
+# request_id of the chat turn being handled by the current thread/task
+current_request_id: ContextVar[Optional[str]] = ContextVar("current_request_id", default=None)
+
+_recent: Deque[Dict[str, Any]] = deque(maxlen=int(os.getenv("TRACE_BUFFER_SIZE", "5000")))
+_write_lock = threading.Lock()
+
+
+def get_trace_path() -> str:
+    return os.getenv("TRACE_FILE") or os.path.join("datasets", "traces.jsonl")
+
+
+def tracing_enabled() -> bool:
+    return os.getenv("TRACE_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _otel_enabled() -> bool:
+    return otel_trace is not None and os.getenv("TRACE_OTEL", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def record_span(name: str, start_ts: float, duration: float, request_id: Optional[str] = None,
+                error: Optional[str] = None, **attributes: Any) -> Dict[str, Any]:
+    """Keep a finished span in memory and append it to the trace file (one JSON object per line)."""
+    span_record = {
+        "request_id": request_id if request_id is not None else current_request_id.get(),
+        "name": name,
+        "start_ts": start_ts,
+        "duration_ms": duration * 1000.0,
+    }
+    if error:
+        span_record["error"] = error
+    if attributes:
+        span_record["attributes"] = attributes
+    if not tracing_enabled():
+        return span_record
+    _recent.append(span_record)
+    try:
+        path = get_trace_path()
+        with _write_lock:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(span_record, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        # tracing must never break a chat turn
+        print(f"Could not write trace span: {e}")
+    return span_record
+
+
+@contextmanager
+def trace_request(request_id: str) -> Iterator[None]:
+    """Attribute every span opened inside the block (in this thread/task) to request_id."""
+    token = current_request_id.set(request_id)
+    try:
+        yield
+    finally:
+        current_request_id.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block as one stage of the current request. Yields a dict for attributes known only at the end."""
+    extra: Dict[str, Any] = {}
+    otel_span = None
+    if _otel_enabled():
+        request_id = current_request_id.get()
+        otel_span = otel_trace.get_tracer("personal_chatbot").start_as_current_span(
+            name, attributes={"request_id": request_id or "", **{k: str(v) for k, v in attributes.items()}})
+        otel_span.__enter__()
+    start_ts = time.time()
+    started = time.perf_counter()
+    error = None
+    try:
+        yield extra
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record_span(name, start_ts, time.perf_counter() - started, error=error, **attributes, **extra)
+        if otel_span is not None:
+            otel_span.__exit__(None, None, None)
+
+
+class LlmSpanCallback(BaseCallbackHandler):
+    """LangChain callback recording an "llm" span for each model call the agent makes."""
+
+    def __init__(self):
+        self._started: Dict[UUID, tuple] = {}
+
+    def _start(self, run_id: UUID, serialized: Optional[Dict[str, Any]]) -> None:
+        model = ((serialized or {}).get("kwargs") or {}).get("model") or (serialized or {}).get("name")
+        self._started[run_id] = (time.time(), time.perf_counter(), current_request_id.get(), model)
+
+    def _finish(self, run_id: UUID, error: Optional[str] = None) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        start_ts, perf_start, request_id, model = started
+        attributes = {"model": model} if model else {}
+        record_span("llm", start_ts, time.perf_counter() - perf_start, request_id=request_id, error=error,
+                    **attributes)
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, serialized)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID,
+                            **kwargs: Any) -> None:
+        self._start(run_id, serialized)
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._finish(run_id, error=f"{type(error).__name__}: {error}")
+
+
+# ---------- reading traces back ----------
+
+def _tail_lines(path: str, max_lines: int, block_size: int = 65536) -> List[str]:
+    """Last max_lines lines of a file, read backwards so a large trace file is not loaded whole."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= max_lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-max_lines:]
+
+
+def load_spans(limit: int = 20000, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """The most recent spans from the trace file (all processes); falls back to this process's buffer."""
+    path = path or get_trace_path()
+    if not os.path.exists(path):
+        return list(_recent)[-limit:]
+    spans = []
+    for line in _tail_lines(path, limit):
+        try:
+            spans.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return spans
+
+
+def stage_summary(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Latency summary (ms) per stage: count, mean, p50, p95, p99, max, plus the error count."""
+    durations: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for s in spans:
+        durations.setdefault(s["name"], []).append(s["duration_ms"])
+        if s.get("error"):
+            errors[s["name"]] = errors.get(s["name"], 0) + 1
+    order = {name: i for i, name in enumerate(STAGES)}
+    summary = {}
+    for name in sorted(durations, key=lambda n: (order.get(n, len(order)), n)):
+        summary[name] = {**summarize(durations[name]), "errors": errors.get(name, 0)}
+    return summary
+
+
+def slowest_requests(spans: List[Dict[str, Any]], limit: int = 10) -> List[Dict[str, Any]]:
+    """The slowest requests with their per-stage breakdown (ms summed per stage)."""
+    by_request: Dict[str, Dict[str, Any]] = {}
+    for s in spans:
+        if not s.get("request_id"):
+            continue
+        entry = by_request.setdefault(s["request_id"], {"request_id": s["request_id"], "start_ts": s["start_ts"]})
+        entry[s["name"]] = entry.get(s["name"], 0.0) + s["duration_ms"]
+        entry["start_ts"] = min(entry["start_ts"], s["start_ts"])
+    ranked = sorted(by_request.values(), key=lambda e: e.get("request", 0.0), reverse=True)
+    return ranked[:limit]
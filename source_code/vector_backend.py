@@ -0,0 +1,137 @@
+import json
+import os
+from typing import Any, Dict, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# VECTOR_BACKEND selects where chunks and their embeddings live:
+#   chroma    on-disk Chroma collection under DATABASE_LOCATION (one process at a time), or on the Chroma
+#             server at CHROMA_SERVER_URL (shared by every process)
+#   pgvector  personal_chat.rag_embeddings in the app's Postgres, shared by every app instance
+BACKENDS = ("chroma", "pgvector")
+
+# Full rebuilds write a new versioned collection and then swap the index pointer file (index_versions.py).
+# The pointer names the live collection; without one, COLLECTION_NAME under DATABASE_LOCATION is live.
+
+
+def get_vector_backend() -> str:
+    backend = (os.getenv("VECTOR_BACKEND") or "chroma").strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"VECTOR_BACKEND must be one of {BACKENDS}, got {backend!r}")
+    return backend
+
+
+def get_chroma_server_url() -> Optional[str]:
+    return os.getenv("CHROMA_SERVER_URL") or None
+
+
+def is_shared_store(version: Dict[str, Any]) -> bool:
+    """Whether several processes can safely read and write a version at the same time. An on-disk Chroma
+    store (PersistentClient) is single-process: writes from another process may be missed or corrupt it."""
+    if version["backend"] == "pgvector":
+        return True
+    return bool(get_chroma_server_url()) and not version.get("persist_directory")
+
+
+def get_index_pointer_path() -> str:
+    return os.getenv("INDEX_POINTER_FILE") or f"{os.getenv('DATABASE_LOCATION') or 'chroma_db'}.index.json"
+
+
+def read_index_pointer() -> Optional[Dict[str, Any]]:
+    path = get_index_pointer_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def index_pointer_stamp() -> Optional[tuple]:
+    """Changes whenever the pointer is swapped (it is replaced, never edited in place); None without a pointer."""
+    try:
+        stat = os.stat(get_index_pointer_path())
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def live_index(backend: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """The live version from the pointer (collection, persist_directory, sharded, ...) if it is for this backend."""
+    pointer = read_index_pointer()
+    live = pointer.get("live") if pointer else None
+    if live and live.get("backend") == (backend or get_vector_backend()):
+        return live
+    return None
+
+
+def get_vector_store(embeddings: Embeddings, collection_name: Optional[str] = None,
+                     backend: Optional[str] = None, persist_directory: Optional[str] = None,
+                     sharded: Optional[bool] = None) -> VectorStore:
+    """Vector store for the configured backend; both expose the LangChain VectorStore API.
+    persist_directory overrides DATABASE_LOCATION for Chroma (e.g. scratch indexes in benchmarks), and makes it
+    on-disk even when CHROMA_SERVER_URL is set.
+    Without collection_name, the live collection of the index pointer is opened (COLLECTION_NAME if there is none);
+    it is sharded when SHARD_MAP_FILE is set (see sharding.py). Pass sharded to override.
+    """
+    backend = backend or get_vector_backend()
+    if collection_name is None:
+        live = live_index(backend)
+        if live:
+            collection_name = live["collection"]
+            persist_directory = persist_directory or live.get("persist_directory")
+            if sharded is None:
+                sharded = live.get("sharded", False)
+        elif sharded is None:
+            sharded = bool(os.getenv("SHARD_MAP_FILE"))
+    collection_name = collection_name or os.getenv("COLLECTION_NAME")
+    if sharded:
+        try:
+            from sharding import ShardMap, ShardedVectorStore, get_shard_map_path
+        except ModuleNotFoundError:
+            from source_code.sharding import ShardMap, ShardedVectorStore, get_shard_map_path
+        return ShardedVectorStore(
+            ShardMap.load(get_shard_map_path()), collection_name, embeddings,
+            lambda name: get_vector_store(embeddings, name, backend, persist_directory, sharded=False),
+        )
+    if backend == "pgvector":
+        try:
+            from pgvector_store import PgVectorStore
+        except ModuleNotFoundError:
+            from source_code.pgvector_store import PgVectorStore
+        return PgVectorStore(collection_name=collection_name, embedding_function=embeddings)
+
+    from langchain_chroma import Chroma
+    server_url = get_chroma_server_url()
+    if server_url and not persist_directory:
+        import chromadb
+        from urllib.parse import urlparse
+        url = urlparse(server_url)
+        return Chroma(
+            collection_name=collection_name,
+            embedding_function=embeddings,
+            client=chromadb.HttpClient(host=url.hostname, port=url.port or 8000, ssl=url.scheme == "https"),
+        )
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=embeddings,
+        persist_directory=persist_directory or os.getenv("DATABASE_LOCATION"),
+    )
+
+
+class LiveVectorStore:
+    """
+    The live vector store for long-running readers: get() re-opens it after a rebuild swapped the index pointer,
+    so the next search goes to the new version while searches already running finish on the old one.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self._stamp = None
+        self._store: Optional[VectorStore] = None
+
+    def get(self) -> VectorStore:
+        stamp = index_pointer_stamp()
+        if self._store is None or stamp != self._stamp:
+            self._store = get_vector_store(self.embeddings)
+            self._stamp = stamp
+        return self._store
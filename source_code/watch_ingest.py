@@ -0,0 +1,354 @@
+"""
+Watch mode: keep the live vector store collection in sync with an input folder.
+
+File events are debounced (a burst of writes to one file, or a folder copy, becomes one update), then only the
+affected files are extracted, chunked and embedded. Each file's chunks get content-derived ids, so an update
+upserts the new chunks first and deletes the file's stale ones afterwards: chat readers see either the old or the
+new version of a file, never neither. A manifest remembers what is indexed (so a restart only catches up on what
+changed), and a status file reports how far the index lags behind the folder.
+
+The watcher writes while the chat app reads, so the store must be shared between processes: pgvector, or Chroma
+served by a Chroma server (CHROMA_SERVER_URL). An on-disk Chroma store only supports one process.
+
+Run from source_code/:
+    python watch_ingest.py --input-dir /path/to/documents
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain_ollama import OllamaEmbeddings
+
+from answer_cache import bump_corpus_version
+from chunking import chunk_id
+from embedding_gateway import get_gateway_url
+from index_versions import current_live, source_chunk_ids
+from local_docs_chunking_embedding_ingestion import text_splitter
+from read_pdf_from_local import TEXT_EXTENSIONS, iter_files, read_pdf, read_text_file
+from vector_backend import LiveVectorStore, is_shared_store
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # pragma: no cover - optional dependency handling
+    FileSystemEventHandler = object  # type: ignore
+    Observer = None  # type: ignore
+
+load_dotenv()
+
+
+def get_manifest_path() -> str:
+    return os.getenv("WATCH_MANIFEST_FILE") or f"{os.getenv('DATABASE_LOCATION') or 'chroma_db'}.manifest.json"
+
+
+def get_status_path() -> str:
+    return os.getenv("WATCH_STATUS_FILE") or f"{os.getenv('DATABASE_LOCATION') or 'chroma_db'}.watch_status.json"
+
+
+def _write_json_atomic(path: str, payload: Any) -> None:
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def read_watch_status(path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """The last status written by a running watcher, with lag recomputed for now; None if there is none."""
+    path = path or get_status_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            status = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if status.get("oldest_pending_since"):
+        status["lag_seconds"] = time.time() - status["oldest_pending_since"]
+    return status
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_supported(path: str) -> bool:
+    name = os.path.basename(path)
+    if name == os.getenv("DATASET_STORAGE_FILE_NAME") or name.startswith((".", "~$")):
+        return False
+    ext = os.path.splitext(name)[1].lower()
+    return ext == ".pdf" or ext in TEXT_EXTENSIONS
+
+
+class FolderIndexer:
+    """Indexes single files of a folder into the live collection and tracks them in the manifest."""
+
+    def __init__(self, input_dir: str, vector_store, use_basename_keys: bool = True,
+                 manifest_path: Optional[str] = None):
+        self.input_dir = os.path.abspath(input_dir)
+        self.vector_store = vector_store
+        self.use_basename_keys = use_basename_keys
+        self.manifest_path = manifest_path or get_manifest_path()
+        self.manifest: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+    def source_key(self, path: str) -> str:
+        """Same keys as read_pdf_from_local.build_corpus, which become the chunks' "source"."""
+        if self.use_basename_keys:
+            return os.path.basename(path)
+        return os.path.relpath(path, self.input_dir).replace(os.sep, "/")
+
+    def save_manifest(self) -> None:
+        _write_json_atomic(self.manifest_path, self.manifest)
+
+    def changed_files(self) -> List[str]:
+        """Files that differ from the manifest (by size/mtime) plus indexed files that disappeared."""
+        seen = set()
+        changed = []
+        for abs_path, _ext in iter_files(self.input_dir):
+            if not is_supported(abs_path):
+                continue
+            key = self.source_key(abs_path)
+            seen.add(key)
+            entry = self.manifest.get(key)
+            stat = os.stat(abs_path)
+            if not entry or entry.get("size") != stat.st_size or entry.get("mtime") != stat.st_mtime:
+                changed.append(abs_path)
+        for key, entry in self.manifest.items():
+            if key not in seen:
+                changed.append(entry["path"])
+        return changed
+
+    def remove_file(self, path: str) -> int:
+        key = self.source_key(path)
+        entry = self.manifest.pop(key, None)
+        if not entry:
+            return 0
+        if entry["chunk_ids"]:
+            self.vector_store.delete(ids=entry["chunk_ids"])
+        return len(entry["chunk_ids"])
+
+    def index_file(self, path: str) -> str:
+        """Bring one file's chunks up to date; returns what happened (added/updated/unchanged/removed/empty)."""
+        if not os.path.exists(path):
+            return "removed" if self.remove_file(path) else "unchanged"
+        key = self.source_key(path)
+        stat = os.stat(path)
+        sha256 = file_sha256(path)
+        entry = self.manifest.get(key)
+        if entry and entry["sha256"] == sha256:
+            entry.update(size=stat.st_size, mtime=stat.st_mtime)
+            return "unchanged"
+
+        content = read_pdf(path, keep_structure=True) if path.lower().endswith(".pdf") else read_text_file(path, keep_structure=True)
+        title = os.path.splitext(os.path.basename(key))[0]
+        docs = text_splitter.create_documents([content], metadatas=[{"source": key, "title": title}]) if content else []
+        ids = [chunk_id(key, i, doc.page_content) for i, doc in enumerate(docs)]
+        if entry:
+            previous = entry["chunk_ids"]
+        else:
+            # not in the manifest: a rebuild that was swapped in may already hold this file's chunks
+            previous = source_chunk_ids(self.vector_store, key)
+        if docs and set(previous) == set(ids):
+            # ids derive from the content, so the file's chunks are all there already: nothing to embed
+            self.manifest[key] = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256,
+                                  "chunk_ids": ids, "indexed_at": time.time()}
+            return "unchanged"
+        if docs:
+            # upsert first, then drop stale chunks, so readers never see the file missing
+            self.vector_store.add_documents(documents=docs, ids=ids)
+        stale = sorted(set(previous) - set(ids))
+        if stale:
+            self.vector_store.delete(ids=stale)
+        self.manifest[key] = {
+            "path": path,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": sha256,
+            "chunk_ids": ids,
+            "indexed_at": time.time(),
+        }
+        if not docs:
+            return "empty"
+        return "updated" if entry else "added"
+
+
+class DebouncedQueue:
+    """
+    Paths with their last event time; a path becomes due once no event arrived for `debounce` seconds.
+    A due path counts as pending (for the lag) until done() is called for it.
+    """
+
+    def __init__(self, debounce: float):
+        self.debounce = debounce
+        self._pending: Dict[str, float] = {}
+        self._first_seen: Dict[str, float] = {}
+        self._in_progress: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, path: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._pending[path] = now
+            self._first_seen.setdefault(path, now)
+
+    def pop_due(self) -> List[str]:
+        cutoff = time.time() - self.debounce
+        with self._lock:
+            due = [p for p, last in self._pending.items() if last <= cutoff]
+            for p in due:
+                del self._pending[p]
+                self._in_progress[p] = self._first_seen.pop(p)
+        return due
+
+    def done(self, paths: List[str]) -> None:
+        with self._lock:
+            for p in paths:
+                self._in_progress.pop(p, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waiting_since = list(self._first_seen.values()) + list(self._in_progress.values())
+            return {
+                "pending_files": len(self._pending) + len(self._in_progress),
+                "oldest_pending_since": min(waiting_since) if waiting_since else None,
+            }
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, queue: DebouncedQueue):
+        super().__init__()
+        self.queue = queue
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        for path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+            if path and is_supported(path):
+                self.queue.add(os.path.abspath(path))
+
+
+def _poll_changes(indexer: FolderIndexer, queue: DebouncedQueue, known: Dict[str, tuple]) -> None:
+    """Polling fallback when watchdog is not installed: diff (size, mtime) of the folder against the last scan."""
+    current = {}
+    for abs_path, _ext in iter_files(indexer.input_dir):
+        if is_supported(abs_path):
+            stat = os.stat(abs_path)
+            current[abs_path] = (stat.st_size, stat.st_mtime)
+    for path in set(current) | set(known):
+        if current.get(path) != known.get(path):
+            queue.add(path)
+    known.clear()
+    known.update(current)
+
+
+def watch(input_dir: str, debounce: float, batch_size: int, poll_interval: float, use_basename_keys: bool) -> None:
+    live = current_live()
+    if not is_shared_store(live):
+        raise SystemExit(
+            f"The live index '{live['collection']}' is an on-disk Chroma store, which only one process may use: "
+            f"the chat app would miss the watcher's writes, and concurrent writers can corrupt it. "
+            f"Use VECTOR_BACKEND=pgvector, or run a Chroma server, set CHROMA_SERVER_URL and rebuild the index."
+        )
+    embeddings = OllamaEmbeddings(model=os.getenv("EMBEDDING_MODEL"), base_url=get_gateway_url())
+    live_store = LiveVectorStore(embeddings)
+    indexer = FolderIndexer(input_dir, live_store.get(), use_basename_keys=use_basename_keys)
+    queue = DebouncedQueue(debounce)
+    status: Dict[str, Any] = {"input_dir": indexer.input_dir, "started_at": time.time(), "indexed_files": len(indexer.manifest),
+                              "last_indexed_at": None, "last_batch": None, "last_error": None}
+
+    # catch up on what changed while the watcher was not running
+    for path in indexer.changed_files():
+        queue.add(path)
+
+    observer = None
+    known: Dict[str, tuple] = {}
+    if Observer is not None:
+        observer = Observer()
+        observer.schedule(_EventHandler(queue), indexer.input_dir, recursive=True)
+        observer.start()
+        print(f"Watching {indexer.input_dir} (debounce {debounce}s)")
+    else:
+        _poll_changes(indexer, queue, known)
+        print(f"watchdog is not installed; polling {indexer.input_dir} every {poll_interval}s (debounce {debounce}s)")
+
+    def write_status() -> None:
+        snapshot = queue.snapshot()
+        lag = time.time() - snapshot["oldest_pending_since"] if snapshot["oldest_pending_since"] else 0.0
+        _write_json_atomic(get_status_path(), {**status, **snapshot, "lag_seconds": lag, "updated_at": time.time()})
+
+    try:
+        while True:
+            time.sleep(poll_interval)
+            if observer is None:
+                _poll_changes(indexer, queue, known)
+            if live_store.get() is not indexer.vector_store:
+                # a rebuild was swapped in: the manifest describes the old version, so reconcile the folder with the
+                # new one; files whose chunks it already holds are not embedded again
+                print(f"Live index changed; reconciling {indexer.input_dir} with it")
+                indexer.vector_store = live_store.get()
+                indexer.manifest = {}
+                for path in indexer.changed_files():
+                    queue.add(path)
+            due = queue.pop_due()
+            for start in range(0, len(due), batch_size):
+                batch = due[start:start + batch_size]
+                batch_started = time.time()
+                outcomes: Dict[str, int] = {}
+                for path in batch:
+                    try:
+                        outcome = indexer.index_file(path)
+                    except Exception as e:
+                        print(f"[WARN] Could not index '{path}': {e}")
+                        status["last_error"] = {"path": path, "error": str(e), "at": time.time()}
+                        outcome = "failed"
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                    if outcome not in ("unchanged", "failed"):
+                        print(f"{datetime.now():%H:%M:%S} {outcome}: {path}")
+                indexer.save_manifest()
+                queue.done(batch)
+                if any(o not in ("unchanged", "failed") for o in outcomes):
+                    # answers cached against the previous chunks are stale now
+                    bump_corpus_version()
+                status.update(indexed_files=len(indexer.manifest), last_indexed_at=time.time(),
+                              last_batch={"files": len(batch), "seconds": time.time() - batch_started, **outcomes})
+                write_status()
+            write_status()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a folder and incrementally index changed documents.")
+    parser.add_argument("--input-dir", default=os.getenv("WATCH_INPUT_DIR") or "datasets",
+                        help="Folder to watch (default: WATCH_INPUT_DIR or datasets)")
+    parser.add_argument("--debounce", type=float, default=float(os.getenv("WATCH_DEBOUNCE_SECONDS", "2")),
+                        help="Seconds without further events before a file is processed")
+    parser.add_argument("--batch-size", type=int, default=20, help="Files per batch between status updates")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between queue checks")
+    parser.add_argument("--relative-keys", action="store_true",
+                        help="Use paths relative to input-dir as sources (match read_pdf_from_local --relative-keys)")
+    args = parser.parse_args()
+    watch(args.input_dir, args.debounce, args.batch_size, args.poll_interval, not args.relative_keys)
+
+
+if __name__ == "__main__":
+    main()